@@ -3,6 +3,9 @@ ASGI config for PriceAlert project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+通知のSSEストリーム（notifications/stream/）は長時間接続を保持するため、
+本番ではこのASGIアプリケーションを uvicorn ワーカーで起動する。
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
@@ -0,0 +1,179 @@
+"""
+ベンチマーク用のユーティリティ
+
+- 使い捨てDBの作成・破棄
+- 処理時間・発行クエリ数・ピークメモリの計測
+- 外部に送信しないインプロセスSMTPシンク
+"""
+import logging
+import socketserver
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BenchmarkResult:
+    """計測結果"""
+    elapsed: float = 0.0
+    queries: int = 0
+    peak_memory: int = 0
+    extra: dict = field(default_factory=dict)
+
+    def per_second(self, count: int) -> float:
+        """1秒あたりの処理件数"""
+        return count / self.elapsed if self.elapsed > 0 else 0.0
+
+
+@contextmanager
+def throwaway_database(alias: str = 'default') -> Iterator[str]:
+    """
+    ベンチマーク用の一時DBを作成し、終了時に破棄する
+    本番DBにシードデータを書き込まないようにするため、テストランナーと同じ仕組みを使う
+    """
+    connection = connections[alias]
+    old_name = connection.settings_dict['NAME']
+    test_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield test_name
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def measure(alias: str = 'default') -> Iterator[BenchmarkResult]:
+    """ブロック内の処理時間・クエリ数・ピークメモリを計測する"""
+    result = BenchmarkResult()
+    # クエリログがコンソールに大量に出力されて計測を歪めないようにする
+    db_logger = logging.getLogger('django.db.backends')
+    previous_level = db_logger.level
+    db_logger.setLevel(logging.WARNING)
+
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connections[alias]) as queries:
+            start = time.perf_counter()
+            yield result
+            result.elapsed = time.perf_counter() - start
+        result.queries = len(queries.captured_queries)
+        _, result.peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        db_logger.setLevel(previous_level)
+
+
+class _SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """最低限のSMTPコマンドに応答し、受信したメッセージを破棄するハンドラ"""
+
+    def handle(self) -> None:
+        self._reply('220 localhost PriceAlert SMTP sink')
+        in_data = False
+        size = 0
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+
+            if in_data:
+                if line in (b'.\r\n', b'.\n'):
+                    self.server.sink._record(size)  # type: ignore[attr-defined]
+                    in_data = False
+                    size = 0
+                    self._reply('250 OK')
+                else:
+                    size += len(line)
+                continue
+
+            command = line.strip().split(b' ', 1)[0].upper()
+            if command in (b'EHLO', b'HELO'):
+                self._reply('250 localhost')
+            elif command in (b'MAIL', b'RCPT', b'RSET', b'NOOP'):
+                self._reply('250 OK')
+            elif command == b'DATA':
+                in_data = True
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+            elif command == b'QUIT':
+                self._reply('221 Bye')
+                break
+            else:
+                self._reply('502 Command not implemented')
+
+    def _reply(self, message: str) -> None:
+        self.wfile.write(f'{message}\r\n'.encode('ascii'))
+
+
+class _SMTPSinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """
+    インプロセスのSMTPシンク（aiosmtpd相当の簡易版）
+    受信したメッセージは件数とサイズだけ記録して破棄する
+
+    使用例:
+        with SMTPSink() as sink:
+            with override_settings(**sink.email_settings()):
+                send_mail(...)
+            print(sink.message_count)
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0) -> None:
+        self.host = host
+        self.port = port
+        self.message_count = 0
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+        self._server: Optional[_SMTPSinkServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'SMTPSink':
+        self._server = _SMTPSinkServer((self.host, self.port), _SMTPSinkHandler)
+        self._server.sink = self  # type: ignore[attr-defined]
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.debug('SMTPシンクを起動しました - %s:%d', self.host, self.port)
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def email_settings(self) -> dict:
+        """override_settingsに渡すメール設定"""
+        return {
+            'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+            'EMAIL_HOST': self.host,
+            'EMAIL_PORT': self.port,
+            'EMAIL_USE_TLS': False,
+            'EMAIL_USE_SSL': False,
+            'EMAIL_HOST_USER': '',
+            'EMAIL_HOST_PASSWORD': '',
+        }
+
+    def _record(self, size: int) -> None:
+        with self._lock:
+            self.message_count += 1
+            self.total_bytes += size
+
+    def __enter__(self) -> 'SMTPSink':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
@@ -0,0 +1,228 @@
+"""
+アプリケーション用のキャッシュレイヤー
+
+Djangoのキャッシュ（本番ではCeleryと共有するRedis）の上に、次の機能を提供する
+- 名前空間付きのキー
+- バージョンによる一括無効化（名前空間全体、またはスコープ単位）
+- キャッシュスタンピード対策（確率的早期再計算 + 再計算ロック）
+
+キャッシュは高速化のためだけに使うので、キャッシュサーバーに障害があっても
+例外は送出せず、常にデータソースから値を取得して返す
+"""
+import logging
+import math
+import random
+import time
+import uuid
+from typing import Any, Callable, Generic, Hashable, Iterable, Optional, Tuple, TypeVar
+
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# エントリの形式: (値, 再計算にかかった秒数, 論理的な有効期限のUNIX時刻)
+_Envelope = Tuple[Any, float, float]
+
+# ロックの値が自分のトークンと一致する場合だけ削除する
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def release_lock(cache: Any, lock_key: str, token: str) -> bool:
+    """
+    ロックが自分のもの（値が token）の場合だけ削除する（compare-and-delete）
+
+    有効期限切れ後に他のプロセスが取得したロックを消さないようにする。
+    Redisではスクリプトで取得と削除を不可分に行い、それ以外のバックエンド
+    （開発・テスト用のプロセス内メモリ）では順に行う
+
+    Returns:
+        bool: 削除した場合はTrue
+    """
+    if isinstance(cache, RedisCache):
+        key = cache.make_and_validate_key(lock_key)
+        client = cache._cache.get_client(key, write=True)
+        value = cache._cache._serializer.dumps(token)
+        return bool(client.eval(_RELEASE_LOCK_SCRIPT, 1, key, value))
+    if cache.get(lock_key) == token:
+        return bool(cache.delete(lock_key))
+    return False
+
+
+class CacheNamespace(Generic[T]):
+    """
+    名前空間付きキャッシュ
+
+    キーは「名前空間:名前空間バージョン:スコープ:スコープバージョン:キー」の形式で組み立てる。
+    invalidate() はバージョンを進めるだけなので、対象のキーを列挙する必要がない。
+
+    使用例:
+        product_cache = CacheNamespace('products', timeout=3600)
+        data = product_cache.get_or_set('detail', lambda: build(...), scope=product_id)
+        product_cache.invalidate(scope=product_id)
+    """
+
+    def __init__(self, name: str, timeout: int, beta: float = 1.0,
+                 lock_timeout: int = 10, alias: str = 'default') -> None:
+        """
+        Args:
+            name: 名前空間名
+            timeout: 有効期限（秒）
+            beta: 確率的早期再計算の係数（大きいほど早めに再計算する）
+            lock_timeout: 再計算ロックの有効期限（秒）
+            alias: 使用するキャッシュのエイリアス
+        """
+        self.name = name
+        self.timeout = timeout
+        self.beta = beta
+        self.lock_timeout = lock_timeout
+        self.alias = alias
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    def get_or_set(self, key: Hashable, producer: Callable[[], T],
+                   scope: Optional[Hashable] = None, timeout: Optional[int] = None) -> T:
+        """
+        キャッシュから値を取得し、なければ producer で作成して保存する
+
+        有効期限が近づくと、計算コストに応じた確率で期限切れ前に再計算する（XFetch）。
+        再計算はロックを取得した1プロセスだけが行い、他のプロセスは古い値を返す。
+        """
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            cache_key = self._build_key(key, scope)
+            envelope: Optional[_Envelope] = self._cache.get(cache_key)
+        except Exception as e:
+            logger.warning(f"キャッシュの取得に失敗しました - namespace: {self.name}, エラー: {str(e)}")
+            return producer()
+
+        if envelope is not None and not self._should_recompute(envelope):
+            return envelope[0]
+
+        lock_key = f'{cache_key}:lock'
+        token = uuid.uuid4().hex
+        acquired = self._acquire_lock(lock_key, token)
+        if acquired is False:
+            if envelope is not None:
+                # 他のプロセスが再計算中なので、古い値を返す
+                return envelope[0]
+            envelope = self._wait_for_value(cache_key)
+            if envelope is not None:
+                return envelope[0]
+
+        try:
+            start = time.monotonic()
+            value = producer()
+            delta = time.monotonic() - start
+            envelope = (value, delta, time.time() + timeout)
+            self._safe_call(self._cache.set, cache_key, envelope, timeout)
+            return value
+        finally:
+            if acquired:
+                self._safe_call(release_lock, self._cache, lock_key, token)
+
+    def get(self, key: Hashable, scope: Optional[Hashable] = None) -> Optional[T]:
+        """キャッシュから値を取得する（なければNone）"""
+        try:
+            envelope: Optional[_Envelope] = self._cache.get(self._build_key(key, scope))
+        except Exception as e:
+            logger.warning(f"キャッシュの取得に失敗しました - namespace: {self.name}, エラー: {str(e)}")
+            return None
+        return envelope[0] if envelope is not None else None
+
+    def set(self, key: Hashable, value: T, scope: Optional[Hashable] = None,
+            timeout: Optional[int] = None) -> None:
+        """キャッシュに値を保存する"""
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            cache_key = self._build_key(key, scope)
+        except Exception as e:
+            logger.warning(f"キャッシュの保存に失敗しました - namespace: {self.name}, エラー: {str(e)}")
+            return
+        self._safe_call(self._cache.set, cache_key, (value, 0.0, time.time() + timeout), timeout)
+
+    def invalidate(self, scope: Optional[Hashable] = None) -> None:
+        """スコープ（省略時は名前空間全体）のキャッシュを無効化する"""
+        self._safe_call(self._bump_version, self._version_key(scope))
+
+    def invalidate_many(self, scopes: Iterable[Hashable]) -> None:
+        """複数のスコープのキャッシュを無効化する"""
+        for scope in scopes:
+            self.invalidate(scope)
+
+    def _build_key(self, key: Hashable, scope: Optional[Hashable]) -> str:
+        namespace_version_key = self._version_key(None)
+        scope_version_key = self._version_key(scope)
+        versions = self._cache.get_many([namespace_version_key, scope_version_key])
+
+        namespace_version = (versions.get(namespace_version_key)
+                             or self._init_version(namespace_version_key))
+        scope_version = versions.get(scope_version_key) or self._init_version(scope_version_key)
+        return f'{self.name}:{namespace_version}:{scope}:{scope_version}:{self._format_key(key)}'
+
+    def _version_key(self, scope: Optional[Hashable]) -> str:
+        if scope is None:
+            return f'{self.name}:version'
+        return f'{self.name}:version:{scope}'
+
+    def _init_version(self, version_key: str) -> int:
+        """
+        バージョンを初期化する
+        バージョンキーが追い出された場合に古いエントリが復活しないよう、時刻を初期値にする
+        """
+        self._cache.add(version_key, time.time_ns(), timeout=None)
+        return self._cache.get(version_key) or time.time_ns()
+
+    def _bump_version(self, version_key: str) -> None:
+        try:
+            self._cache.incr(version_key)
+        except ValueError:
+            # バージョンキーが存在しない
+            self._cache.set(version_key, time.time_ns(), timeout=None)
+
+    def _should_recompute(self, envelope: _Envelope) -> bool:
+        _, delta, expires_at = envelope
+        # random()は0を返し得るので、log(0)を避ける
+        return time.time() - delta * self.beta * math.log(random.random() or 1e-12) >= expires_at
+
+    def _acquire_lock(self, lock_key: str, token: str) -> Optional[bool]:
+        """ロックを取得する（キャッシュ操作に失敗した場合はNoneを返し、ロックなしで再計算する）"""
+        try:
+            return bool(self._cache.add(lock_key, token, timeout=self.lock_timeout))
+        except Exception as e:
+            logger.warning(
+                f"キャッシュロックの取得に失敗しました - namespace: {self.name}, エラー: {str(e)}"
+            )
+            return None
+
+    def _wait_for_value(self, cache_key: str) -> Optional[_Envelope]:
+        """他のプロセスが再計算を終えるまで待つ（ロックの有効期限まで）"""
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            envelope = self._safe_call(self._cache.get, cache_key)
+            if envelope is not None:
+                return envelope
+        return None
+
+    def _safe_call(self, func: Callable[..., Any], *args: Any) -> Any:
+        try:
+            return func(*args)
+        except Exception as e:
+            logger.warning(f"キャッシュ操作に失敗しました - namespace: {self.name}, エラー: {str(e)}")
+            return None
+
+    @staticmethod
+    def _format_key(key: Hashable) -> str:
+        if isinstance(key, tuple):
+            return ':'.join(str(part) for part in key)
+        return str(key)
@@ -2,6 +2,7 @@
 import os
 import ssl
 from celery import Celery
+from celery.signals import worker_process_init
 from celery.schedules import crontab
 
 # Django設定を Celeryに読み込ませる
@@ -21,6 +22,16 @@ app.conf.task_reject_on_worker_lost = True  # ワーカーが予期せず失敗
 app.conf.task_default_retry_delay = 30  # リトライ間隔（秒）
 app.conf.task_max_retries = 3  # 最大リトライ回数
 
+# ワーカープロセスの起動時にECサイトを読み込んでおく
+@worker_process_init.connect
+def warm_ec_sites(**kwargs):
+    from products.ec_sites import ec_site_registry
+    try:
+        ec_site_registry.load()
+    except Exception:
+        # DBに接続できなくても、最初の使用時に読み込むので起動は続ける
+        pass
+
 # ログ出力を見やすくするオプション（任意）
 @app.task(bind=True)
 def debug_task(self):
@@ -13,8 +13,11 @@ class Command(BaseCommand):
         PeriodicTask.objects.filter(
             name__in=[
                 'fetch_and_store_prices',
+                'refresh_due_prices',
                 'check_price_alerts',
-                'send_price_alert_notifications'
+                'send_price_alert_notifications',
+                'deliver_overdue_immediate_notifications',
+                'recalculate_unread_counters',
             ]
         ).delete()
         
@@ -30,15 +33,6 @@ class Command(BaseCommand):
             period=IntervalSchedule.MINUTES
         )
         
-        # 固定時間のスケジュール（9時、13時、17時、21時）を作成
-        crontab_9_13_17_21, _ = CrontabSchedule.objects.get_or_create(
-            minute='0',
-            hour='9,13,17,21',
-            day_of_week='*',
-            day_of_month='*',
-            month_of_year='*',
-        )
-        
         # リトライポリシーの定義
         retry_policy = {
             'max_retries': 3,
@@ -47,12 +41,17 @@ class Command(BaseCommand):
             'interval_max': 300,
         }
         
-        # 1. 価格取得タスク（4時間ごと、または9時、13時、17時、21時）
-        # ここでは9時、13時、17時、21時を使用します
+        # 1. 価格取得タスク（15分ごとに、更新時刻を過ぎた商品だけを更新する）
+        # 商品ごとの更新間隔は価格の変動頻度・登録ユーザー数・閾値との差から決まる
+        # すべての商品を一度に更新する場合は products.tasks.fetch_and_store_prices を手動で実行する
+        interval_15min, _ = IntervalSchedule.objects.get_or_create(
+            every=15,
+            period=IntervalSchedule.MINUTES
+        )
         fetch_task = PeriodicTask.objects.create(
-            name='fetch_and_store_prices',
-            task='products.tasks.fetch_and_store_prices',
-            crontab=crontab_9_13_17_21,  # 4時間ごとの固定時間
+            name='refresh_due_prices',
+            task='products.tasks.refresh_due_prices',
+            interval=interval_15min,
             enabled=True,
             one_off=False,
             start_time=timezone.now(),
@@ -61,14 +60,15 @@ class Command(BaseCommand):
             # タスクオプション
             priority=10,
             headers=json.dumps({
-                'expires': 3600,  # 1時間後に期限切れ
+                'expires': 15 * 60,  # 次の実行までに期限切れ
                 'retry': True,
                 'retry_policy': retry_policy
             }),
-            description='商品の価格情報を取得して保存する（4時間ごと）',
+            description='更新時刻を過ぎた商品の価格情報を取得して保存する（15分ごと）',
         )
         
-        # 2. 価格アラートチェックタスク（fetch_and_store_pricesの10分後）
+        # 2. 価格アラートチェックタスク（9時、13時、17時、21時の10分）
+        # 価格変動があった商品は価格取得時にもチェックされる
         check_task = PeriodicTask.objects.create(
             name='check_price_alerts',
             task='notifications.tasks.check_price_alerts',
@@ -90,10 +90,11 @@ class Command(BaseCommand):
                 'retry': True,
                 'retry_policy': retry_policy
             }),
-            description='価格アラート条件をチェックして通知を作成する（fetch_and_store_pricesの後）',
+            description='価格アラート条件をチェックして通知を作成する（9時、13時、17時、21時）',
         )
         
         # 3. 通知送信タスク（check_price_alertsの10分後）
+        # 即時通知は価格変動時にdeliver_immediate_notificationsで配信されるため、daily / weekly のみ対象
         notify_task = PeriodicTask.objects.create(
             name='send_price_alert_notifications',
             task='notifications.tasks.send_price_alert_notifications',
@@ -115,10 +116,57 @@ class Command(BaseCommand):
                 'retry': True,
                 'retry_policy': retry_policy
             }),
-            description='価格アラート通知をメールで送信する（check_price_alertsの後）',
+            description='価格アラート通知（daily / weekly）をメールで送信する（check_price_alertsの後）',
+        )
+        
+        # 4. 未配信の即時通知の送信タスク（10分ごと）
+        # 即時通知の配信タスクの登録失敗・ワーカー停止で送信されなかった通知を拾う
+        overdue_task = PeriodicTask.objects.create(
+            name='deliver_overdue_immediate_notifications',
+            task='notifications.tasks.deliver_overdue_immediate_notifications',
+            interval=interval_10min,
+            enabled=True,
+            one_off=False,
+            start_time=timezone.now(),
+            expires=None,
+            kwargs=json.dumps({}),
+            priority=3,
+            headers=json.dumps({
+                'expires': 10 * 60,
+                'retry': True,
+                'retry_policy': retry_policy
+            }),
+            description='配信タスクが失われた即時通知をメールで送信する（10分ごと）',
+        )
+        
+        # 5. 未読件数カウンターの再集計タスク（毎日4時）
+        counter_task = PeriodicTask.objects.create(
+            name='recalculate_unread_counters',
+            task='notifications.tasks.recalculate_unread_counters',
+            crontab=CrontabSchedule.objects.get_or_create(
+                minute='0',
+                hour='4',
+                day_of_week='*',
+                day_of_month='*',
+                month_of_year='*',
+            )[0],
+            enabled=True,
+            one_off=False,
+            start_time=timezone.now(),
+            expires=None,
+            kwargs=json.dumps({}),
+            priority=1,
+            headers=json.dumps({
+                'expires': 3600,
+                'retry': True,
+                'retry_policy': retry_policy
+            }),
+            description='未読件数カウンターを通知テーブルから集計し直す（毎日4時）',
         )
         
         self.stdout.write(self.style.SUCCESS(f"タスク1: {fetch_task.name} - 作成完了"))
         self.stdout.write(self.style.SUCCESS(f"タスク2: {check_task.name} - 作成完了"))
         self.stdout.write(self.style.SUCCESS(f"タスク3: {notify_task.name} - 作成完了"))
+        self.stdout.write(self.style.SUCCESS(f"タスク4: {overdue_task.name} - 作成完了"))
+        self.stdout.write(self.style.SUCCESS(f"タスク5: {counter_task.name} - 作成完了"))
         self.stdout.write(self.style.SUCCESS("定期タスク設定が完了しました。")) 
\ No newline at end of file
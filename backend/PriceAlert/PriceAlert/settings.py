@@ -209,12 +209,22 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
+    # 一覧・価格履歴のレスポンスが大きいので、orjsonでエンコード・デコードする
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer',  # デバッグ用に便利
-    ]
+        'PriceAlert.renderers.ORJSONRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'PriceAlert.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+if DEBUG:
+    REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].append(
+        'rest_framework.renderers.BrowsableAPIRenderer'  # デバッグ用に便利
+    )
+
 # JWT設定
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
@@ -290,6 +300,99 @@ CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# キャッシュ設定
+# 本番ではCeleryと同じRedisを共有し、gunicornの各ワーカー間でキャッシュを共有する
+# 開発・テストではRedisがなくても動くようにプロセス内メモリを使う（USE_REDIS_CACHE=Trueで切り替え可能）
+USE_REDIS_CACHE = os.getenv('USE_REDIS_CACHE', str(IS_PRODUCTION)).lower() == 'true'
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', CELERY_BROKER_URL)
+if USE_REDIS_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'KEY_PREFIX': 'pricealert',
+            'TIMEOUT': 300,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'pricealert',
+            'TIMEOUT': 300,
+        }
+    }
+
+# 商品（出品情報・価格履歴を含む）のキャッシュ有効期限（秒）
+# 価格更新・出品情報の変更時に無効化するので、更新間隔より長めに設定する
+PRODUCT_CACHE_TIMEOUT = int(os.getenv('PRODUCT_CACHE_TIMEOUT', 6 * 60 * 60))
+
+# ECサイトのレジストリが、他のプロセスでの変更を確認する間隔（秒）
+EC_SITE_REGISTRY_CHECK_INTERVAL = int(os.getenv('EC_SITE_REGISTRY_CHECK_INTERVAL', 60))
+
+# ECサイトのJANコード検索結果のキャッシュ有効期限（秒）
+# 商品登録と価格更新で共有する。見つからなかった結果は短めに保持する
+JAN_SEARCH_CACHE_TIMEOUT = int(os.getenv('JAN_SEARCH_CACHE_TIMEOUT', 10 * 60))
+JAN_SEARCH_NEGATIVE_CACHE_TIMEOUT = int(os.getenv('JAN_SEARCH_NEGATIVE_CACHE_TIMEOUT', 2 * 60))
+
+# 商品ID → JANコードの対応表（ECItemJANCode）
+# 出品情報から対応表を作るECサイト。JANコードで絞り込んで検索するサイトだけにする
+# （楽天はキーワード検索なので、JANコードが違う商品が出品情報に含まれることがある）
+ITEM_JAN_VERIFIED_LISTING_SITES = ['amazon', 'yahoo']
+# 対応表の有効期間（日）。これより古い対応は使わず、purge_item_jan_codes で削除する
+ITEM_JAN_CODE_MAX_AGE_DAYS = int(os.getenv('ITEM_JAN_CODE_MAX_AGE_DAYS', 90))
+
+# ECサイトごとのJANコード検索結果の取得方針（products.connectors.base.FetchPolicy の引数）
+# 価格の安い順に取得し、条件に合う出品が enough_offers 件見つかったら以降のページは取得しない
+CONNECTOR_FETCH_POLICIES = {
+    'rakuten': {
+        'page_size': 10,
+        'max_pages': int(os.getenv('RAKUTEN_FETCH_MAX_PAGES', 3)),
+        'enough_offers': 3,
+        'in_stock_only': True,
+        'new_only': True,
+        # キーワード検索なので、商品名・キャッチコピー・説明にJANコードを含む商品だけを保存する
+        'jan_match_only': True,
+    },
+    'yahoo': {
+        'page_size': 10,
+        'max_pages': int(os.getenv('YAHOO_FETCH_MAX_PAGES', 3)),
+        'enough_offers': 3,
+        'in_stock_only': True,
+        'new_only': True,
+        'jan_match_only': True,
+    },
+}
+
+# 価格更新スケジュール（products.services.refresh_schedule_service）
+# 通知を有効にしている登録ユーザーが1人で、価格が変動せず閾値からも遠い商品の更新間隔（分）
+PRICE_REFRESH_BASE_INTERVAL_MINUTES = int(os.getenv('PRICE_REFRESH_BASE_INTERVAL_MINUTES', 24 * 60))
+# 更新間隔の下限・上限（分）。通知を有効にしている登録ユーザーがいない商品は上限の間隔で更新する
+PRICE_REFRESH_MIN_INTERVAL_MINUTES = int(os.getenv('PRICE_REFRESH_MIN_INTERVAL_MINUTES', 60))
+PRICE_REFRESH_MAX_INTERVAL_MINUTES = int(os.getenv('PRICE_REFRESH_MAX_INTERVAL_MINUTES', 7 * 24 * 60))
+# 1回の定期タスク（refresh_due_prices）で更新する最大商品数
+PRICE_REFRESH_BATCH_SIZE = int(os.getenv('PRICE_REFRESH_BATCH_SIZE', 200))
+# 定期タスクが取り出した商品を、他の実行・リトライが取り出さない期間（分）
+# 取り出すときに次回の更新時刻をこの期間だけ先に進め、価格更新後に計算し直す
+PRICE_REFRESH_LEASE_MINUTES = int(os.getenv('PRICE_REFRESH_LEASE_MINUTES', 60))
+
+# 一括登録で受け付けるJANコード・URLの最大件数
+BULK_REGISTRATION_MAX_ITEMS = int(os.getenv('BULK_REGISTRATION_MAX_ITEMS', 500))
+# 商品登録（POST user-products/）をCeleryで実行し、202とジョブIDを返すかどうか
+# 無効の場合も、リクエストで async=true を指定すれば非同期で登録する
+ASYNC_PRODUCT_REGISTRATION = os.getenv('ASYNC_PRODUCT_REGISTRATION', 'False').lower() in ('true', '1', 'yes')
+# 商品登録時の外部API呼び出しの、ECサイトごとの同時実行数
+REGISTRATION_MAX_WORKERS_PER_SITE = int(os.getenv('REGISTRATION_MAX_WORKERS_PER_SITE', 4))
+
+# 即時通知の合流期間（秒）。この間に作成された通知は1通のメールにまとめて送信する
+IMMEDIATE_NOTIFICATION_COALESCE_SECONDS = int(os.getenv('IMMEDIATE_NOTIFICATION_COALESCE_SECONDS', 30))
+
+# 通知のリアルタイム配信（SSE）設定
+NOTIFICATION_STREAM_REDIS_URL = os.getenv('NOTIFICATION_STREAM_REDIS_URL', CELERY_BROKER_URL)
+NOTIFICATION_STREAM_KEEPALIVE_SECONDS = int(os.getenv('NOTIFICATION_STREAM_KEEPALIVE_SECONDS', 15))
+# SSE接続用チケット（notifications/stream-ticket/）の有効期限（秒）
+NOTIFICATION_STREAM_TICKET_SECONDS = int(os.getenv('NOTIFICATION_STREAM_TICKET_SECONDS', 30))
+
 # メール設定（開発環境ではコンソール出力）
 # EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'noreply@pricealert.example.com'
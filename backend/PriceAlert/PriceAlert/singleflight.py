@@ -0,0 +1,146 @@
+"""
+同じキーの処理の同時実行を1回にまとめる（single-flight）
+
+外部APIの呼び出しなど、同じ引数の処理が同時に複数要求されたときに、
+1回だけ実行して結果を共有する
+- プロセス内: 最初の呼び出しだけが実行し、他のスレッドはその結果（例外を含む）を待つ
+- プロセス間: キャッシュ（本番ではRedis）のロックを取得したプロセスだけが実行し、
+  結果を短時間キャッシュに置く。他のプロセスは結果が置かれるまで待つ
+
+キャッシュサーバーに障害がある場合や、待っても結果が得られない場合は自分で実行する
+"""
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+from django.core.cache import caches
+
+from .cache import release_lock
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+_MISSING = object()
+
+
+class _Call:
+    """プロセス内で実行中の呼び出し"""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight(Generic[T]):
+    """
+    single-flight
+
+    使用例:
+        flight = SingleFlight('connector')
+        items = flight.do(('rakuten', 'jan', jan_code),
+                          lambda: connector.search_by_jan_code(jan_code))
+    """
+
+    def __init__(self, name: str, lock_timeout: int = 30, result_timeout: int = 10,
+                 poll_interval: float = 0.05, alias: str = 'default') -> None:
+        """
+        Args:
+            name: 名前（キャッシュキーの接頭辞）
+            lock_timeout: プロセス間ロックの有効期限（秒）。実行にかかる最大時間より長くする
+            result_timeout: 結果をキャッシュに置いておく時間（秒）
+            poll_interval: 他のプロセスの結果を待つときの確認間隔（秒）
+            alias: 使用するキャッシュのエイリアス
+        """
+        self.name = name
+        self.lock_timeout = lock_timeout
+        self.result_timeout = result_timeout
+        self.poll_interval = poll_interval
+        self.alias = alias
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    def do(self, key: Hashable, func: Callable[[], T]) -> T:
+        """key の処理が実行中であればその結果を待ち、なければ func を実行して結果を返す"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            logger.debug(f"実行中の処理の結果を共有しました - name: {self.name}, key: {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, func)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _do_shared(self, key: Hashable, func: Callable[[], T]) -> T:
+        """プロセス間で実行を1回にまとめる"""
+        lock_key, result_key = self._build_keys(key)
+        token = uuid.uuid4().hex
+        acquired = self._safe_call(self._cache.add, lock_key, token, self.lock_timeout)
+        if acquired is False:
+            result = self._wait_for_result(lock_key, result_key)
+            if result is not _MISSING:
+                logger.debug(f"他のプロセスの処理結果を共有しました - name: {self.name}, key: {key}")
+                return result
+
+        try:
+            result = func()
+            self._safe_call(self._cache.set, result_key, (result,), self.result_timeout)
+            return result
+        finally:
+            if acquired:
+                # 有効期限切れ後に他のプロセスが取得したロックは消さない
+                self._safe_call(release_lock, self._cache, lock_key, token)
+
+    def _wait_for_result(self, lock_key: str, result_key: str) -> Any:
+        """他のプロセスの結果を待つ（ロックが外れても結果がなければ _MISSING）"""
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            try:
+                values = self._cache.get_many([result_key, lock_key])
+            except Exception as e:
+                logger.warning(f"single-flightの結果の取得に失敗しました - name: {self.name}, エラー: {str(e)}")
+                return _MISSING
+            if result_key in values:
+                return values[result_key][0]
+            if lock_key not in values:
+                # 実行したプロセスが失敗した
+                return _MISSING
+        return _MISSING
+
+    def _build_keys(self, key: Hashable) -> Tuple[str, str]:
+        # URLなどを含むキーもあるので、ハッシュにしてキャッシュキーの長さ・文字種を制限する
+        formatted = ':'.join(str(part) for part in key) if isinstance(key, tuple) else str(key)
+        digest = hashlib.sha1(formatted.encode('utf-8')).hexdigest()
+        prefix = f'singleflight:{self.name}:{digest}'
+        return f'{prefix}:lock', f'{prefix}:result'
+
+    def _safe_call(self, func: Callable[..., Any], *args: Any) -> Any:
+        try:
+            return func(*args)
+        except Exception as e:
+            logger.warning(f"single-flightのキャッシュ操作に失敗しました - name: {self.name}, エラー: {str(e)}")
+            return None
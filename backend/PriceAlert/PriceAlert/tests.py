@@ -0,0 +1,146 @@
+import io
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from rest_framework.exceptions import ParseError
+
+from .cache import CacheNamespace
+from .parsers import ORJSONParser
+from .renderers import ORJSONRenderer
+from .singleflight import SingleFlight
+
+
+class CacheNamespaceTest(SimpleTestCase):
+    """キャッシュレイヤーのテスト"""
+
+    def setUp(self):
+        cache.clear()
+        self.namespace = CacheNamespace('test', timeout=60)
+        self.calls = 0
+
+    def _producer(self):
+        self.calls += 1
+        return {'calls': self.calls}
+
+    def test_get_or_set_caches_value(self):
+        """2回目以降はキャッシュから値を返すかテスト"""
+        first = self.namespace.get_or_set('detail', self._producer, scope=1)
+        second = self.namespace.get_or_set('detail', self._producer, scope=1)
+        self.assertEqual(first, second)
+        self.assertEqual(self.calls, 1)
+
+    def test_invalidate_scope(self):
+        """スコープ単位で無効化でき、他のスコープには影響しないかテスト"""
+        self.namespace.get_or_set('detail', self._producer, scope=1)
+        self.namespace.get_or_set('detail', self._producer, scope=2)
+
+        self.namespace.invalidate(scope=1)
+        self.assertEqual(self.namespace.get_or_set('detail', self._producer, scope=1), {'calls': 3})
+        self.assertEqual(self.namespace.get_or_set('detail', self._producer, scope=2), {'calls': 2})
+
+        self.namespace.invalidate()
+        self.assertEqual(self.namespace.get_or_set('detail', self._producer, scope=2), {'calls': 4})
+
+    def test_stale_value_is_served_while_locked(self):
+        """他のプロセスが再計算中は古い値を返すかテスト"""
+        self.namespace.get_or_set('detail', self._producer, scope=1, timeout=0)
+        cache_key = self.namespace._build_key('detail', 1)
+        # 有効期限切れの値を置いた上で、再計算ロックを取得済みにする
+        cache.set(cache_key, ({'calls': 'stale'}, 0.0, 0.0), 60)
+        cache.add(f'{cache_key}:lock', True, 60)
+
+        self.assertEqual(self.namespace.get_or_set('detail', self._producer, scope=1), {'calls': 'stale'})
+        self.assertEqual(self.calls, 1)
+        # 取得できなかったロックは解放しない
+        self.assertTrue(cache.get(f'{cache_key}:lock'))
+
+    def test_lock_taken_over_after_expiry_is_kept(self):
+        """再計算中にロックが期限切れになり他のプロセスが取得した場合、そのロックを消さないかテスト"""
+        cache_key = self.namespace._build_key('detail', 1)
+        lock_key = f'{cache_key}:lock'
+
+        def slow_producer():
+            # 自分のロックが期限切れになり、他のプロセスが取得した
+            cache.set(lock_key, 'other-worker', 60)
+            return self._producer()
+
+        self.namespace.get_or_set('detail', slow_producer, scope=1)
+        self.assertEqual(cache.get(lock_key), 'other-worker')
+
+        cache.delete(lock_key)
+        self.namespace.invalidate(scope=1)
+        self.namespace.get_or_set('detail', self._producer, scope=1)
+        self.assertIsNone(cache.get(self.namespace._build_key('detail', 1) + ':lock'))
+
+
+class SingleFlightTest(SimpleTestCase):
+    """single-flightのテスト"""
+
+    def setUp(self):
+        cache.clear()
+        self.flight = SingleFlight('test', lock_timeout=2, poll_interval=0.01)
+        self.calls = 0
+
+    def _slow(self):
+        self.calls += 1
+        time.sleep(0.2)
+        return {'calls': self.calls}
+
+    def test_concurrent_calls_share_result(self):
+        """同時に同じキーを要求したスレッドは、1回の実行結果を共有するかテスト"""
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.flight.do(('rakuten', 'jan', '1'), self._slow)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [{'calls': 1}] * 5)
+
+    def test_waits_for_other_process(self):
+        """他のプロセスがロックを持っている間は、その結果を待って使うかテスト"""
+        lock_key, result_key = self.flight._build_keys('key')
+        cache.add(lock_key, 'other', 60)
+        threading.Timer(0.05, lambda: cache.set(result_key, ({'calls': 'other'},), 60)).start()
+
+        self.assertEqual(self.flight.do('key', self._slow), {'calls': 'other'})
+        self.assertEqual(self.calls, 0)
+
+        # ロックが外れても結果がなければ自分で実行する
+        cache.clear()
+        cache.add(lock_key, 'other', 60)
+        threading.Timer(0.05, lambda: cache.delete(lock_key)).start()
+        self.assertEqual(self.flight.do('key', self._slow), {'calls': 1})
+
+
+class ORJSONRendererTest(SimpleTestCase):
+    """orjsonレンダラー・パーサーのテスト"""
+
+    def test_render(self):
+        """日時・Decimal・日本語を正しくエンコードするかテスト"""
+        data = {
+            'name': 'テスト商品\u2028',
+            'captured_at': datetime(2024, 5, 1, 12, 0, 0, 123456, tzinfo=dt_timezone.utc),
+            'price': Decimal('1980.5'),
+        }
+        rendered = ORJSONRenderer().render(data)
+        self.assertEqual(
+            rendered.decode(),
+            '{"name":"テスト商品\\u2028","captured_at":"2024-05-01T12:00:00.123456Z","price":1980.5}'
+        )
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+    def test_parse(self):
+        """JSONをデコードし、不正なJSONはParseErrorにするかテスト"""
+        parser = ORJSONParser()
+        data = parser.parse(io.BytesIO('{"jan_code": "4901234567894", "memo": "メモ"}'.encode()))
+        self.assertEqual(data, {'jan_code': '4901234567894', 'memo': 'メモ'})
+        with self.assertRaises(ParseError):
+            parser.parse(io.BytesIO(b'{"jan_code": '))
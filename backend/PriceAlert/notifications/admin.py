@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Alert, Notification
+from .models import Alert, Notification, UnreadNotificationCounter
 
 @admin.register(Alert)
 class AlertAdmin(admin.ModelAdmin):
@@ -17,3 +17,10 @@ class NotificationAdmin(admin.ModelAdmin):
     date_hierarchy = 'sent_at'
     readonly_fields = ('user', 'product', 'product_on_ec_site', 'alert', 'notification_type', 
                        'message', 'old_price', 'new_price', 'sent_at', 'created_at')
+
+
+@admin.register(UnreadNotificationCounter)
+class UnreadNotificationCounterAdmin(admin.ModelAdmin):
+    list_display = ('user', 'unread_count', 'updated_at')
+    search_fields = ('user__email',)
+    readonly_fields = ('user', 'unread_count', 'updated_at')
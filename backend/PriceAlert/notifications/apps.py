@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete
 
 
 class NotificationsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "notifications"
+
+    def ready(self):
+        from .models import Notification
+        from .services import discard_deleted_notification
+
+        # 未読の通知が削除されたら、未読件数カウンターを減らす
+        post_delete.connect(discard_deleted_notification, sender=Notification,
+                            dispatch_uid='notifications.discard_deleted_notification')
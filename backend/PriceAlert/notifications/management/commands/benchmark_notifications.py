@@ -0,0 +1,137 @@
+from typing import Dict, List
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from accounts.models import User
+from products.models import Product, ECSite, ProductOnECSite
+from users.models import Settings
+from notifications.models import Notification, EmailFrequency
+from notifications.services import EmailNotificationService
+from PriceAlert.benchmarking import SMTPSink, measure, throwaway_database
+
+
+def seed_pending_notifications(user_count: int, notifications_per_user: int) -> Dict[str, int]:
+    """
+    ベンチマーク用のユーザーと未送信通知を作成する
+    ユーザーは immediately / daily / weekly の各頻度に均等に割り振る
+
+    Returns:
+        Dict[str, int]: 頻度ごとのユーザー数
+    """
+    frequencies = list(EmailFrequency.objects.order_by('interval'))
+    if not frequencies:
+        raise CommandError('EmailFrequencyが登録されていません。マイグレーションを実行してください')
+
+    # create_userはパスワードハッシュ化が重いので一括作成する
+    users = [
+        User(email=f'bench{i}@example.com', username=f'bench{i}', password='!')
+        for i in range(user_count)
+    ]
+    users = User.objects.bulk_create(users)
+
+    bucket_counts = {frequency.email_frequency: 0 for frequency in frequencies}
+    user_settings = []
+    for i, user in enumerate(users):
+        frequency = frequencies[i % len(frequencies)]
+        bucket_counts[frequency.email_frequency] += 1
+        user_settings.append(Settings(user=user, email_frequency=frequency, email_notifications=True))
+    Settings.objects.bulk_create(user_settings)
+
+    ec_site, _ = ECSite.objects.get_or_create(code='bench', defaults={'name': 'ベンチマーク'})
+    products = Product.objects.bulk_create([
+        Product(name=f'ベンチマーク商品{i}', jan_code=f'{4900000000000 + i}')
+        for i in range(max(notifications_per_user, 1))
+    ])
+    listings = ProductOnECSite.objects.bulk_create([
+        ProductOnECSite(
+            product=product,
+            ec_site=ec_site,
+            ec_product_id=f'bench-{product.pk}',
+            product_url=f'https://example.com/items/{product.pk}',
+            seller_name='ベンチマークショップ',
+            current_price=10000,
+            effective_price=10000,
+        )
+        for product in products
+    ])
+
+    notifications: List[Notification] = []
+    for user in users:
+        for i in range(notifications_per_user):
+            listing = listings[i % len(listings)]
+            notifications.append(Notification(
+                user=user,
+                product=listing.product,
+                product_on_ec_site=listing,
+                notification_type='price_threshold',
+                message=f'{listing.product.name}の価格が設定した閾値を下回りました。',
+                new_price=9000,
+                is_read=False,
+            ))
+    Notification.objects.bulk_create(notifications, batch_size=1000)
+
+    return bucket_counts
+
+
+def run_notification_pipeline() -> Dict[str, str]:
+    """
+    メール送信処理を実行する
+    daily / weekly はダイジェスト送信、immediately はユーザーごとの即時配信で送信する
+    """
+    response = EmailNotificationService.send_price_alert_notification()
+    immediate_users = User.objects.filter(
+        settings__email_frequency__email_frequency='immediately'
+    ).values_list('pk', flat=True)
+    for user_id in immediate_users:
+        EmailNotificationService.send_immediate_notification(user_id)
+    return response
+
+
+class Command(BaseCommand):
+    help = 'ローカルのSMTPシンクに対して価格アラートメール送信（ダイジェスト・即時配信）のスループットを計測します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='作成するユーザー数')
+        parser.add_argument('--notifications', type=int, default=5, help='ユーザーごとの未送信通知数')
+        parser.add_argument('--min-rate', type=float, default=None,
+                            help='この送信数/秒を下回った場合は失敗とする')
+        parser.add_argument('--max-queries-per-message', type=float, default=None,
+                            help='1通あたりのクエリ数がこれを超えた場合は失敗とする')
+
+    def handle(self, *args, **options):
+        user_count = options['users']
+        per_user = options['notifications']
+
+        self.stdout.write('一時DBを作成しています...')
+        with throwaway_database():
+            buckets = seed_pending_notifications(user_count, per_user)
+            self.stdout.write(f'シード完了 - ユーザー: {user_count}人 {buckets}, '
+                              f'未送信通知: {user_count * per_user}件')
+
+            with SMTPSink() as sink, override_settings(**sink.email_settings()):
+                with measure() as result:
+                    response = run_notification_pipeline()
+
+        messages = sink.message_count
+        rate = result.per_second(messages)
+        queries_per_message = result.queries / messages if messages else float(result.queries)
+
+        self.stdout.write(response.get('message', ''))
+        self.stdout.write(self.style.SUCCESS(
+            f'送信数: {messages}通 ({sink.total_bytes / 1024:.1f} KiB)\n'
+            f'所要時間: {result.elapsed:.2f}秒\n'
+            f'スループット: {rate:.1f}通/秒\n'
+            f'クエリ数: {result.queries} ({queries_per_message:.1f}/通)\n'
+            f'ピークメモリ: {result.peak_memory / 1024 / 1024:.2f} MiB'
+        ))
+
+        # 回帰ゲート
+        errors = []
+        if options['min_rate'] is not None and rate < options['min_rate']:
+            errors.append(f'スループットが下限を下回りました: {rate:.1f} < {options["min_rate"]}')
+        max_queries = options['max_queries_per_message']
+        if max_queries is not None and queries_per_message > max_queries:
+            errors.append(f'1通あたりのクエリ数が上限を超えました: {queries_per_message:.1f} > {max_queries}')
+        if errors:
+            raise CommandError('\n'.join(errors))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from notifications.services import NotificationCounterService
+
+
+class Command(BaseCommand):
+    help = '未読件数カウンター（UnreadNotificationCounter）を通知テーブルから集計し直します'
+
+    def handle(self, *args, **options):
+        fixed = NotificationCounterService.recalculate_all()
+        self.stdout.write(self.style.SUCCESS(f'未読件数カウンターを{fixed}件修正しました'))
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.4 on 2026-10-19 09:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("notifications", "0004_unreadnotificationcounter"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="notification",
+            name="notificatio_user_id_c291d5_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="notification",
+            name="notificatio_is_read_9edb86_idx",
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["user", "is_read", "created_at"],
+                name="notificatio_user_id_8a7c6b_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notification",
+            index=models.Index(
+                fields=["user", "created_at"], name="notificatio_user_id_c62b26_idx"
+            ),
+        ),
+    ]
@@ -58,9 +58,10 @@ class Notification(models.Model):
     
     class Meta:
         indexes = [
-            models.Index(fields=['user']),
+            # 通知一覧（カーソルページネーション）と未読フィルター用の複合インデックス
+            models.Index(fields=['user', 'is_read', 'created_at']),
+            models.Index(fields=['user', 'created_at']),
             models.Index(fields=['notification_type']),
-            models.Index(fields=['is_read']),
             models.Index(fields=['sent_at']),
         ]
         ordering = ['-sent_at']
@@ -68,6 +69,25 @@ class Notification(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.product.name} - {self.notification_type}"
 
+class UnreadNotificationCounter(models.Model):
+    """
+    未読通知件数モデル
+    未読件数を毎回集計しなくて済むよう、ユーザーごとの件数を非正規化して保持する
+    通知作成時・既読化時・未読通知の削除時にNotificationCounterServiceから更新され、
+    それ以外の一括更新で生じたずれは定期タスク（recalculate_unread_counters）で修正する
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='unread_notification_counter'
+    )
+    unread_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id} - {self.unread_count}"
+
 # メール送信履歴モデル
 class EmailFrequency(models.Model):
     """
@@ -0,0 +1,40 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class NotificationPagination(CursorPagination):
+    """
+    通知一覧のページネーション
+
+    (created_at, id) の降順で並べ、(user, is_read, created_at) の複合インデックスを使って
+    カーソル（キーセット）方式でページングする。OFFSETを使わないため、履歴が長いユーザーでも
+    1ページあたりのコストは一定になる。
+
+    既存クライアントとの互換性のため、?pagination=cursor または ?cursor= が指定されない場合は
+    従来どおり page / count を返すページ番号方式で応答する。
+    """
+    ordering = ('-created_at', '-id')
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    mode_query_param = 'pagination'
+
+    def __init__(self) -> None:
+        self._page_number_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self._use_cursor(request):
+            self._page_number_paginator = PageNumberPagination()
+            return self._page_number_paginator.paginate_queryset(
+                queryset.order_by(*self.ordering), request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self._page_number_paginator is not None:
+            return self._page_number_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def _use_cursor(self, request) -> bool:
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_query_param in request.query_params
+        )
@@ -0,0 +1,91 @@
+"""
+通知のリアルタイム配信
+
+新しく作成された通知と未読件数の変化をRedis pub/subでユーザーごとのチャンネルに発行する
+購読側はSSEエンドポイント（views.notification_stream）で、接続中のクライアントに転送する
+
+EventSourceはヘッダーを設定できないため、SSEの接続にはJWTではなく、
+認証済みのAPIで発行した短命・1回限りのチケット（?ticket=）を使う。
+JWTをURLに含めるとアクセスログやプロキシのログに残るため
+"""
+import json
+import logging
+import secrets
+from typing import Any, Dict, Optional, Tuple
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.utils.encoders import JSONEncoder
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[redis.Redis] = None
+
+
+def channel_name(user_id: int) -> str:
+    """ユーザーごとの通知チャンネル名"""
+    return f'notifications:user:{user_id}'
+
+
+def _ticket_key(ticket: str) -> str:
+    return f'notifications:stream_ticket:{ticket}'
+
+
+def issue_stream_ticket(user_id: int, expires_at: int) -> str:
+    """
+    SSE接続用のチケットを発行する
+
+    Args:
+        user_id: ユーザーID
+        expires_at: ストリームを終了する時刻（UNIX時間。発行に使ったアクセストークンの有効期限）
+    """
+    ticket = secrets.token_urlsafe(32)
+    timeout = settings.NOTIFICATION_STREAM_TICKET_SECONDS
+    cache.set(_ticket_key(ticket), (user_id, expires_at), timeout=timeout)
+    return ticket
+
+
+async def redeem_stream_ticket(ticket: str) -> Optional[Tuple[int, int]]:
+    """
+    チケットを使用済みにして (ユーザーID, ストリームを終了する時刻) を返す
+    無効・期限切れ・使用済みのチケットはNone
+    """
+    key = _ticket_key(ticket)
+    value = await cache.aget(key)
+    # 同じチケットで同時に接続された場合は、削除できた1つだけを受け付ける
+    if value is None or not await cache.adelete(key):
+        return None
+    return value
+
+
+def _get_client() -> redis.Redis:
+    """発行用のRedisクライアントを取得（プロセス内で使い回す）"""
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.NOTIFICATION_STREAM_REDIS_URL)
+    return _client
+
+
+def _publish(user_id: int, event_type: str, data: Dict[str, Any]) -> None:
+    """
+    イベントを発行する
+    リアルタイム配信は補助的な機能なので、Redisに接続できなくても例外は送出しない
+    """
+    message = json.dumps({'type': event_type, 'data': data}, cls=JSONEncoder, ensure_ascii=False)
+    try:
+        _get_client().publish(channel_name(user_id), message)
+    except redis.RedisError as e:
+        logger.warning(f"通知イベントの発行に失敗しました - user_id: {user_id}, type: {event_type}, エラー: {str(e)}")
+
+
+def publish_notification(notification) -> None:
+    """新しく作成された通知を発行する"""
+    # 循環インポートを避けるため、ここでインポート
+    from .serializers import NotificationSerializer
+    _publish(notification.user_id, 'notification', NotificationSerializer(notification).data)
+
+
+def publish_unread_count(user_id: int, unread_count: int) -> None:
+    """未読件数の変化を発行する"""
+    _publish(user_id, 'unread_count', {'unread_count': unread_count})
@@ -1,11 +1,18 @@
 from django.utils import timezone
 from products.models import UserProduct, ProductOnECSite, PriceHistory
+from products.services.price_statistics_service import PriceStatisticsService
 from users.models import User
-from .models import Notification, EmailFrequency
+from .models import Notification, EmailFrequency, UnreadNotificationCounter
+from . import realtime
 import logging
 from datetime import timedelta
+from typing import Iterable, Optional
+from django.core.cache import cache
 from django.core.mail import send_mail
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 logger = logging.getLogger(__name__)
@@ -17,14 +24,19 @@ class NotificationService:
     """
     
     @staticmethod
-    def check_price_alerts():
+    def check_price_alerts(product_ids: Optional[Iterable[int]] = None):
         """
         アラート条件をチェックして通知が必要な場合は通知を作成する
+
+        Args:
+            product_ids: 指定した場合はこの商品のユーザー商品のみチェックする（価格更新直後の呼び出し用）
         """
         logger.info("価格アラートチェック開始")
         
         # 通知有効なユーザー商品を取得
         user_products = UserProduct.objects.filter(notification_enabled=True)
+        if product_ids is not None:
+            user_products = user_products.filter(product_id__in=list(product_ids))
         notification_count = 0
         
         for user_product in user_products:
@@ -118,8 +130,9 @@ class NotificationService:
         """
         product = user_product.product
         message = f"{product.name}の価格が設定した閾値（{threshold:,}円）を下回りました。現在価格: {current_price:,}円"
+        message += NotificationService._lowest_price_note(product_on_ec_site)
         
-        Notification.objects.create(
+        NotificationService._create_notification(
             user=user_product.user,
             product=product,
             product_on_ec_site=product_on_ec_site,
@@ -136,8 +149,9 @@ class NotificationService:
         """
         product = user_product.product
         message = f"{product.name}の価格が{previous_price:,}円から{current_price:,}円に下がりました（{percentage:.1f}%値下がり）"
+        message += NotificationService._lowest_price_note(product_on_ec_site)
         
-        Notification.objects.create(
+        NotificationService._create_notification(
             user=user_product.user,
             product=product,
             product_on_ec_site=product_on_ec_site,
@@ -155,8 +169,9 @@ class NotificationService:
         """
         product = user_product.product
         message = f"{product.name}の価格が{previous_price:,}円から{current_price:,}円に下がりました"
+        message += NotificationService._lowest_price_note(product_on_ec_site)
         
-        Notification.objects.create(
+        NotificationService._create_notification(
             user=user_product.user,
             product=product,
             product_on_ec_site=product_on_ec_site,
@@ -165,7 +180,206 @@ class NotificationService:
             old_price=previous_price,
             new_price=current_price,
             is_read=False
-        ) 
+        )
+
+    @staticmethod
+    def _lowest_price_note(product_on_ec_site):
+        """
+        実質価格が直近の最安値であれば、通知メッセージに添える文言を返す
+        価格統計を参照するだけなので、価格履歴は走査しない
+        """
+        if product_on_ec_site.effective_price is None:
+            return ''
+        try:
+            days = PriceStatisticsService.lowest_window(product_on_ec_site.pk, product_on_ec_site.effective_price)
+        except Exception as e:
+            logger.warning(f"価格統計の取得に失敗しました - 出品ID: {product_on_ec_site.pk}, エラー: {str(e)}")
+            return ''
+        if days is None:
+            return ''
+        return f"（実質価格が直近{days}日間の最安値です）"
+
+    @staticmethod
+    def _create_notification(**fields):
+        """
+        通知を作成する
+        即時通知のユーザーであれば、メール配信タスクを予約する
+        """
+        notification = Notification.objects.create(**fields)
+        unread_count = NotificationCounterService.increment(notification.user_id)
+        NotificationService.schedule_immediate_delivery(notification.user_id)
+        transaction.on_commit(lambda: NotificationService._publish_created(notification, unread_count))
+        return notification
+
+    @staticmethod
+    def _publish_created(notification, unread_count):
+        """作成された通知と最新の未読件数をリアルタイム配信する"""
+        realtime.publish_notification(notification)
+        realtime.publish_unread_count(notification.user_id, unread_count)
+
+    @staticmethod
+    def schedule_immediate_delivery(user_id: int) -> bool:
+        """
+        即時通知ユーザーへのメール配信タスクを予約する
+        短時間に複数の通知が作成された場合は1通にまとめるため、
+        合流期間中は追加でタスクを予約しない
+
+        Returns:
+            bool: 新たにタスクを予約した場合はTrue
+        """
+        is_immediate = User.objects.filter(
+            pk=user_id,
+            settings__email_notifications=True,
+            settings__email_frequency__email_frequency='immediately',
+        ).exists()
+        if not is_immediate:
+            return False
+
+        window = settings.IMMEDIATE_NOTIFICATION_COALESCE_SECONDS
+        # 配信タスクの開始時にキーを削除するので、タイムアウトは予備として長めに取る
+        timeout = immediate_delivery_timeout()
+        if not cache.add(immediate_delivery_key(user_id), True, timeout=timeout):
+            logger.debug(f"即時通知の配信タスクは予約済みです - user_id: {user_id}")
+            return False
+
+        transaction.on_commit(
+            lambda: NotificationService._enqueue_immediate_delivery(user_id, window)
+        )
+        logger.debug(f"即時通知の配信タスクを予約しました - user_id: {user_id}, {window}秒後")
+        return True
+
+    @staticmethod
+    def _enqueue_immediate_delivery(user_id: int, countdown: int) -> None:
+        """
+        即時通知の配信タスクをキューに登録する
+        登録に失敗した通知は、定期タスク（deliver_overdue_immediate_notifications）が配信する
+        """
+        # 循環インポートを避けるため、ここでインポート
+        from .tasks import deliver_immediate_notifications
+        try:
+            deliver_immediate_notifications.apply_async(  # type: ignore
+                args=[user_id], countdown=countdown
+            )
+        except Exception as e:
+            logger.error(f"即時通知の配信タスクの登録に失敗しました - user_id: {user_id}, エラー: {str(e)}",
+                         exc_info=True)
+            # 次の通知で再び予約できるよう、予約キーを解放する
+            try:
+                cache.delete(immediate_delivery_key(user_id))
+            except Exception:
+                pass
+
+
+class NotificationCounterService:
+    """
+    未読通知件数サービスクラス
+    UnreadNotificationCounterを更新・取得する
+    カウンターが未作成のユーザーは、初回アクセス時に通知テーブルから集計して作成する
+    """
+
+    @staticmethod
+    def get(user_id: int) -> int:
+        """未読件数を取得する"""
+        counter = UnreadNotificationCounter.objects.filter(user_id=user_id).values_list(
+            'unread_count', flat=True
+        ).first()
+        if counter is None:
+            return NotificationCounterService.recalculate(user_id)
+        return counter
+
+    @staticmethod
+    def increment(user_id: int, amount: int = 1) -> int:
+        """未読件数を増やし、更新後の件数を返す"""
+        updated = UnreadNotificationCounter.objects.filter(user_id=user_id).update(
+            unread_count=F('unread_count') + amount
+        )
+        if not updated:
+            # 未作成の場合は集計値（今回の通知を含む）で初期化する
+            return NotificationCounterService.recalculate(user_id)
+        return NotificationCounterService.get(user_id)
+
+    @staticmethod
+    def decrement(user_id: int, amount: int) -> int:
+        """未読件数を減らし、更新後の件数を返す"""
+        updated = UnreadNotificationCounter.objects.filter(user_id=user_id).update(
+            unread_count=Greatest(F('unread_count') - amount, 0)
+        )
+        if not updated:
+            return NotificationCounterService.recalculate(user_id)
+        return NotificationCounterService.get(user_id)
+
+    @staticmethod
+    def discard(user_id: int, amount: int = 1) -> None:
+        """
+        削除された未読通知の分だけ未読件数を減らす
+        カウンターが未作成（またはユーザーごと削除された）場合は何もしない
+        """
+        UnreadNotificationCounter.objects.filter(user_id=user_id).update(
+            unread_count=Greatest(F('unread_count') - amount, 0)
+        )
+
+    @staticmethod
+    def recalculate_all() -> int:
+        """
+        すべてのユーザーの未読件数を通知テーブルから集計し、ずれているカウンターを直す
+        ビュー以外での一括更新（update(is_read=...)）などで生じたずれを、定期タスクで解消する
+
+        Returns:
+            int: 修正したカウンターの件数
+        """
+        unread_counts = dict(
+            Notification.objects.filter(is_read=False)
+            .values('user_id').annotate(count=Count('pk')).values_list('user_id', 'count')
+        )
+        counters = dict(UnreadNotificationCounter.objects.values_list('user_id', 'unread_count'))
+
+        fixed = [
+            UnreadNotificationCounter(user_id=user_id, unread_count=unread_counts.get(user_id, 0))
+            for user_id in unread_counts.keys() | counters.keys()
+            if unread_counts.get(user_id, 0) != counters.get(user_id)
+        ]
+        if fixed:
+            UnreadNotificationCounter.objects.bulk_create(
+                fixed,
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['unread_count', 'updated_at'],
+            )
+            logger.warning(f"未読件数カウンターのずれを修正しました - 件数: {len(fixed)}")
+        return len(fixed)
+
+    @staticmethod
+    def recalculate(user_id: int) -> int:
+        """通知テーブルから未読件数を集計してカウンターを作り直す"""
+        unread_count = Notification.objects.filter(user_id=user_id, is_read=False).count()
+        try:
+            with transaction.atomic():
+                UnreadNotificationCounter.objects.update_or_create(
+                    user_id=user_id, defaults={'unread_count': unread_count}
+                )
+        except IntegrityError:
+            # 同時に作成された場合は、作成済みのカウンターをそのまま使う
+            logger.debug(f"未読件数カウンターは作成済みです - user_id: {user_id}")
+        return unread_count
+
+
+def discard_deleted_notification(sender, instance, **kwargs) -> None:
+    """Notificationの削除時に呼ばれるシグナルハンドラー（ユーザー・商品の削除に伴う削除を含む）"""
+    if not instance.is_read:
+        NotificationCounterService.discard(instance.user_id)
+
+
+def immediate_delivery_key(user_id: int) -> str:
+    """即時通知の配信タスク予約状況を保持するキャッシュキー"""
+    return f'notifications:immediate_delivery:{user_id}'
+
+
+def immediate_delivery_timeout() -> int:
+    """
+    即時通知の予約キーの有効期限（秒）
+    作成からこの時間を過ぎても未送信の即時通知は、配信タスクが失われたとみなして定期タスクで配信する
+    """
+    return settings.IMMEDIATE_NOTIFICATION_COALESCE_SECONDS + 300
 
 
 class EmailNotificationService:
@@ -181,7 +395,8 @@ class EmailNotificationService:
         logger.info("価格アラート通知をメールで送信します")
         send_mail_count = {}
 
-        for email_frequency in EmailFrequency.objects.all():
+        # 即時通知は価格変動時にdeliver_immediate_notificationsタスクで配信するため対象外
+        for email_frequency in EmailFrequency.objects.exclude(email_frequency='immediately'):
             frequency = email_frequency.email_frequency
             
             # 前回通知からのインターバルをチェック
@@ -215,6 +430,47 @@ class EmailNotificationService:
 
         return {"success": True, "message": f"メール送信が完了しました - 送信数: {send_mail_count}"}
     
+    @staticmethod
+    def send_immediate_notification(user_id: int):
+        """
+        即時通知ユーザー1人分の未送信通知をメールで送信する
+        """
+        users = User.objects.filter(
+            pk=user_id,
+            settings__email_notifications=True,
+            settings__email_frequency__email_frequency='immediately',
+        )
+        if not users.exists():
+            logger.debug(f"即時通知の対象ユーザーではありません - user_id: {user_id}")
+            return {"success": True, "message": "送信対象外のユーザーです - 送信数: 0"}
+
+        send_mail_count = EmailNotificationService._process_user_notifications(
+            users, "【PriceAlert】immediatelyの価格変動レポート", "price_alert_immediately"
+        )
+        return {"success": True, "message": f"即時通知メール送信が完了しました - 送信数: {send_mail_count}"}
+
+    @staticmethod
+    def send_overdue_immediate_notifications():
+        """
+        配信タスクが失われた即時通知を送信する
+        （タスクの登録失敗・ワーカーの停止などで、予約キーの有効期限を過ぎても未送信のもの）
+        """
+        overdue_before = timezone.now() - timedelta(seconds=immediate_delivery_timeout())
+        users = User.objects.filter(
+            settings__email_notifications=True,
+            settings__email_frequency__email_frequency='immediately',
+            notification__sent_at__isnull=True,
+            notification__product_on_ec_site__isnull=False,
+            notification__created_at__lt=overdue_before,
+        ).distinct()
+
+        send_mail_count = EmailNotificationService._process_user_notifications(
+            users, "【PriceAlert】immediatelyの価格変動レポート", "price_alert_immediately"
+        )
+        if send_mail_count:
+            logger.warning(f"配信タスクが失われた即時通知を送信しました - 送信数: {send_mail_count}")
+        return {"success": True, "message": f"未配信の即時通知メール送信が完了しました - 送信数: {send_mail_count}"}
+
     @staticmethod
     def _should_send_notification(email_frequency):
         """
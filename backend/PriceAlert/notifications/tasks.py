@@ -1,6 +1,12 @@
 from celery import shared_task
 import logging
-from .services import NotificationService, EmailNotificationService
+from django.core.cache import cache
+from .services import (
+    EmailNotificationService,
+    NotificationCounterService,
+    NotificationService,
+    immediate_delivery_key,
+)
 import time
 
 logger = logging.getLogger(__name__)
@@ -48,7 +54,7 @@ def check_price_alerts(self):
 )
 def send_price_alert_notifications(self):
     """
-    価格アラート通知をメールで送信する定期タスク
+    価格アラート通知をメールで送信する定期タスク（daily / weekly のダイジェスト）
     check_price_alertsの後に実行される
     """
     try:
@@ -70,4 +76,71 @@ def send_price_alert_notifications(self):
         logger.error(f"価格アラート通知メール送信中に予期せぬエラーが発生しました: {str(e)}", exc_info=True)
         # リトライを行う
         raise self.retry(exc=e)
-    
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_kwargs={'max_retries': 3, 'countdown': 60},
+    retry_backoff=True,
+    retry_backoff_max=300,
+    retry_jitter=True
+)
+def deliver_immediate_notifications(self, user_id):
+    """
+    即時通知ユーザーの未送信通知をメールで送信するタスク
+    通知作成時に合流期間（IMMEDIATE_NOTIFICATION_COALESCE_SECONDS）だけ遅延して予約される
+    """
+    try:
+        # 送信中に作成された通知は次のタスクで配信されるよう、先に予約キーを解放する
+        cache.delete(immediate_delivery_key(user_id))
+
+        result = EmailNotificationService.send_immediate_notification(user_id)
+        logger.info(f"{result.get('message')} - user_id: {user_id}")
+        return result
+
+    except Exception as e:
+        logger.error(f"即時通知メール送信中に予期せぬエラーが発生しました - user_id: {user_id}, エラー: {str(e)}", exc_info=True)
+        raise self.retry(exc=e)
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_kwargs={'max_retries': 3, 'countdown': 60},
+    retry_backoff=True,
+    retry_backoff_max=300,
+    retry_jitter=True
+)
+def deliver_overdue_immediate_notifications(self):
+    """
+    配信タスクが失われた即時通知をメールで送信する定期タスク
+    deliver_immediate_notifications の登録失敗・ワーカー停止時の予備
+    """
+    try:
+        result = EmailNotificationService.send_overdue_immediate_notifications()
+        logger.info(result.get('message'))
+        return result
+
+    except Exception as e:
+        logger.error(f"未配信の即時通知メール送信中に予期せぬエラーが発生しました: {str(e)}", exc_info=True)
+        raise self.retry(exc=e)
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_kwargs={'max_retries': 3, 'countdown': 60},
+    retry_backoff=True,
+    retry_backoff_max=300,
+    retry_jitter=True
+)
+def recalculate_unread_counters(self):
+    """
+    未読件数カウンターを通知テーブルから集計し直す定期タスク
+    """
+    try:
+        fixed = NotificationCounterService.recalculate_all()
+        logger.info(f"未読件数カウンターの再集計が完了しました - 修正件数: {fixed}件")
+        return fixed
+
+    except Exception as e:
+        logger.error(f"未読件数カウンターの再集計中にエラーが発生しました: {str(e)}", exc_info=True)
+        raise self.retry(exc=e)
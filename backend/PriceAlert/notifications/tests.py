@@ -1,3 +1,5 @@
+import io
+
 from django.test import TestCase
 from django.utils import timezone
 from django.contrib.auth import get_user_model
@@ -190,3 +192,255 @@ class NotificationServiceTest(TestCase):
         self.assertEqual(notification.notification_type, 'percentage_drop')
         self.assertEqual(notification.old_price, 10000)
         self.assertEqual(notification.new_price, 9000)
+
+    def test_immediate_delivery_is_coalesced(self):
+        """即時通知ユーザーの配信タスクが合流期間中に1回だけ予約されるかテスト"""
+        from unittest import mock
+        from django.core.cache import cache
+        cache.clear()
+
+        with mock.patch('notifications.tasks.deliver_immediate_notifications.apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                NotificationService.check_price_alerts(product_ids=[self.product.pk])
+                self.assertFalse(NotificationService.schedule_immediate_delivery(self.user.pk))
+
+        apply_async.assert_called_once()
+        self.assertEqual(apply_async.call_args.kwargs['args'], [self.user.pk])
+
+    def test_lost_immediate_delivery_falls_back_to_periodic_task(self):
+        """配信タスクの登録に失敗しても、定期タスクで未送信の即時通知が送信されるかテスト"""
+        from unittest import mock
+        from django.core import mail
+        from django.core.cache import cache
+        from .services import EmailNotificationService, immediate_delivery_key
+        cache.clear()
+
+        with mock.patch('notifications.tasks.deliver_immediate_notifications.apply_async',
+                        side_effect=ConnectionError('broker is down')):
+            with self.captureOnCommitCallbacks(execute=True):
+                NotificationService.check_price_alerts(product_ids=[self.product.pk])
+        # 予約キーは解放され、次の通知で再び予約できる
+        self.assertIsNone(cache.get(immediate_delivery_key(self.user.pk)))
+
+        # 合流期間内の通知は、配信タスクに任せる
+        EmailNotificationService.send_overdue_immediate_notifications()
+        self.assertEqual(len(mail.outbox), 0)
+
+        Notification.objects.update(created_at=timezone.now() - datetime.timedelta(minutes=30))
+        EmailNotificationService.send_overdue_immediate_notifications()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(Notification.objects.filter(sent_at__isnull=True).exists())
+
+
+class EmailThroughputBenchmarkTest(TestCase):
+    """メール送信ベンチマーク（SMTPシンク）のテスト"""
+
+    def test_send_to_smtp_sink(self):
+        """未送信通知がSMTPシンクに送信され、送信済みになるかテスト"""
+        from django.test.utils import override_settings
+        from PriceAlert.benchmarking import SMTPSink
+        from .management.commands.benchmark_notifications import (
+            run_notification_pipeline, seed_pending_notifications
+        )
+
+        buckets = seed_pending_notifications(user_count=6, notifications_per_user=2)
+        self.assertEqual(buckets, {'immediately': 2, 'daily': 2, 'weekly': 2})
+
+        with SMTPSink() as sink, override_settings(**sink.email_settings()):
+            run_notification_pipeline()
+
+        self.assertEqual(sink.message_count, 6)
+        self.assertFalse(Notification.objects.filter(sent_at__isnull=True).exists())
+
+
+class NotificationStreamTest(TestCase):
+    """通知のリアルタイム配信のテスト"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='stream@example.com',
+            username='streamuser',
+            password='password123'
+        )
+        self.product = Product.objects.create(name='テスト商品')
+        self.ec_site = ECSite.objects.create(name='テストショップ', code='test_shop')
+        self.product_on_ec_site = ProductOnECSite.objects.create(
+            product=self.product,
+            ec_site=self.ec_site,
+            ec_product_id='12345',
+            product_url='https://example.com/product/12345',
+            current_price=9000,
+            effective_price=9000
+        )
+
+    def test_stream_requires_token(self):
+        """トークンなしの接続が拒否されるかテスト"""
+        response = self.client.get('/api/v1/notifications/stream/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_stream_ticket_is_single_use(self):
+        """チケットは1回だけ使え、URLのJWTは受け付けず、トークンの期限切れで切断されるかテスト"""
+        import time
+        from unittest import mock
+        from asgiref.sync import async_to_sync
+        from django.core.cache import cache
+        from django.test import RequestFactory
+        from rest_framework.test import APIClient
+        from rest_framework_simplejwt.tokens import AccessToken
+        from .views import notification_stream
+        cache.clear()
+
+        # URLに含めたJWTは受け付けない
+        token = str(AccessToken.for_user(self.user))
+        response = self.client.get(f'/api/v1/notifications/stream/?token={token}')
+        self.assertEqual(response.status_code, 401)
+
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        ticket = client.post('/api/v1/notifications/stream-ticket/').json()['ticket']
+        ticket_key = f'notifications:stream_ticket:{ticket}'
+        user_id, _ = cache.get(ticket_key)
+        self.assertEqual(user_id, self.user.pk)
+        # 有効期限を過ぎたトークンで発行したチケットとして扱う
+        cache.set(ticket_key, (user_id, int(time.time()) - 1))
+
+        pubsub = mock.MagicMock()
+        pubsub.subscribe = mock.AsyncMock()
+        pubsub.aclose = mock.AsyncMock()
+        pubsub.get_message = mock.AsyncMock(return_value=None)
+        redis_client = mock.MagicMock(aclose=mock.AsyncMock())
+        redis_client.pubsub.return_value = pubsub
+
+        async def read(request):
+            response = await notification_stream(request)
+            if response.status_code != 200:
+                return response.status_code, []
+            return response.status_code, [chunk async for chunk in response.streaming_content]
+
+        url = f'/api/v1/notifications/stream/?ticket={ticket}'
+        with mock.patch('notifications.views.aioredis.Redis.from_url', return_value=redis_client):
+            status_code, chunks = async_to_sync(read)(RequestFactory().get(url))
+            self.assertEqual(status_code, 200)
+            self.assertEqual(chunks[-1], b'event: expired\ndata: {}\n\n')
+            pubsub.get_message.assert_not_called()
+
+            # 使用済みのチケットでは接続できない
+            status_code, _ = async_to_sync(read)(RequestFactory().get(url))
+            self.assertEqual(status_code, 401)
+
+    def test_created_notification_is_published(self):
+        """通知作成時に通知と未読件数がユーザーのチャンネルに発行されるかテスト"""
+        from unittest import mock
+        from . import realtime
+
+        with mock.patch.object(realtime, '_get_client') as get_client:
+            with self.captureOnCommitCallbacks(execute=True):
+                NotificationService._create_notification(
+                    user=self.user,
+                    product=self.product,
+                    product_on_ec_site=self.product_on_ec_site,
+                    notification_type='price_drop',
+                    message='価格が下がりました',
+                    new_price=9000,
+                )
+
+        publish = get_client.return_value.publish
+        self.assertEqual(publish.call_count, 2)
+        channels = {call.args[0] for call in publish.call_args_list}
+        self.assertEqual(channels, {realtime.channel_name(self.user.pk)})
+        self.assertIn('"unread_count": 1', publish.call_args_list[1].args[1])
+
+
+class NotificationViewSetTest(TestCase):
+    """通知APIのテスト"""
+
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.user = User.objects.create_user(
+            email='unread@example.com',
+            username='unreaduser',
+            password='password123'
+        )
+        self.product = Product.objects.create(name='テスト商品')
+        ec_site = ECSite.objects.create(name='テストショップ', code='test_shop')
+        self.product_on_ec_site = ProductOnECSite.objects.create(
+            product=self.product,
+            ec_site=ec_site,
+            ec_product_id='12345',
+            product_url='https://example.com/product/12345',
+            current_price=9000,
+            effective_price=9000
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _create_notification(self):
+        return NotificationService._create_notification(
+            user=self.user,
+            product=self.product,
+            product_on_ec_site=self.product_on_ec_site,
+            notification_type='price_drop',
+            message='価格が下がりました',
+            new_price=9000,
+        )
+
+    def test_counter_follows_creation_and_mark_read(self):
+        """通知作成と既読化に合わせて未読件数が更新されるかテスト"""
+        notifications = [self._create_notification() for _ in range(3)]
+
+        response = self.client.get('/api/v1/notifications/unread-count/')
+        self.assertEqual(response.json(), {'unread_count': 3})
+
+        self.client.post('/api/v1/notifications/mark-read/',
+                         {'notification_ids': [notifications[0].pk]}, format='json')
+        response = self.client.get('/api/v1/notifications/unread-count/')
+        self.assertEqual(response.json(), {'unread_count': 2})
+
+        self.client.post('/api/v1/notifications/mark-all-read/')
+        response = self.client.get('/api/v1/notifications/unread-count/')
+        self.assertEqual(response.json(), {'unread_count': 0})
+
+    def test_counter_follows_deletion_and_recalculation(self):
+        """未読通知の削除で未読件数が減り、ビュー以外での一括更新のずれが再集計で直るかテスト"""
+        from django.core.management import call_command
+        from .models import UnreadNotificationCounter
+        from .services import NotificationCounterService
+        notifications = [self._create_notification() for _ in range(3)]
+
+        notifications[0].delete()
+        self.assertEqual(NotificationCounterService.get(self.user.pk), 2)
+
+        Notification.objects.filter(pk=notifications[1].pk).update(is_read=True)
+        self.assertEqual(NotificationCounterService.get(self.user.pk), 2)
+        call_command('recalculate_unread_counters', stdout=io.StringIO())
+        self.assertEqual(NotificationCounterService.get(self.user.pk), 1)
+
+        # 商品・ユーザーの削除に伴う通知の削除
+        self.product.delete()
+        self.assertEqual(NotificationCounterService.get(self.user.pk), 0)
+        self.user.delete()
+        self.assertFalse(UnreadNotificationCounter.objects.exists())
+        self.assertEqual(NotificationCounterService.recalculate_all(), 0)
+
+    def test_cursor_pagination(self):
+        """カーソル方式で新しい順に重複なくページングできるかテスト"""
+        created_ids = [self._create_notification().pk for _ in range(15)]
+
+        response = self.client.get('/api/v1/notifications/', {'pagination': 'cursor'})
+        first_page = response.json()
+        self.assertNotIn('count', first_page)
+        self.assertEqual(len(first_page['results']), 10)
+
+        second_page = self.client.get(first_page['next']).json()
+        self.assertIsNone(second_page['next'])
+
+        listed_ids = [n['id'] for n in first_page['results'] + second_page['results']]
+        self.assertEqual(listed_ids, list(reversed(created_ids)))
+
+    def test_page_number_pagination_is_kept(self):
+        """カーソル指定がない場合は従来のページ番号方式で応答するかテスト"""
+        for _ in range(3):
+            self._create_notification()
+
+        response = self.client.get('/api/v1/notifications/', {'page': 1})
+        self.assertEqual(response.json()['count'], 3)
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AlertViewSet, NotificationViewSet
+from .views import AlertViewSet, NotificationViewSet, notification_stream
 
 # DRF RouterをセットアップしてViewSetをルーティング
 router = DefaultRouter()
@@ -8,5 +8,7 @@ router.register(r'alerts', AlertViewSet, basename='alert')
 router.register(r'', NotificationViewSet, basename='notification')
 
 urlpatterns = [
+    # ルーターの詳細ルート（{pk}/）に吸収されないよう先に定義する
+    path('stream/', notification_stream, name='notification-stream'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
@@ -1,13 +1,28 @@
+import json
+import logging
+import time
+import redis.asyncio as aioredis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
 from django.db.models import Q
 from django.utils import timezone
 from .models import Alert, Notification
 from .serializers import AlertSerializer, NotificationSerializer
+from .pagination import NotificationPagination
+from .services import NotificationCounterService
+from . import realtime
 from products.models import Product, UserProduct
 
+logger = logging.getLogger(__name__)
+
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
     """
@@ -77,6 +92,7 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     """
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = NotificationPagination
     
     def get_queryset(self):
         """
@@ -91,7 +107,8 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
         
         queryset = (
             Notification.objects.filter(user=user)
-            .select_related('product')
+            .select_related('product', 'product_on_ec_site__ec_site')
+            .order_by('-created_at', '-id')
         )
         
         # 既読・未読フィルター
@@ -134,6 +151,8 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
 
         # ユーザーに紐づく通知のみ更新
         updated_count = Notification.objects.filter(**filter).update(is_read=True)
+        if updated_count:
+            self._on_marked_read(request.user, updated_count)
         
         return Response({
             "status": "success",
@@ -150,8 +169,113 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
             user=request.user,
             is_read=False
         ).update(is_read=True)
+        if updated_count:
+            self._on_marked_read(request.user, updated_count)
         
         return Response({
             "status": "success",
             "updated_count": updated_count
         })
+
+    @action(detail=False, methods=['get'], url_path='unread-count')
+    def unread_count(self, request):
+        """
+        未読件数を返すアクション
+        通知一覧を集計せず、ユーザーごとの未読件数カウンターを1件読むだけで応答する
+        """
+        return Response({
+            "unread_count": NotificationCounterService.get(request.user.pk)
+        })
+
+    @action(detail=False, methods=['post'], url_path='stream-ticket')
+    def stream_ticket(self, request):
+        """
+        通知のSSEストリームに接続するためのチケットを発行するアクション
+        チケットは1回限りで、NOTIFICATION_STREAM_TICKET_SECONDS 秒以内に使用する
+        """
+        if request.auth is not None and 'exp' in request.auth:
+            expires_at = int(request.auth['exp'])
+        else:
+            lifetime = settings.SIMPLE_JWT['ACCESS_TOKEN_LIFETIME']
+            expires_at = int((timezone.now() + lifetime).timestamp())
+        ticket = realtime.issue_stream_ticket(request.user.pk, expires_at)
+        return Response({
+            "ticket": ticket,
+            "expires_in": settings.NOTIFICATION_STREAM_TICKET_SECONDS,
+        })
+
+    def _on_marked_read(self, user, updated_count):
+        """既読化した件数だけ未読件数を減らし、変化をリアルタイム配信する"""
+        unread_count = NotificationCounterService.decrement(user.pk, updated_count)
+        realtime.publish_unread_count(user.pk, unread_count)
+
+
+async def _authenticate_stream_request(request):
+    """
+    SSE接続を認証して (ユーザーID, ストリームを終了する時刻) を返す
+    EventSourceからはチケット（?ticket=）、それ以外のクライアントからは Authorization ヘッダーのJWTを受け付ける
+    """
+    ticket = request.GET.get('ticket')
+    if ticket:
+        return await realtime.redeem_stream_ticket(ticket)
+
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return None
+    try:
+        access_token = AccessToken(header[len('Bearer '):])  # type: ignore[arg-type]
+    except TokenError:
+        return None
+    return access_token.get(settings.SIMPLE_JWT['USER_ID_CLAIM']), access_token['exp']
+
+
+async def notification_stream(request):
+    """
+    通知のSSEストリーム GET: notifications/stream/?ticket=...
+    接続時に未読件数を送信し、その後は新しい通知と未読件数の変化をRedis pub/sub経由でプッシュする
+    認証に使ったトークンの有効期限で expired イベントを送って切断する
+    ASGIサーバー（asgi.py）での実行を前提とする
+    """
+    authenticated = await _authenticate_stream_request(request)
+    if authenticated is None:
+        return JsonResponse({"detail": "認証情報が含まれていないか、無効です。"}, status=401)
+    user_id, expires_at = authenticated
+    if not await get_user_model().objects.filter(pk=user_id, is_active=True).aexists():
+        return JsonResponse({"detail": "認証情報が含まれていないか、無効です。"}, status=401)
+
+    unread_count = await sync_to_async(NotificationCounterService.get)(user_id)
+    keepalive = settings.NOTIFICATION_STREAM_KEEPALIVE_SECONDS
+
+    async def event_stream():
+        client = aioredis.Redis.from_url(settings.NOTIFICATION_STREAM_REDIS_URL)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(realtime.channel_name(user_id))
+            logger.debug(f"通知ストリームに接続しました - user_id: {user_id}")
+            yield f'event: unread_count\ndata: {{"unread_count": {unread_count}}}\n\n'
+
+            while True:
+                # トークンの有効期限を過ぎたら切断する（クライアントはチケットを取り直して再接続する）
+                remaining = expires_at - time.time()
+                if remaining <= 0:
+                    yield 'event: expired\ndata: {}\n\n'
+                    return
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=min(keepalive, remaining)
+                )
+                if message is None:
+                    # プロキシによる切断を防ぐためのコメント行
+                    yield ': keepalive\n\n'
+                    continue
+                event = json.loads(message['data'])
+                data = json.dumps(event['data'], ensure_ascii=False)
+                yield f'event: {event["type"]}\ndata: {data}\n\n'
+        finally:
+            logger.debug(f"通知ストリームを切断しました - user_id: {user_id}")
+            await pubsub.aclose()
+            await client.aclose()
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,8 +1,12 @@
 from django.contrib import admin
-from .models import Product, ECSite, ProductOnECSite, PriceHistory
+from .models import Product, ECSite, ProductOnECSite, PriceHistory, DailyPriceAggregate, PriceStatistics, RegistrationJob, ECItemJANCode, RefreshSchedule
 # Register your models here.
 admin.site.register(Product)
 admin.site.register(ECSite)
 admin.site.register(ProductOnECSite)
 admin.site.register(PriceHistory)
-
+admin.site.register(DailyPriceAggregate)
+admin.site.register(PriceStatistics)
+admin.site.register(RegistrationJob)
+admin.site.register(ECItemJANCode)
+admin.site.register(RefreshSchedule)
@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class ProductsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "products"
+
+    def ready(self):
+        from .ec_sites import invalidate_ec_sites
+        from .models import ECSite, UserProduct
+        from .services.refresh_schedule_service import reschedule_watched_product
+
+        # 管理画面などでECサイトを変更したら、ECサイトのレジストリを読み込み直す
+        post_save.connect(invalidate_ec_sites, sender=ECSite, dispatch_uid='products.invalidate_ec_sites_on_save')
+        post_delete.connect(invalidate_ec_sites, sender=ECSite, dispatch_uid='products.invalidate_ec_sites_on_delete')
+
+        # 登録ユーザー・通知閾値が変わったら、商品の価格更新スケジュールを計算し直す
+        post_save.connect(reschedule_watched_product, sender=UserProduct,
+                          dispatch_uid='products.reschedule_on_user_product_save')
+        post_delete.connect(reschedule_watched_product, sender=UserProduct,
+                            dispatch_uid='products.reschedule_on_user_product_delete')
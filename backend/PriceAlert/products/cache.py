@@ -0,0 +1,70 @@
+import hashlib
+import json
+from typing import Any, Callable, Iterable, List, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from PriceAlert.cache import CacheNamespace
+from .models import UserProduct
+
+# 商品単位のキャッシュ（スコープ = 商品ID）
+# 商品詳細（出品情報を含む）と価格履歴を保持し、価格更新時に商品単位で無効化する
+product_cache: CacheNamespace[Any] = CacheNamespace('products', timeout=settings.PRODUCT_CACHE_TIMEOUT)
+
+# ユーザー単位の一覧レスポンスのキャッシュ（スコープ = ユーザーID）
+# 値は (ETag, レスポンスデータ)
+user_list_cache: CacheNamespace[Tuple[str, Any]] = CacheNamespace(
+    'user_lists', timeout=settings.PRODUCT_CACHE_TIMEOUT
+)
+
+# ECサイトごとのJANコード検索結果（キー = (ECサイトコード, JANコード)）
+# 値はコネクターが返した ProductData のリスト。外部APIの呼び出し回数を減らすために使う
+jan_search_cache: CacheNamespace[List[Any]] = CacheNamespace(
+    'jan_search', timeout=settings.JAN_SEARCH_CACHE_TIMEOUT
+)
+
+
+def invalidate_products(product_ids: Iterable[int]) -> None:
+    """
+    商品のキャッシュと、その商品を登録しているユーザーの一覧キャッシュを無効化する
+    トランザクション確定前に無効化すると古いデータが再キャッシュされ得るので、確定後に実行する
+    """
+    ids = set(product_ids)
+    if not ids:
+        return
+
+    def invalidate():
+        product_cache.invalidate_many(str(product_id) for product_id in ids)
+        user_ids = UserProduct.objects.filter(product_id__in=ids).values_list('user_id', flat=True).distinct()
+        user_list_cache.invalidate_many(str(user_id) for user_id in user_ids)
+
+    transaction.on_commit(invalidate)
+
+
+def invalidate_user_lists(user_id: int) -> None:
+    """ユーザーの一覧キャッシュを無効化する（トランザクション確定後）"""
+    transaction.on_commit(lambda: user_list_cache.invalidate(scope=str(user_id)))
+
+
+def cached_user_list_response(request, key: str, producer: Callable[[], Any]) -> Response:
+    """
+    ユーザー単位でキャッシュした一覧レスポンスを返す
+    If-None-MatchがETagと一致する場合は、本文なしの304を返す
+    """
+    etag, data = user_list_cache.get_or_set(
+        key, lambda: _with_etag(producer()), scope=str(request.user.pk)
+    )
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return Response(data, headers={'ETag': etag})
+
+
+def _with_etag(data: Any) -> Tuple[str, Any]:
+    """レスポンスデータの内容からETagを計算する"""
+    content = json.dumps(data, cls=JSONEncoder, sort_keys=True, ensure_ascii=False)
+    return f'"{hashlib.sha1(content.encode("utf-8")).hexdigest()}"', data
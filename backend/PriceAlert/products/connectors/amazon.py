@@ -1,4 +1,4 @@
-from .base import ECConnector, ProductData
+from .base import ECConnector, ECSearchError, ProductData
 from amazon.paapi import AmazonAPI
 from django.conf import settings
 import re
@@ -89,11 +89,11 @@ class AmazonConnector(ECConnector):
                 return []
             else:
                 logger.error("Amazon:APIで予期しないエラー: %s", e)
-                return []
+                raise ECSearchError(str(e)) from e
         except Exception as e:
             logger.error('Amazon: JANコード検索中に予期せぬエラーが発生しました - JANコード: %s, エラー: %s', 
                        jan_code, str(e), exc_info=True)
-            return []
+            raise ECSearchError(str(e)) from e
 
     def _extract_product_id(self, url: str) -> Optional[str]:
         """商品URLからASINを抽出する"""
@@ -1,12 +1,58 @@
 from abc import ABC, abstractmethod
 import re
-from typing import List, Dict, Any, Optional, Union, TypeVar, cast, Set
-from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Dict, Any, Callable, Optional, Sequence, Union, TypeVar, cast, Set, Tuple
+from dataclasses import dataclass, replace
+
+# アクセスパスの1ステップ（str: 属性名・キー、int: インデックス）
+PathStep = Union[str, int]
+
+_PATH_PART_PATTERN = re.compile(r'^([^\[\]]+)((?:\[-?\d+\])*)$')
+_PATH_INDEX_PATTERN = re.compile(r'\[(-?\d+)\]')
+# 前後が数字でない13桁の数字（「JANコード4901234567894」のように日本語に続く場合も拾う）
+_JAN_CODE_PATTERN = re.compile(r'(?<!\d)\d{13}(?!\d)')
+
+
+def is_valid_jan_code(code: str) -> bool:
+    """
+    GTIN-13（JANコード）のチェックデジットが正しいか
+
+    前後が数字でないだけの13桁は、URL検索のレスポンス全体（商品コード・画像URL・タイムスタンプなど）にも
+    含まれるので、チェックデジットで JANコードでないものを除く
+    """
+    digits = [int(c) for c in code]
+    total = sum(digit * (3 if i % 2 else 1) for i, digit in enumerate(digits[:12]))
+    return (10 - total % 10) % 10 == digits[12]
+
+
+@lru_cache(maxsize=1024)
+def compile_path(path: str) -> Tuple[PathStep, ...]:
+    """
+    'offers.listings[0].price.amount' のようなパスをステップのタプルに変換する
+    例: ('offers', 'listings', 0, 'price', 'amount')
+
+    同じパスの解析は1回だけ行い、結果を使い回す
+    """
+    steps: List[PathStep] = []
+    for part in path.split('.'):
+        match = _PATH_PART_PATTERN.match(part)
+        if not match:
+            raise ValueError(f'不正なパスです: {path}')
+        steps.append(match.group(1))
+        steps.extend(int(index) for index in _PATH_INDEX_PATTERN.findall(match.group(2)))
+    return tuple(steps)
+
 
 # 商品情報のデータクラス
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ProductData:
-    """ECサイトから取得した商品情報を格納するデータクラス"""
+    """
+    ECサイトから取得した商品情報を格納するデータクラス
+
+    コネクターからDBへの保存まで、辞書に変換せずにそのまま受け渡す。
+    大量の商品を扱う価格更新でのメモリ使用量を抑えるため __slots__ を使い、
+    キャッシュやスレッド間で共有しても変更されないよう frozen にしている
+    """
     name: str
     description: str = ""
     image_url: str = ""
@@ -27,7 +73,13 @@ class ProductData:
     def __post_init__(self):
         # 有効価格が設定されていない場合は価格を設定
         if not self.effective_price and self.price:
-            self.effective_price = self.price
+            object.__setattr__(self, 'effective_price', self.price)
+
+    def without_details(self) -> 'ProductData':
+        """価格更新で使わない商品説明を除いたコピーを返す"""
+        if not self.description:
+            return self
+        return replace(self, description="")
 
     def to_dict(self) -> Dict[str, Any]:
         """データクラスを辞書に変換"""
@@ -50,6 +102,32 @@ class ProductData:
             'ec_site': self.ec_site
         }
 
+# 検索結果の取得方針
+@dataclass(frozen=True)
+class FetchPolicy:
+    """
+    JANコード検索で、検索結果を何ページまで取得し、どの商品を保存するか
+
+    検索結果は価格の安い順なので、条件に合う商品が enough_offers 件見つかった時点で
+    以降のページは取得しない。条件に合わない商品は整形・保存しない
+    """
+    page_size: int = 10  # 1ページあたりの商品数
+    max_pages: int = 1  # 取得する最大ページ数
+    enough_offers: int = 0  # 条件に合う商品がこの件数見つかったら取得を終える（0: 最大ページ数まで取得）
+    in_stock_only: bool = False  # 在庫ありの商品だけを保存する
+    new_only: bool = False  # 新品だけを保存する
+    jan_match_only: bool = False  # 商品情報に検索したJANコードが含まれる商品だけを保存する
+
+
+class ECSearchError(Exception):
+    """
+    ECサイトの検索APIの呼び出しに失敗した
+
+    商品が見つからなかった場合（空のリスト）と区別して、失敗したサイトの出品を
+    価格更新で無効にしないようにする
+    """
+
+
 # 基底コネクタクラス
 class ECConnector(ABC):
     """ECサイト接続の基底クラス"""
@@ -60,6 +138,7 @@ class ECConnector(ABC):
             ec_site_code: ECサイトのコード (amazon, rakuten, yahoo など)
         """
         self.ec_site_code = ec_site_code
+        self.fetch_policy = FetchPolicy()
     
     @abstractmethod
     def fetch_price(self, url: str) -> Optional[ProductData]:
@@ -73,7 +152,11 @@ class ECConnector(ABC):
     
     @abstractmethod
     def search_by_jan_code(self, jan_code: str) -> List[ProductData]:
-        """JANコードから商品を検索する"""
+        """
+        JANコードから商品を検索する
+
+        見つからなかった場合は空のリストを返し、APIの呼び出しに失敗した場合は ECSearchError を送出する
+        """
         pass
         
     @abstractmethod
@@ -81,8 +164,15 @@ class ECConnector(ABC):
         """商品URLから商品IDを抽出する"""
         pass
 
+    def canonical_item_id(self, url: str) -> Optional[str]:
+        """
+        商品URLから、出品情報の ec_product_id と同じ形式の商品IDを返す
+        URL → JANコードの対応表のキーに使う（抽出できない場合はNone）
+        """
+        return self._extract_product_id(url)
+
     def _find_jan_codes(self, data: Any) -> Set[str]:
-        """JANコードを抽出する"""
+        """JANコードを抽出する（チェックデジットが正しいものだけ）"""
         jan_codes: Set[str] = set()
 
         if isinstance(data, dict):
@@ -93,24 +183,77 @@ class ECConnector(ABC):
             for item in data:
                 jan_codes.update(self._find_jan_codes(item))
 
+        elif hasattr(data, '__struct_fields__'):
+            # スキーマでデコードした商品情報（msgspec.Struct）
+            for name in data.__struct_fields__:
+                jan_codes.update(self._find_jan_codes(getattr(data, name)))
+
         elif isinstance(data, str) or isinstance(data, int):
-            jan_codes.update(re.findall(r'\b\d{13}\b', str(data)))
+            jan_codes.update(
+                code for code in _JAN_CODE_PATTERN.findall(str(data)) if is_valid_jan_code(code)
+            )
 
         return jan_codes
     
+    def _collect_offers(self, fetch_page: Callable[[int], Tuple[Sequence[Any], bool]], jan_code: str) -> List[Any]:
+        """
+        fetch_policy に従って検索結果のページを順に取得し、条件に合う商品（整形前）を返す
+
+        Args:
+            fetch_page: ページ番号（1から）を受け取り、(商品の一覧, 次のページがあるか) を返す関数
+            jan_code: 検索したJANコード
+        """
+        policy = self.fetch_policy
+        offers: List[Any] = []
+        for page in range(1, max(policy.max_pages, 1) + 1):
+            items, has_next = fetch_page(page)
+            offers.extend(item for item in items if self._accepts_offer(item, jan_code))
+            if not has_next or (policy.enough_offers and len(offers) >= policy.enough_offers):
+                break
+        return offers
+
+    def _accepts_offer(self, item: Any, jan_code: str) -> bool:
+        """商品が fetch_policy の条件に合うか"""
+        policy = self.fetch_policy
+        if not self._has_price(item):
+            return False
+        if policy.in_stock_only and not self._is_in_stock(item):
+            return False
+        if policy.new_only and not self._is_new(item):
+            return False
+        if policy.jan_match_only and jan_code not in self._item_jan_codes(item):
+            return False
+        return True
+
+    def _has_price(self, item: Any) -> bool:
+        """価格があるか（価格がない商品は0円として保存しないよう除く）"""
+        return True
+
+    def _is_in_stock(self, item: Any) -> bool:
+        """在庫ありか（判定できないECサイトは在庫ありとみなす）"""
+        return True
+
+    def _is_new(self, item: Any) -> bool:
+        """新品か（判定できないECサイトは新品とみなす）"""
+        return True
+
+    def _item_jan_codes(self, item: Any) -> Set[str]:
+        """商品情報に含まれるJANコード"""
+        return self._find_jan_codes(item)
+
     def _get_nested_attr_or_key(self, obj: Any, path: str, default: Any = None) -> Any:
         """
         ネストされた属性・辞書キーを安全に取得する。
         例: 'offers.listings[0].price.amount'
         """
         try:
-            for part in path.split('.'):
-                if '[' in part and ']' in part:
-                    name, index = part.rstrip(']').split('[')
-                    obj = self._resolve_attr_or_key(obj, name)
-                    obj = obj[int(index)]
+            for step in compile_path(path):
+                if type(step) is int:
+                    obj = obj[step]
+                elif isinstance(obj, dict):
+                    obj = obj[step]  # ← KeyErrorが起こるのが望ましい
                 else:
-                    obj = self._resolve_attr_or_key(obj, part)
+                    obj = getattr(obj, step)  # ← AttributeErrorが起こるのが望ましい
             return obj
         except (AttributeError, IndexError, KeyError, TypeError, ValueError):
             return default
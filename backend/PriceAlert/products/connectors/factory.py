@@ -1,12 +1,21 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.conf import settings
-from typing import Dict, List, Optional, Union, Any, Tuple, Type, Set
+from django.db import close_old_connections, connection
+from PriceAlert.singleflight import SingleFlight
+from typing import Callable, Dict, Iterable, List, Optional, Union, Any, Tuple, Type, Set
 from collections import Counter
+from ..cache import jan_search_cache
+from ..ec_sites import ec_site_registry
 from ..models import ECSite
+from ..services.item_jan_service import ItemJANService
 from .base import ECConnector, ProductData
 
 logger = logging.getLogger(__name__)
 
+# 同じ (ECサイト, 操作, キー) の外部API呼び出しを、プロセス内・プロセス間で1回にまとめる
+connector_flight: SingleFlight[Any] = SingleFlight('connector')
+
 class ECConnectorFactory:
     """ECサイトコネクタのファクトリークラス"""
 
@@ -58,9 +67,21 @@ class ECConnectorFactory:
             
             # コネクター取得
             connector = self._get_connector(ec_site_code)
+
+            # 登録済みの商品であれば、外部APIを呼ばずに対応表からJANコードを返す
+            item_id = connector.canonical_item_id(url)
+            if item_id:
+                known = ItemJANService.lookup_many(ec_site_code, [item_id]).get(item_id)
+                if known:
+                    logger.debug('対応表からJANコードを取得しました - ECサイト: %s, 商品ID: %s', ec_site_code, item_id)
+                    return known
             
             # 検索実行
-            jan_codes = connector.search_by_url(url)
+            jan_codes = connector_flight.do(
+                (ec_site_code, 'url', url), lambda: connector.search_by_url(url)
+            )
+            if item_id and jan_codes:
+                ItemJANService.remember_many(ec_site_code, {item_id: jan_codes})
             
             return jan_codes or set()
             
@@ -70,12 +91,35 @@ class ECConnectorFactory:
             # 上位に例外を再送出（オプション）
             raise
     
-    def search_by_jan_code(self, jan_code: str) -> List[Dict[str, Any]]:
-        """JANコードから商品を検索"""
+    def search_by_jan_code(self, jan_code: str, refresh: bool = False,
+                           details: bool = True) -> List[ProductData]:
+        """
+        JANコードから商品を検索
+
+        Args:
+            jan_code: JANコード
+            refresh: Trueの場合はキャッシュを使わずに検索する（結果はキャッシュに保存する）
+            details: Falseの場合は商品説明を除く（価格更新など、商品を新規作成しない場合）
+        """
+        product_infos, _ = self.search_sites_by_jan_code(jan_code, refresh, details)
+        return product_infos
+
+    def search_sites_by_jan_code(self, jan_code: str, refresh: bool = False,
+                                 details: bool = True) -> Tuple[List[ProductData], Set[str]]:
+        """
+        JANコードから商品を検索し、検索に成功したECサイトのコードも返す
+
+        検索に失敗したECサイトは、商品が見つからなかったECサイトと区別できるよう
+        成功したECサイトに含めない（引数は search_by_jan_code と同じ）
+
+        Returns:
+            Tuple[List[ProductData], Set[str]]: 検索結果と、検索に成功したECサイトのコード
+        """
         logger.debug('JANコード検索を開始します - JANコード: %s', jan_code)
         
         try:
-            all_product_infos: List[Dict[str, Any]] = []
+            all_product_infos: List[ProductData] = []
+            answered_sites: Set[str] = set()
             
             # 各ECサイトで検索
             for ec_site_code in self._site_urls_patterns.keys():
@@ -86,12 +130,18 @@ class ECConnectorFactory:
                     connector = self._get_connector(ec_site_code)
                     
                     # 検索実行
-                    product_data_list = connector.search_by_jan_code(jan_code)
+                    product_data_list = self._search_site_by_jan_code(
+                        ec_site_code, connector, jan_code, refresh
+                    )
+                    answered_sites.add(ec_site_code)
                     
-                    # 結果がある場合のみマージ (dictに変換)
+                    # 結果がある場合のみマージ
                     if product_data_list:
-                        product_infos = [data.to_dict() for data in product_data_list]
-                        all_product_infos.extend(product_infos)
+                        if not details:
+                            product_data_list = [
+                                data.without_details() for data in product_data_list
+                            ]
+                        all_product_infos.extend(product_data_list)
                         
                 except Exception as e:
                     # 個別のコネクターエラーは全体の検索を中断しない
@@ -99,20 +149,198 @@ class ECConnectorFactory:
                         'ECサイト個別の検索でエラーが発生しました - JANコード: %s, ECサイト: %s, エラー: %s', 
                         jan_code, ec_site_code, str(e))
                     
-            site_counts = Counter(dict['ec_site'] for dict in all_product_infos if dict.get('ec_site') in {'amazon', 'rakuten', 'yahoo'})
+            site_counts = Counter(
+                data.ec_site for data in all_product_infos
+                if data.ec_site in {'amazon', 'rakuten', 'yahoo'}
+            )
             logger.info(    
                 f"JANコードから商品が見つかりました - JANコード: {jan_code}, - 結果件数: "
                 f"Amazon {site_counts.get('amazon', 0)}件 "
                 f"楽天 {site_counts.get('rakuten', 0)}件 "
                 f"Yahoo {site_counts.get('yahoo', 0)}件"
             )
-            return all_product_infos
+            return all_product_infos, answered_sites
             
         except Exception as e:
             logger.error('JANコード検索中にエラーが発生しました - JANコード: %s, エラー: %s', 
                         jan_code, str(e), exc_info=True)
             raise
 
+    def search_by_urls(self, urls: Iterable[str], max_workers_per_site: Optional[int] = None
+                       ) -> Dict[str, Union[Set[str], Exception]]:
+        """
+        複数のURLからJANコードを並行して検索する（ECサイトごとに同時実行数を制限）
+
+        Returns:
+            Dict[str, Union[Set[str], Exception]]: URLごとのJANコード（失敗した場合は例外）
+        """
+        results: Dict[str, Union[Set[str], Exception]] = {}
+        connectors: Dict[str, ECConnector] = {}
+        item_ids: Dict[str, Optional[str]] = {}
+        candidates: List[Tuple[str, str]] = []
+        for url in dict.fromkeys(urls):
+            try:
+                ec_site_code = self._identify_ec_site_from_url(url)
+                if ec_site_code not in connectors:
+                    # DBアクセスとコネクターの初期化はスレッドに渡す前に済ませる
+                    self._create_ECSite(ec_site_code)
+                    connectors[ec_site_code] = self._get_connector(ec_site_code)
+                item_ids[url] = connectors[ec_site_code].canonical_item_id(url)
+                candidates.append((url, ec_site_code))
+            except Exception as e:
+                results[url] = e
+
+        # 登録済みの商品は、外部APIを呼ばずに対応表からJANコードを返す
+        known: Dict[str, Dict[str, Set[str]]] = {
+            ec_site_code: ItemJANService.lookup_many(ec_site_code, [
+                item_ids[url] for url, code in candidates if code == ec_site_code and item_ids[url]
+            ])
+            for ec_site_code in connectors
+        }
+        jobs: List[Tuple[str, str]] = []
+        for url, ec_site_code in candidates:
+            jan_codes = known[ec_site_code].get(item_ids[url] or '')
+            if jan_codes:
+                results[url] = jan_codes
+            else:
+                jobs.append((url, ec_site_code))
+
+        def search(url: str, ec_site_code: str) -> Set[str]:
+            return connector_flight.do(
+                (ec_site_code, 'url', url), lambda: connectors[ec_site_code].search_by_url(url)
+            ) or set()
+
+        found: Dict[str, Dict[str, Set[str]]] = {}
+        for (url, ec_site_code), result in self._run_per_site(jobs, search, max_workers_per_site):
+            results[url] = result
+            if item_ids[url] and result and not isinstance(result, Exception):
+                found.setdefault(ec_site_code, {})[item_ids[url]] = result
+        for ec_site_code, jan_codes_by_item in found.items():
+            ItemJANService.remember_many(ec_site_code, jan_codes_by_item)
+        return results
+
+    def search_by_jan_codes(self, jan_codes: Iterable[str],
+                            max_workers_per_site: Optional[int] = None,
+                            on_complete: Optional[Callable[[str, List[ProductData]], None]] = None
+                            ) -> Dict[str, List[ProductData]]:
+        """
+        複数のJANコードを全ECサイトで並行して検索する（ECサイトごとに同時実行数を制限）
+
+        Args:
+            jan_codes: JANコード
+            max_workers_per_site: ECサイトごとの同時実行数（省略時は設定値）
+            on_complete: JANコードごとに全ECサイトの検索が終わったときに呼ばれる関数
+
+        Returns:
+            Dict[str, List[ProductData]]: JANコードごとの検索結果（search_by_jan_codeと同じ形式）
+        """
+        jan_codes = list(dict.fromkeys(jan_codes))
+        connectors: Dict[str, ECConnector] = {}
+        for ec_site_code in self._site_urls_patterns.keys():
+            try:
+                self._create_ECSite(ec_site_code)
+                connectors[ec_site_code] = self._get_connector(ec_site_code)
+            except Exception as e:
+                logger.warning('コネクターの初期化に失敗しました - ECサイト: %s, エラー: %s', ec_site_code, str(e))
+
+        site_results: Dict[Tuple[str, str], List[ProductData]] = {}
+        remaining = {jan_code: len(connectors) for jan_code in jan_codes}
+        results: Dict[str, List[ProductData]] = {jan_code: [] for jan_code in jan_codes}
+
+        def search(jan_code: str, ec_site_code: str) -> List[ProductData]:
+            return self._search_site_by_jan_code(ec_site_code, connectors[ec_site_code], jan_code)
+
+        def merge(jan_code: str) -> None:
+            # 完了順ではなくECサイトの順に並べる
+            results[jan_code] = [
+                info for ec_site_code in connectors
+                for info in site_results.get((jan_code, ec_site_code), [])
+            ]
+            if on_complete:
+                on_complete(jan_code, results[jan_code])
+
+        jobs = [(jan_code, ec_site_code) for jan_code in jan_codes for ec_site_code in connectors]
+        completed = self._run_per_site(jobs, search, max_workers_per_site)
+        for (jan_code, ec_site_code), result in completed:
+            if isinstance(result, Exception):
+                # 個別のコネクターエラーは全体の検索を中断しない
+                logger.warning(
+                    'ECサイト個別の検索でエラーが発生しました - JANコード: %s, ECサイト: %s, エラー: %s',
+                    jan_code, ec_site_code, str(result))
+            else:
+                site_results[(jan_code, ec_site_code)] = result
+            remaining[jan_code] -= 1
+            if remaining[jan_code] == 0:
+                merge(jan_code)
+
+        if not connectors:
+            for jan_code in jan_codes:
+                merge(jan_code)
+        return results
+
+    def _search_site_by_jan_code(self, ec_site_code: str, connector: ECConnector, jan_code: str,
+                                 refresh: bool = False) -> List[ProductData]:
+        """
+        1つのECサイトでJANコード検索する（結果は (ECサイトコード, JANコード) ごとにキャッシュ）
+        見つからなかった結果も短い有効期限でキャッシュする。例外はキャッシュしない
+        """
+        key = (ec_site_code, jan_code)
+        if not refresh:
+            cached = jan_search_cache.get(key)
+            if cached is not None:
+                logger.debug('JANコード検索結果をキャッシュから取得しました - ECサイト: %s, JANコード: %s',
+                             ec_site_code, jan_code)
+                return list(cached)
+
+        def search() -> List[ProductData]:
+            product_data_list = list(connector.search_by_jan_code(jan_code) or [])
+            timeout = None if product_data_list else settings.JAN_SEARCH_NEGATIVE_CACHE_TIMEOUT
+            jan_search_cache.set(key, product_data_list, timeout=timeout)
+            return product_data_list
+
+        # 同時に同じ検索が要求された場合は、実行中の検索の結果を共有する
+        return list(connector_flight.do((ec_site_code, 'jan', jan_code), search))
+
+    def _run_per_site(self, jobs: List[Tuple[str, str]], func: Callable[[str, str], Any],
+                      max_workers_per_site: Optional[int] = None):
+        """
+        (キー, ECサイトコード) ごとに func を並行実行し、完了した順に ((キー, ECサイトコード), 結果) を返す
+        ECサイトごとにスレッドプールを分けて、1つのサイトが遅くても他のサイトの検索を止めない
+        """
+        max_workers = (
+            max_workers_per_site or getattr(settings, 'REGISTRATION_MAX_WORKERS_PER_SITE', 4)
+        )
+        executors = {
+            ec_site_code: ThreadPoolExecutor(
+                max_workers=max_workers, thread_name_prefix=f'ec-search-{ec_site_code}'
+            )
+            for ec_site_code in {ec_site_code for _, ec_site_code in jobs}
+        }
+        def run(key: str, ec_site_code: str) -> Any:
+            # ワーカースレッドは request_finished を受け取らないので、期限切れ・エラーの接続は始める前に捨てる
+            close_old_connections()
+            try:
+                return func(key, ec_site_code)
+            finally:
+                # CONN_MAX_AGE の間は close_old_connections() では閉じられず、スレッドの終了後も残るので、
+                # ジョブごとに必ず閉じる
+                connection.close()
+
+        try:
+            futures = {
+                executors[ec_site_code].submit(run, key, ec_site_code): (key, ec_site_code)
+                for key, ec_site_code in jobs
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = e
+                yield futures[future], result
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True, cancel_futures=True)
+
     def _identify_ec_site_from_url(self, url: str) -> str:
         """URLからECサイトを特定する"""
         for site_code, patterns in self._site_urls_patterns.items():
@@ -134,12 +362,9 @@ class ECConnectorFactory:
 
     def _create_ECSite(self, ec_site_code: str) -> Tuple[ECSite, bool]:
         """ECサイト情報をDBに登録（なければ作成）"""
-        # ECサイトをDBから取得（なければ作成）
-        ec_site, created = ECSite.objects.get_or_create(
-            code=ec_site_code,
-            defaults={
-                'name': self._get_ec_site_name(ec_site_code)
-            }
+        # 登録済みのECサイトはレジストリから返すので、DBにはアクセスしない
+        ec_site, created = ec_site_registry.get_or_create(
+            ec_site_code, self._get_ec_site_name(ec_site_code)
         )
         if created:
             logger.info('新規ECサイトを作成しました: %s', ec_site.name)
@@ -1,4 +1,5 @@
-from .base import ECConnector, ProductData
+from .base import ECConnector, ECSearchError, FetchPolicy, ProductData
+from .schemas import RakutenItem, RakutenSearchResponse, decode_rakuten_search
 from django.conf import settings
 import requests
 import re
@@ -17,6 +18,7 @@ class RakutenConnector(ECConnector):
         self.api_secret = settings.RAKUTEN_API_SECRET
         self.affiliate_id = settings.RAKUTEN_AFFILIATE_ID
         self.request_url = "https://app.rakuten.co.jp/services/api/IchibaItem/Search/20220601"
+        self.fetch_policy = FetchPolicy(**settings.CONNECTOR_FETCH_POLICIES.get("rakuten", {}))
 
     def search_by_url(self, url: str) -> Set[str]:
         """URLから商品を検索する"""
@@ -58,16 +60,20 @@ class RakutenConnector(ECConnector):
         logger.debug(f'楽天: JANコード検索を開始 - JANコード: {jan_code}')
         
         try:
-            # JANコードで検索
-            response = self._search_item(keyword=jan_code)
+            # JANコードで検索（条件に合う商品が揃うまでページを取得）
+            def fetch_page(page: int) -> Tuple[List[RakutenItem], bool]:
+                response = self._search_products(keyword=jan_code, hits=self.fetch_policy.page_size, page=page)
+                return response.items(), response.page < response.pageCount
+
+            offers = self._collect_offers(fetch_page, jan_code)
             
             # 検索結果から商品情報を取得
-            if not response or response.get("count", 0) == 0:
+            if not offers:
                 raise NotFound(f'楽天: JANコードから商品が見つかりませんでした - JANコード: {jan_code}')
             
             result: List[ProductData] = []
-            for item_info in response.get("Items", []):
-                product_data = self._format_product_data(item_info.get("Item", {}), jan_code=jan_code)
+            for item_info in offers:
+                product_data = self._format_product_data(item_info, jan_code=jan_code)
                 result.append(product_data)
             
             return result
@@ -77,18 +83,27 @@ class RakutenConnector(ECConnector):
             return []
         except RakutenAPIException as e:
             logger.warning(str(e))
-            return []
+            raise ECSearchError(str(e)) from e
         except Exception as e:
-            logger.error(f'楽天: JANコード検索中に予期せぬエラーが発生しました - JANコード: {jan_code}, エラー: {str(e)}', exc_info=True)
-            return []
+            logger.error(f'楽天: JANコード検索中に予期せぬエラーが発生しました - JANコード: {jan_code}, '
+                         f'エラー: {str(e)}', exc_info=True)
+            raise ECSearchError(str(e)) from e
     
     def _search_item(self, **kwargs: Any) -> Dict[str, Any]:
-        """楽天APIで商品検索を実行"""
+        """楽天APIで商品検索を実行（レスポンス全体を返す）"""
+        return cast(Dict[str, Any], self._request_search(**kwargs).json())
+
+    def _search_products(self, **kwargs: Any) -> RakutenSearchResponse:
+        """楽天APIで商品検索を実行（商品情報の整形に使う項目だけをデコードする）"""
+        return decode_rakuten_search(self._request_search(**kwargs).content)
+
+    def _request_search(self, **kwargs: Any) -> requests.Response:
+        """楽天の商品検索APIを呼び出す"""
         params: Dict[str, Any] = {
             "applicationId": self.api_key,
             # "affiliateId": self.affiliate_id,
             "format": "json",
-            "format_version": "2",
+            # formatVersion は指定しない（Items は {"Item": {...}} の配列で返る）
             "hits": 10,
             "sort": "+itemPrice",
         }
@@ -98,7 +113,7 @@ class RakutenConnector(ECConnector):
         if response.status_code != 200:
             raise RakutenAPIException(f'楽天APIからエラー応答を受け取りました: {response.status_code}')
         
-        return cast(Dict[str, Any], response.json())
+        return response
     
     def fetch_price(self, url: str) -> Optional[ProductData]:
         """商品URLから価格情報のみ取得する"""
@@ -114,32 +129,55 @@ class RakutenConnector(ECConnector):
             return shop_code, item_code
         return None, None
     
+    def canonical_item_id(self, url: str) -> Optional[str]:
+        """商品URLから「店舗コード:商品コード」（APIの商品コードと同じ形式）を返す"""
+        shop_code, item_code = self._extract_item_code_and_shop_code(url)
+        if not shop_code or not item_code:
+            return None
+        return f'{shop_code}:{item_code}'
+
     def _extract_product_id(self, url: str) -> Optional[str]:
         """商品URLから商品IDを抽出する"""
         shop_code, item_code = self._extract_item_code_and_shop_code(url)
         return item_code
     
-    def _format_product_data(self, item_info: Dict[str, Any], **kwargs) -> ProductData:
+    def _has_price(self, item: Any) -> bool:
+        """価格があるか"""
+        return bool(self._get_nested_attr_or_key(item, 'itemPrice'))
+
+    def _is_in_stock(self, item: Any) -> bool:
+        """在庫ありか（availability: 1=在庫あり, 0=在庫なし。返さない場合は在庫ありとみなす）"""
+        return self._get_nested_attr_or_key(item, 'availability', 1) != 0
+
+    def _is_new(self, item: Any) -> bool:
+        """新品か（楽天は商品の状態を返さないので、商品名に「中古」を含まないものを新品とみなす）"""
+        return '中古' not in (self._get_nested_attr_or_key(item, 'itemName', "") or "")
+
+    def _format_product_data(self, item_info: Any, **kwargs) -> ProductData:
         """商品情報を整形する共通メソッド"""
         # JANコードの処理
         jan_code = kwargs.get('jan_code') # jan_code: str | None
         
         # ProductDataオブジェクト作成
         return ProductData(
-            name=self._get_nested_attr_or_key(item_info, 'itemName', ""),
-            description=self._get_nested_attr_or_key(item_info, 'itemCaption', ""),
-            image_url=self._get_nested_attr_or_key(item_info, 'mediumImageUrls[0].imageUrl', ""),
-            manufacturer=self._get_nested_attr_or_key(item_info, 'shopName', ""),
+            name=self._get_nested_attr_or_key(item_info, 'itemName', "") or "",
+            description=self._get_nested_attr_or_key(item_info, 'itemCaption', "") or "",
+            image_url=(
+                self._get_nested_attr_or_key(item_info, 'mediumImageUrls[0].imageUrl', "") or ""
+            ),
+            manufacturer=self._get_nested_attr_or_key(item_info, 'shopName', "") or "",
             model_number="",
             jan_code=jan_code,
-            price=int(self._get_nested_attr_or_key(item_info, 'itemPrice', 0)),
-            points=int(self._get_nested_attr_or_key(item_info, 'itemPoints', 0)),
-            effective_price=int(self._get_nested_attr_or_key(item_info, 'itemPrice', 0)),
+            price=int(self._get_nested_attr_or_key(item_info, 'itemPrice', 0) or 0),
+            points=int(self._get_nested_attr_or_key(item_info, 'itemPoints', 0) or 0),
+            effective_price=int(self._get_nested_attr_or_key(item_info, 'itemPrice', 0) or 0),
             shipping_fee=0,
-            condition=self._get_nested_attr_or_key(item_info, 'itemCondition.value', "").lower(),
-            seller_name=self._get_nested_attr_or_key(item_info, 'shopName', ""),
-            ec_product_id=self._get_nested_attr_or_key(item_info, 'itemCode', ""),
-            product_url=self._get_nested_attr_or_key(item_info, 'itemUrl', ""),
+            condition=(
+                self._get_nested_attr_or_key(item_info, 'itemCondition.value', "") or ""
+            ).lower(),
+            seller_name=self._get_nested_attr_or_key(item_info, 'shopName', "") or "",
+            ec_product_id=self._get_nested_attr_or_key(item_info, 'itemCode', "") or "",
+            product_url=self._get_nested_attr_or_key(item_info, 'itemUrl', "") or "",
             affiliate_url="",
             # 'affiliate_url': self._get_nested_attr(item_info, 'affiliateUrl', ""),
             ec_site='rakuten'
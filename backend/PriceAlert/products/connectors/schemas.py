@@ -0,0 +1,154 @@
+"""
+ECサイトAPIのレスポンスのうち、商品情報の整形（_format_product_data）と
+取得方針（FetchPolicy）の判定で使う項目だけを定義したスキーマ
+
+msgspecでデコードすると、スキーマにない項目（長い商品説明のHTML、レビュー、配送情報など）は
+オブジェクトを作らずに読み飛ばすので、CPU時間とメモリを抑えられる。
+Structは属性でアクセスするので、_get_nested_attr_or_key のパスはそのまま使える
+
+URL検索はレスポンス全体からJANコードを探すので、これらのスキーマは使わない
+
+APIは項目の型が揃っていないことがある（数値が文字列、値がnullなど）ので、
+数値・真偽値の文字列は strict=False で変換し、スカラー項目はすべてnullを許す。
+それでもデコードできない商品があるページは、商品ごとにデコードし直してその商品だけを除く
+"""
+import logging
+from typing import List, Optional, TypeVar
+
+import msgspec
+
+logger = logging.getLogger(__name__)
+
+
+# 楽天市場 商品検索API（formatVersion=1: Items は {"Item": {...}} の配列、画像は {"imageUrl": ...} の配列）
+class RakutenImage(msgspec.Struct):
+    imageUrl: Optional[str] = ""
+
+
+class RakutenItem(msgspec.Struct):
+    itemName: Optional[str] = ""
+    catchcopy: Optional[str] = ""
+    itemCaption: Optional[str] = ""
+    itemCode: Optional[str] = ""
+    itemPrice: Optional[int] = None
+    itemPoints: Optional[int] = 0
+    itemUrl: Optional[str] = ""
+    shopName: Optional[str] = ""
+    availability: Optional[int] = 1
+    mediumImageUrls: List[RakutenImage] = []
+
+
+class RakutenItemEntry(msgspec.Struct):
+    Item: Optional[RakutenItem] = None
+
+
+class RakutenSearchResponse(msgspec.Struct):
+    count: int = 0
+    page: int = 1
+    pageCount: int = 0
+    Items: List[RakutenItemEntry] = []
+
+    def items(self) -> List[RakutenItem]:
+        """商品情報（Items の各要素の Item）"""
+        return [entry.Item for entry in self.Items if entry.Item is not None]
+
+
+# Yahoo!ショッピング 商品検索API（v3）
+class YahooImage(msgspec.Struct):
+    medium: Optional[str] = None
+
+
+class YahooBrand(msgspec.Struct):
+    name: Optional[str] = None
+
+
+class YahooPoint(msgspec.Struct):
+    amount: Optional[int] = 0
+
+
+class YahooSeller(msgspec.Struct):
+    name: Optional[str] = ""
+
+
+class YahooHit(msgspec.Struct):
+    name: Optional[str] = ""
+    description: Optional[str] = ""
+    code: Optional[str] = ""
+    url: Optional[str] = ""
+    condition: Optional[str] = ""
+    inStock: Optional[bool] = True
+    janCode: Optional[str] = None
+    price: Optional[int] = None
+    image: Optional[YahooImage] = None
+    brand: Optional[YahooBrand] = None
+    point: Optional[YahooPoint] = None
+    seller: Optional[YahooSeller] = None
+
+
+class YahooSearchResponse(msgspec.Struct):
+    totalResultsAvailable: int = 0
+    totalResultsReturned: int = 0
+    firstResultsPosition: int = 1
+    hits: List[YahooHit] = []
+
+
+class _RakutenSearchPage(msgspec.Struct):
+    count: int = 0
+    page: int = 1
+    pageCount: int = 0
+    Items: List[msgspec.Raw] = []
+
+
+class _YahooSearchPage(msgspec.Struct):
+    totalResultsAvailable: int = 0
+    totalResultsReturned: int = 0
+    firstResultsPosition: int = 1
+    hits: List[msgspec.Raw] = []
+
+
+# Decoderは型情報の解析結果を保持するので、モジュールで一度だけ作って使い回す
+rakuten_search_decoder = msgspec.json.Decoder(RakutenSearchResponse, strict=False)
+yahoo_search_decoder = msgspec.json.Decoder(YahooSearchResponse, strict=False)
+_rakuten_page_decoder = msgspec.json.Decoder(_RakutenSearchPage, strict=False)
+_yahoo_page_decoder = msgspec.json.Decoder(_YahooSearchPage, strict=False)
+_rakuten_item_decoder = msgspec.json.Decoder(RakutenItemEntry, strict=False)
+_yahoo_hit_decoder = msgspec.json.Decoder(YahooHit, strict=False)
+
+T = TypeVar('T')
+
+
+def _decode_items(raw_items: List[msgspec.Raw], decoder: msgspec.json.Decoder,
+                  name: str) -> List[T]:
+    items = []
+    for raw in raw_items:
+        try:
+            items.append(decoder.decode(raw))
+        except msgspec.ValidationError as e:
+            logger.warning(f'{name}: デコードできない商品を除きました - エラー: {e}')
+    return items
+
+
+def decode_rakuten_search(content: bytes) -> RakutenSearchResponse:
+    """楽天の検索結果をデコードする（デコードできない商品は除く）"""
+    try:
+        return rakuten_search_decoder.decode(content)
+    except msgspec.ValidationError:
+        page = _rakuten_page_decoder.decode(content)
+    return RakutenSearchResponse(
+        count=page.count, page=page.page, pageCount=page.pageCount,
+        Items=_decode_items(page.Items, _rakuten_item_decoder, '楽天'),
+    )
+
+
+def decode_yahoo_search(content: bytes) -> YahooSearchResponse:
+    """Yahooの検索結果をデコードする（デコードできない商品は除く）"""
+    try:
+        return yahoo_search_decoder.decode(content)
+    except msgspec.ValidationError:
+        page = _yahoo_page_decoder.decode(content)
+    return YahooSearchResponse(
+        totalResultsAvailable=page.totalResultsAvailable,
+        totalResultsReturned=page.totalResultsReturned,
+        firstResultsPosition=page.firstResultsPosition,
+        hits=_decode_items(page.hits, _yahoo_hit_decoder, 'Yahoo'),
+    )
@@ -1,4 +1,5 @@
-from .base import ECConnector, ProductData
+from .base import ECConnector, ECSearchError, FetchPolicy, ProductData
+from .schemas import YahooHit, YahooSearchResponse, decode_yahoo_search
 import logging
 import re
 import requests
@@ -15,6 +16,7 @@ class YahooConnector(ECConnector):
         self.affiliate_id = settings.YAHOO_AFFILIATE_ID
         self.user_rank = "guest"
         self.request_url = "https://shopping.yahooapis.jp/ShoppingWebService/V3/itemSearch"
+        self.fetch_policy = FetchPolicy(**settings.CONNECTOR_FETCH_POLICIES.get("yahoo", {}))
     
     def search_by_url(self, url: str) -> Set[str]:
         """URLから商品を検索する"""
@@ -57,31 +59,49 @@ class YahooConnector(ECConnector):
         logger.debug('Yahoo: JANコード検索を開始 - JANコード: %s', jan_code)
         
         try:
-            # JANコードで検索
-            response = self._search_item(jan_code=jan_code)
+            # JANコードで検索（条件に合う商品が揃うまでページを取得）
+            page_size = self.fetch_policy.page_size
+
+            def fetch_page(page: int) -> Tuple[List[YahooHit], bool]:
+                response = self._search_products(jan_code=jan_code, results=page_size, start=(page - 1) * page_size + 1)
+                if response is None:
+                    raise ECSearchError(f'Yahoo: 商品検索APIがエラー応答を返しました - JANコード: {jan_code}')
+                last_position = response.firstResultsPosition + response.totalResultsReturned - 1
+                return response.hits, response.totalResultsReturned > 0 and last_position < response.totalResultsAvailable
+
+            offers = self._collect_offers(fetch_page, jan_code)
             
             # 検索結果から商品情報を取得
-            if not response or response.get("totalResultsReturned", 0) == 0:
+            if not offers:
                 # アイテムが見つからない：検索を続行させるためエラーハンドリングしない
                 return []
             
             result: List[ProductData] = []
-            for item in response.get("hits", []):
+            for item in offers:
                 product_data = self._format_product_data(item, jan_code=jan_code)
                 result.append(product_data)
             
             return result
             
+        except ECSearchError:
+            raise
         except Exception as e:
             logger.error('Yahoo: JANコード検索中に予期せぬエラーが発生しました - JANコード: %s, エラー: %s', 
                         jan_code, str(e), exc_info=True)
-            return []
+            raise ECSearchError(str(e)) from e
     
     def fetch_price(self, url: str) -> Optional[ProductData]:
         """商品URLから価格情報のみ取得する"""
         # 未実装のため、URLから商品検索して最初の結果を返す
         return None
     
+    def canonical_item_id(self, url: str) -> Optional[str]:
+        """商品URLから「店舗コード_商品コード」（APIの商品コードと同じ形式）を返す"""
+        shop_code, item_code = self._extract_item_code_and_shop_code(url)
+        if not shop_code or not item_code:
+            return None
+        return f'{shop_code}_{item_code}'
+
     def _extract_product_id(self, url: str) -> Optional[str]:
         """商品URLから商品IDを抽出する"""
         # 例: https://store.shopping.yahoo.co.jp/shop/product_id.html
@@ -89,7 +109,21 @@ class YahooConnector(ECConnector):
         return item_code
     
     def _search_item(self, **kwargs: Any) -> Dict[str, Any]:
-        """YahooAPIで商品検索を実行"""
+        """YahooAPIで商品検索を実行（レスポンス全体を返す）"""
+        response = self._request_search(**kwargs)
+        if response is None:
+            return {}
+        return cast(Dict[str, Any], response.json())
+
+    def _search_products(self, **kwargs: Any) -> Optional[YahooSearchResponse]:
+        """YahooAPIで商品検索を実行（商品情報の整形に使う項目だけをデコードする）"""
+        response = self._request_search(**kwargs)
+        if response is None:
+            return None
+        return decode_yahoo_search(response.content)
+
+    def _request_search(self, **kwargs: Any) -> Optional[requests.Response]:
+        """Yahooの商品検索APIを呼び出す（エラー応答の場合はNone）"""
         params: Dict[str, Any] = {
             "appid": self.api_key,
             # "affiliateId": self.affiliate_id,
@@ -104,9 +138,9 @@ class YahooConnector(ECConnector):
         if response.status_code != 200:
             logger.error('YahooAPI呼び出しエラー - ステータスコード: %d, レスポンス: %s', 
                         response.status_code, response.text)
-            return {}
+            return None
         
-        return cast(Dict[str, Any], response.json())
+        return response
     
     def _extract_item_code_and_shop_code(self, url: str) -> Tuple[Optional[str], Optional[str]]:
         """商品URLから商品コードと店舗コードを抽出する"""
@@ -117,7 +151,29 @@ class YahooConnector(ECConnector):
             return shop_code, item_code
         return None, None
     
-    def _format_product_data(self, item: Dict[str, Any], **kwargs) -> ProductData:
+    def _has_price(self, item: Any) -> bool:
+        """価格があるか"""
+        return bool(self._get_nested_attr_or_key(item, 'price'))
+
+    def _is_in_stock(self, item: Any) -> bool:
+        """在庫ありか（返さない場合は在庫ありとみなす）"""
+        return self._get_nested_attr_or_key(item, 'inStock', True) is not False
+
+    def _is_new(self, item: Any) -> bool:
+        """新品か（condition: new / used）"""
+        return self._get_nested_attr_or_key(item, 'condition', "") != "used"
+
+    def _item_jan_codes(self, item: Any) -> Set[str]:
+        """商品情報に含まれるJANコード（janCode、なければ商品名・説明から探す）"""
+        jan_code = self._get_nested_attr_or_key(item, 'janCode', "")
+        if jan_code:
+            return {jan_code}
+        return self._find_jan_codes([
+            self._get_nested_attr_or_key(item, 'name', ""),
+            self._get_nested_attr_or_key(item, 'description', ""),
+        ])
+
+    def _format_product_data(self, item: Any, **kwargs) -> ProductData:
         """商品情報を整形する共通メソッド"""
         # JANコードの処理
         jan_code = kwargs.get('jan_code')
@@ -126,21 +182,21 @@ class YahooConnector(ECConnector):
         
         # ProductDataオブジェクト作成
         return ProductData(
-            name=self._get_nested_attr_or_key(item, 'name', ""),
-            description=self._get_nested_attr_or_key(item, 'description', ""),
-            image_url=self._get_nested_attr_or_key(item, 'image.medium', ""),
-            manufacturer=self._get_nested_attr_or_key(item, 'brand.name', ""),
+            name=self._get_nested_attr_or_key(item, 'name', "") or "",
+            description=self._get_nested_attr_or_key(item, 'description', "") or "",
+            image_url=self._get_nested_attr_or_key(item, 'image.medium', "") or "",
+            manufacturer=self._get_nested_attr_or_key(item, 'brand.name', "") or "",
             model_number="",
             jan_code=jan_code,
-            price=int(self._get_nested_attr_or_key(item, 'price', 0)),
-            points=int(self._get_nested_attr_or_key(item, 'point.amount', 0)),
-            effective_price=int(self._get_nested_attr_or_key(item, 'price', 0)),
+            price=int(self._get_nested_attr_or_key(item, 'price', 0) or 0),
+            points=int(self._get_nested_attr_or_key(item, 'point.amount', 0) or 0),
+            effective_price=int(self._get_nested_attr_or_key(item, 'price', 0) or 0),
             shipping_fee=0,
             # 'shipping_fee': self._get_nested_attr_or_key(item, 'shipping.name', 0),
-            condition=self._get_nested_attr_or_key(item, 'condition', "").lower(),
-            seller_name=self._get_nested_attr_or_key(item, 'seller.name', ""),
-            ec_product_id=self._get_nested_attr_or_key(item, 'code', ""),
-            product_url=self._get_nested_attr_or_key(item, 'url', ""),
+            condition=(self._get_nested_attr_or_key(item, 'condition', "") or "").lower(),
+            seller_name=self._get_nested_attr_or_key(item, 'seller.name', "") or "",
+            ec_product_id=self._get_nested_attr_or_key(item, 'code', "") or "",
+            product_url=self._get_nested_attr_or_key(item, 'url', "") or "",
             affiliate_url="",
             # 'affiliate_url': self._get_nested_attr(item, 'affiliateUrl', ""),
             ec_site='yahoo'
@@ -0,0 +1,113 @@
+"""
+ECサイト（ECSite）のプロセス内レジストリ
+
+ECサイトの行はほとんど変わらないので、プロセスごとに一度だけ読み込んで使い回す。
+管理画面などでECサイトを変更すると、シグナルでバージョン（キャッシュ上の共有キー）を進め、
+他のプロセスも check_interval 秒以内に読み込み直す
+"""
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import ECSite
+
+logger = logging.getLogger(__name__)
+
+_VERSION_KEY = 'ec_sites:version'
+
+
+class ECSiteRegistry:
+    """ECサイトコード → ECSite のレジストリ"""
+
+    def __init__(self, check_interval: float = 60.0, alias: str = 'default') -> None:
+        """
+        Args:
+            check_interval: 共有バージョンを確認する間隔（秒）
+            alias: 共有バージョンを置くキャッシュのエイリアス
+        """
+        self.check_interval = check_interval
+        self.alias = alias
+        self._lock = threading.Lock()
+        self._sites: Dict[str, ECSite] = {}
+        self._loaded = False
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+
+    def get(self, code: str) -> Optional[ECSite]:
+        """ECサイトを返す（存在しなければNone）"""
+        return self.get_many([code]).get(code)
+
+    def get_many(self, codes: Iterable[str]) -> Dict[str, ECSite]:
+        """
+        ECサイトをまとめて返す（存在しないコードは含まない）
+        レジストリにないコードがあれば、他のプロセスで作成された可能性があるので一度だけ読み込み直す
+        """
+        codes = set(codes)
+        self._ensure_fresh()
+        sites = self._sites
+        if not codes <= sites.keys():
+            sites = self.load()
+        return {code: sites[code] for code in codes if code in sites}
+
+    def get_or_create(self, code: str, name: str) -> Tuple[ECSite, bool]:
+        """ECサイトを返す（なければ作成）"""
+        ec_site = self.get(code)
+        if ec_site is not None:
+            return ec_site, False
+
+        ec_site, created = ECSite.objects.get_or_create(code=code, defaults={'name': name})
+        with self._lock:
+            self._sites = {**self._sites, code: ec_site}
+        return ec_site, created
+
+    def load(self) -> Dict[str, ECSite]:
+        """DBからすべてのECサイトを読み込む"""
+        version = self._read_version()
+        sites = {ec_site.code: ec_site for ec_site in ECSite.objects.all()}
+        with self._lock:
+            self._sites = sites
+            self._loaded = True
+            self._version = version
+            self._checked_at = time.monotonic()
+        logger.debug(f'ECサイトを読み込みました - 件数: {len(sites)}')
+        return sites
+
+    def invalidate(self) -> None:
+        """このプロセスのレジストリを破棄し、共有バージョンを進めて他のプロセスにも読み込み直させる"""
+        with self._lock:
+            self._loaded = False
+        try:
+            caches[self.alias].set(_VERSION_KEY, time.time_ns(), timeout=None)
+        except Exception as e:
+            logger.warning(f'ECサイトのバージョンの更新に失敗しました - エラー: {str(e)}')
+
+    def _ensure_fresh(self) -> None:
+        if not self._loaded:
+            self.load()
+            return
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return
+        version = self._read_version()
+        if version != self._version:
+            self.load()
+        else:
+            self._checked_at = time.monotonic()
+
+    def _read_version(self) -> Optional[int]:
+        try:
+            return caches[self.alias].get(_VERSION_KEY)
+        except Exception as e:
+            logger.warning(f'ECサイトのバージョンの取得に失敗しました - エラー: {str(e)}')
+            return None
+
+
+ec_site_registry = ECSiteRegistry(check_interval=settings.EC_SITE_REGISTRY_CHECK_INTERVAL)
+
+
+def invalidate_ec_sites(sender, **kwargs) -> None:
+    """ECSiteの保存・削除時に呼ばれるシグナルハンドラー"""
+    ec_site_registry.invalidate()
@@ -0,0 +1,206 @@
+"""
+価格履歴の列指向エクスポート（Parquet / Arrow IPC）
+
+価格履歴を出品・ECサイト・商品と結合して、captured_at の範囲ごとに読み出し、
+一定行数ごとのRecordBatchとして書き出す。メモリ使用量は batch_size 行分で一定になる
+
+ASGI（UvicornWorker）では同期イテレータのStreamingHttpResponseはすべて読み込んでから
+送られるので、APIでは astream_price_history（非同期イテレータ）を使う
+"""
+import io
+import logging
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+from asgiref.sync import sync_to_async
+from django.db.models import Max, Min
+
+from .models import PriceHistory
+
+logger = logging.getLogger(__name__)
+
+FORMAT_PARQUET = 'parquet'
+FORMAT_ARROW = 'arrow'
+FORMATS = (FORMAT_PARQUET, FORMAT_ARROW)
+
+CONTENT_TYPES = {
+    FORMAT_PARQUET: 'application/vnd.apache.parquet',
+    FORMAT_ARROW: 'application/vnd.apache.arrow.stream',
+}
+
+EXTENSIONS = {
+    FORMAT_PARQUET: 'parquet',
+    FORMAT_ARROW: 'arrows',
+}
+
+# (列名, 型, values_listのフィールド)
+_COLUMNS = (
+    ('price_history_id', pa.int64(), 'id'),
+    ('captured_at', pa.timestamp('us', tz='UTC'), 'captured_at'),
+    ('price', pa.int32(), 'price'),
+    ('points', pa.int32(), 'points'),
+    ('effective_price', pa.int32(), 'effective_price'),
+    ('product_on_ec_site_id', pa.int64(), 'product_on_ec_site_id'),
+    ('ec_product_id', pa.string(), 'product_on_ec_site__ec_product_id'),
+    ('seller_name', pa.string(), 'product_on_ec_site__seller_name'),
+    ('ec_site_code', pa.string(), 'product_on_ec_site__ec_site__code'),
+    ('ec_site_name', pa.string(), 'product_on_ec_site__ec_site__name'),
+    ('product_id', pa.int64(), 'product_on_ec_site__product_id'),
+    ('product_name', pa.string(), 'product_on_ec_site__product__name'),
+    ('jan_code', pa.string(), 'product_on_ec_site__product__jan_code'),
+)
+
+SCHEMA = pa.schema([(name, type_) for name, type_, _ in _COLUMNS])
+
+
+def _to_batch(rows: List[tuple]) -> pa.RecordBatch:
+    columns = list(zip(*rows))
+    return pa.RecordBatch.from_arrays(
+        [pa.array(column, type=type_) for column, (_, type_, _) in zip(columns, _COLUMNS)],
+        schema=SCHEMA,
+    )
+
+
+def iter_price_history_batches(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                               chunk: timedelta = timedelta(days=1), batch_size: int = 50000,
+                               using: str = 'default') -> Iterator[pa.RecordBatch]:
+    """
+    価格履歴をRecordBatchとして順に返す
+
+    Args:
+        start: 開始日時（以上、省略時は最古の価格履歴）
+        end: 終了日時（未満、省略時は最新の価格履歴まで）
+        chunk: 1回のクエリで読み出す captured_at の範囲
+        batch_size: 1つのRecordBatchの最大行数
+        using: 読み出すDBのエイリアス（レプリカを指定すると本番DBの負荷を避けられる）
+    """
+    history = PriceHistory.objects.using(using)
+    if start is None or end is None:
+        bounds = history.aggregate(first=Min('captured_at'), last=Max('captured_at'))
+        if bounds['first'] is None:
+            return
+        start = start or bounds['first']
+        end = end or bounds['last'] + timedelta(microseconds=1)
+
+    fields = [field for _, _, field in _COLUMNS]
+    rows: List[tuple] = []
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + chunk, end)
+        queryset = (
+            history.filter(captured_at__gte=chunk_start, captured_at__lt=chunk_end)
+            .order_by('captured_at', 'id')
+            .values_list(*fields)
+        )
+        for row in queryset.iterator(chunk_size=min(batch_size, 10000)):
+            rows.append(row)
+            if len(rows) >= batch_size:
+                yield _to_batch(rows)
+                rows = []
+        chunk_start = chunk_end
+
+    if rows:
+        yield _to_batch(rows)
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    書き込まれたバイト列をためておき、drain() で取り出す出力先
+    Parquetの書き込みはファイル内の位置（tell）を使うので、取り出しても位置は戻さない
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _open_writer(sink, file_format: str, compression: str):
+    if file_format == FORMAT_PARQUET:
+        return pq.ParquetWriter(sink, SCHEMA, compression=compression)
+    if file_format == FORMAT_ARROW:
+        return ipc.new_stream(sink, SCHEMA, options=ipc.IpcWriteOptions(compression=compression))
+    raise ValueError(f'未対応の形式です: {file_format}')
+
+
+def write_price_history(output, file_format: str = FORMAT_PARQUET, compression: str = 'zstd',
+                        **kwargs) -> int:
+    """
+    価格履歴をファイルに書き出す
+
+    Args:
+        output: 出力先のパスまたはファイルオブジェクト
+        file_format: 'parquet' または 'arrow'（Arrow IPCストリーム形式）
+        compression: 圧縮方式
+        **kwargs: iter_price_history_batches に渡す引数
+
+    Returns:
+        int: 書き出した行数
+    """
+    count = 0
+    with _open_writer(output, file_format, compression) as writer:
+        for batch in iter_price_history_batches(**kwargs):
+            writer.write_batch(batch)
+            count += batch.num_rows
+    logger.info(f'価格履歴をエクスポートしました - 形式: {file_format}, 件数: {count}')
+    return count
+
+
+def stream_price_history(file_format: str = FORMAT_PARQUET, compression: str = 'zstd',
+                         **kwargs) -> Iterator[bytes]:
+    """価格履歴を書き出したバイト列を、RecordBatchごとに返す（StreamingHttpResponse用）"""
+    sink = _ChunkSink()
+    count = 0
+    with _open_writer(sink, file_format, compression) as writer:
+        for batch in iter_price_history_batches(**kwargs):
+            writer.write_batch(batch)
+            count += batch.num_rows
+            data = sink.drain()
+            if data:
+                yield data
+    # フッター（Parquet）・終端マーカー（Arrow IPC）
+    data = sink.drain()
+    if data:
+        yield data
+    logger.info(f'価格履歴をストリーミングでエクスポートしました - 形式: {file_format}, 件数: {count}')
+
+
+async def astream_price_history(file_format: str = FORMAT_PARQUET, compression: str = 'zstd',
+                                **kwargs) -> AsyncIterator[bytes]:
+    """
+    stream_price_history の非同期版（ASGIのStreamingHttpResponse用）
+
+    RecordBatch 1つ分ずつ sync_to_async で読み出して書き出すので、メモリ使用量は同期版と同じ。
+    DB接続とサーバーサイドカーソルを同じスレッドで使い続けるよう thread_sensitive で実行する
+    """
+    chunks = stream_price_history(file_format, compression, **kwargs)
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            data = await next_chunk(chunks, None)
+            if data is None:
+                break
+            yield data
+    finally:
+        # クライアントが切断した場合もカーソルを閉じる
+        await sync_to_async(chunks.close, thread_sensitive=True)()
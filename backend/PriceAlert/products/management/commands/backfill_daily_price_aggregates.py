@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from products.models import ProductOnECSite
+from products.services.price_aggregate_service import PriceAggregateService
+
+
+class Command(BaseCommand):
+    help = '既存の価格履歴から日次の価格集計（DailyPriceAggregate）を作成します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=str, default=None,
+                            help='この日付（YYYY-MM-DD）以降だけを作り直す（省略時は全期間）')
+        parser.add_argument('--listing', type=int, action='append', default=None,
+                            help='対象の出品ID（複数指定可、省略時はすべて）')
+        parser.add_argument('--batch-size', type=int, default=100, help='1回に処理する出品数')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_date(options['since'])
+            if since is None:
+                raise CommandError(f'日付の形式が正しくありません: {options["since"]}')
+
+        listing_ids = options['listing'] or list(
+            ProductOnECSite.objects.order_by('id').values_list('id', flat=True)
+        )
+        batch_size = max(options['batch_size'], 1)
+
+        total = 0
+        for i in range(0, len(listing_ids), batch_size):
+            batch = listing_ids[i:i + batch_size]
+            total += PriceAggregateService.rebuild(batch, since=since)
+            self.stdout.write(f'{min(i + batch_size, len(listing_ids))}/{len(listing_ids)}件の出品を処理しました')
+
+        self.stdout.write(self.style.SUCCESS(f'日次集計を{total}件作成しました'))
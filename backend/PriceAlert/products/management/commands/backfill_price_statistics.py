@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from products.models import ProductOnECSite
+from products.services.price_statistics_service import PriceStatisticsService
+
+
+class Command(BaseCommand):
+    help = '既存の価格履歴から価格統計（PriceStatistics）を作成します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listing', type=int, action='append', default=None,
+                            help='対象の出品ID（複数指定可、省略時はすべて）')
+        parser.add_argument('--batch-size', type=int, default=100, help='1回に処理する出品数')
+
+    def handle(self, *args, **options):
+        listing_ids = options['listing'] or list(
+            ProductOnECSite.objects.order_by('id').values_list('id', flat=True)
+        )
+        batch_size = max(options['batch_size'], 1)
+
+        total = 0
+        for i in range(0, len(listing_ids), batch_size):
+            total += PriceStatisticsService.rebuild(listing_ids[i:i + batch_size])
+            self.stdout.write(f'{min(i + batch_size, len(listing_ids))}/{len(listing_ids)}件の出品を処理しました')
+
+        self.stdout.write(self.style.SUCCESS(f'価格統計を{total}件作成しました'))
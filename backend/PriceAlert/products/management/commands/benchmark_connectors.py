@@ -0,0 +1,197 @@
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple, Type
+
+from django.core.management.base import BaseCommand, CommandError
+
+from PriceAlert.benchmarking import BenchmarkResult, measure
+from products.connectors.amazon import AmazonConnector
+from products.connectors.base import ECConnector, ProductData
+from products.connectors.rakuten import RakutenConnector
+from products.connectors.schemas import rakuten_search_decoder, yahoo_search_decoder
+from products.connectors.yahoo import YahooConnector
+
+FIXTURES_DIR = Path(__file__).resolve().parents[2] / 'connectors' / 'fixtures'
+
+
+def _legacy_get_nested_attr_or_key(self: ECConnector, obj: Any, path: str,
+                                   default: Any = None) -> Any:
+    """パスを毎回解析する以前の実装（比較用）"""
+    try:
+        for part in path.split('.'):
+            if '[' in part and ']' in part:
+                name, index = part.rstrip(']').split('[')
+                obj = self._resolve_attr_or_key(obj, name)
+                obj = obj[int(index)]
+            else:
+                obj = self._resolve_attr_or_key(obj, part)
+        return obj
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+        return default
+
+
+_KwargsFor = Callable[[Dict[str, Any]], dict]
+
+
+def _load_items() -> List[Tuple[str, Type[ECConnector], List[Dict[str, Any]], _KwargsFor]]:
+    """記録したAPIレスポンスから (ECサイト, コネクター, 商品, _format_product_dataの引数) を返す"""
+    def load(name: str) -> Dict[str, Any]:
+        with open(FIXTURES_DIR / name, encoding='utf-8') as f:
+            return json.load(f)
+
+    return [
+        ('amazon', AmazonConnector, list(load('amazon_get_items.json')['data'].values()),
+         lambda item: {'asin': item['asin'], 'jan_code': '4901234567894'}),
+        ('rakuten', RakutenConnector,
+         [entry['Item'] for entry in load('rakuten_search.json')['Items']],
+         lambda item: {'jan_code': '4901234567894'}),
+        ('yahoo', YahooConnector, load('yahoo_search.json')['hits'],
+         lambda item: {'jan_code': '4901234567894'}),
+    ]
+
+
+_ItemsOf = Callable[[bytes], list]
+
+
+def _load_pages(page_size: int) -> List[Tuple[str, Type[ECConnector], bytes, _ItemsOf, _ItemsOf]]:
+    """
+    記録したAPIレスポンスの商品を page_size 件に増やしたレスポンスと、
+    そこから商品一覧を取り出す関数（レスポンス全体のデコード用・スキーマ用）を返す
+    """
+    pages = []
+    for ec_site_code, connector_class, name, items_key, full_items, schema_items in (
+        ('rakuten', RakutenConnector, 'rakuten_search.json', 'Items',
+         lambda content: [entry['Item'] for entry in json.loads(content)['Items']],
+         lambda content: rakuten_search_decoder.decode(content).items()),
+        ('yahoo', YahooConnector, 'yahoo_search.json', 'hits',
+         lambda content: json.loads(content)['hits'],
+         lambda content: yahoo_search_decoder.decode(content).hits),
+    ):
+        with open(FIXTURES_DIR / name, encoding='utf-8') as f:
+            recorded = json.load(f)
+        items = recorded[items_key]
+        recorded[items_key] = (items * (page_size // len(items) + 1))[:page_size]
+        content = json.dumps(recorded, ensure_ascii=False).encode('utf-8')
+        pages.append((ec_site_code, connector_class, content, full_items, schema_items))
+    return pages
+
+
+def _build_connector(connector_class: Type[ECConnector], ec_site_code: str) -> ECConnector:
+    """APIキーやクライアントを使わないので、初期化処理を通さずにコネクターを作る"""
+    connector = connector_class.__new__(connector_class)
+    ECConnector.__init__(connector, ec_site_code)
+    return connector
+
+
+def format_items(connector: ECConnector, items: List[Dict[str, Any]],
+                 kwargs_for: _KwargsFor) -> List[ProductData]:
+    return [connector._format_product_data(item, **kwargs_for(item)) for item in items]
+
+
+class Command(BaseCommand):
+    help = 'コネクターのレスポンスのデコードと商品情報の整形（_format_product_data）の処理時間を、記録したAPIレスポンスで計測します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=10000, help='ECサイトごとに整形する商品数')
+        parser.add_argument('--repeat', type=int, default=3, help='計測の繰り返し回数')
+        parser.add_argument('--min-speedup', type=float, default=None,
+                            help='パスの事前解析による速度向上率がこれを下回った場合は失敗とする')
+        parser.add_argument('--page-size', type=int, default=30, help='デコードの計測で使う1レスポンスあたりの商品数')
+        parser.add_argument('--min-decode-speedup', type=float, default=None,
+                            help='スキーマを使ったデコードによる速度向上率がこれを下回った場合は失敗とする')
+
+    def handle(self, *args, **options):
+        repeat = max(options['repeat'], 1)
+        errors = []
+
+        for ec_site_code, connector_class, recorded, kwargs_for in _load_items():
+            items = (recorded * (options['items'] // len(recorded) + 1))[:options['items']]
+            connector = _build_connector(connector_class, ec_site_code)
+
+            legacy_result, legacy_data = self._run(
+                connector, items, kwargs_for, repeat, legacy=True)
+            compiled_result, compiled_data = self._run(
+                connector, items, kwargs_for, repeat, legacy=False)
+
+            if legacy_data != compiled_data:
+                errors.append(f'{ec_site_code}: 整形結果が以前の実装と一致しません')
+
+            count = len(items) * repeat
+            speedup = (legacy_result.elapsed / compiled_result.elapsed
+                       if compiled_result.elapsed > 0 else 0.0)
+            self.stdout.write(self.style.SUCCESS(
+                f'[{ec_site_code}] 商品数: {len(items)}件 x {repeat}回\n'
+                f'  以前の実装: {legacy_result.per_second(count):,.0f}件/秒\n'
+                f'  事前解析: {compiled_result.per_second(count):,.0f}件/秒\n'
+                f'  速度向上: {speedup:.2f}倍'
+            ))
+
+            # 回帰ゲート
+            min_speedup = options['min_speedup']
+            if min_speedup is not None and speedup < min_speedup:
+                errors.append(f'{ec_site_code}: 速度向上率が下限を下回りました: {speedup:.2f} < {min_speedup}')
+
+        errors.extend(self._benchmark_decoding(options, repeat))
+
+        if errors:
+            raise CommandError('\n'.join(errors))
+
+    def _benchmark_decoding(self, options: Dict[str, Any], repeat: int) -> List[str]:
+        """レスポンス全体のデコードと、スキーマを使ったデコードを、商品情報の整形まで含めて比較する"""
+        errors = []
+        page_size = max(options['page_size'], 1)
+        page_count = max(options['items'] // page_size, 1)
+        pages = _load_pages(page_size)
+        for ec_site_code, connector_class, content, full_items, schema_items in pages:
+            connector = _build_connector(connector_class, ec_site_code)
+            kwargs = {'jan_code': '4901234567894'}
+
+            full_data: List[ProductData] = []
+            full_result: BenchmarkResult
+            with measure() as full_result:
+                for _ in range(repeat * page_count):
+                    full_data = [connector._format_product_data(item, **kwargs)
+                                 for item in full_items(content)]
+
+            schema_data: List[ProductData] = []
+            schema_result: BenchmarkResult
+            with measure() as schema_result:
+                for _ in range(repeat * page_count):
+                    schema_data = [connector._format_product_data(item, **kwargs)
+                                   for item in schema_items(content)]
+
+            if full_data != schema_data:
+                errors.append(f'{ec_site_code}: スキーマを使ったデコードの整形結果が一致しません')
+
+            count = repeat * page_count
+            speedup = (full_result.elapsed / schema_result.elapsed
+                       if schema_result.elapsed > 0 else 0.0)
+            self.stdout.write(self.style.SUCCESS(
+                f'[{ec_site_code}] デコード: {len(content):,}バイト/レスポンス x {count}回\n'
+                f'  レスポンス全体: {full_result.per_second(count):,.0f}レスポンス/秒\n'
+                f'  スキーマ: {schema_result.per_second(count):,.0f}レスポンス/秒\n'
+                f'  速度向上: {speedup:.2f}倍'
+            ))
+
+            min_speedup = options['min_decode_speedup']
+            if min_speedup is not None and speedup < min_speedup:
+                errors.append(f'{ec_site_code}: デコードの速度向上率が下限を下回りました: '
+                              f'{speedup:.2f} < {min_speedup}')
+        return errors
+
+    @staticmethod
+    def _run(connector: ECConnector, items: List[Dict[str, Any]], kwargs_for: _KwargsFor,
+             repeat: int, legacy: bool) -> Tuple[BenchmarkResult, List[ProductData]]:
+        original = ECConnector._get_nested_attr_or_key
+        if legacy:
+            legacy_method = _legacy_get_nested_attr_or_key
+            ECConnector._get_nested_attr_or_key = legacy_method  # type: ignore[method-assign]
+        try:
+            data: List[ProductData] = []
+            result: BenchmarkResult
+            with measure() as result:
+                for _ in range(repeat):
+                    data = format_items(connector, items, kwargs_for)
+            return result, data
+        finally:
+            ECConnector._get_nested_attr_or_key = original  # type: ignore[method-assign]
@@ -0,0 +1,143 @@
+from typing import Callable, List
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import User
+from products.models import Product, ECSite, ProductOnECSite, UserProduct
+from products.payloads import build_product_payloads, build_user_product_payloads
+from products.serializers import ProductSerializer, UserProductSerializer
+from PriceAlert.benchmarking import BenchmarkResult, measure, throwaway_database
+
+
+def seed_tracked_products(product_count: int, listings_per_product: int) -> User:
+    """
+    ベンチマーク用に、多数の商品を登録したユーザーを作成する
+
+    Returns:
+        User: 作成したユーザー
+    """
+    user = User.objects.create(email='bench@example.com', username='bench', password='!')
+    ec_sites = [
+        ECSite.objects.get_or_create(code=f'bench{i}', defaults={'name': f'ベンチマーク{i}'})[0]
+        for i in range(max(listings_per_product, 1))
+    ]
+    products = Product.objects.bulk_create([
+        Product(
+            name=f'ベンチマーク商品{i}',
+            description='ベンチマーク用の商品説明',
+            manufacturer='ベンチマークメーカー',
+            jan_code=f'{4900000000000 + i}',
+        )
+        for i in range(product_count)
+    ])
+    ProductOnECSite.objects.bulk_create([
+        ProductOnECSite(
+            product=product,
+            ec_site=ec_sites[j],
+            ec_product_id=f'bench-{product.pk}-{j}',
+            product_url=f'https://example.com/items/{product.pk}/{j}',
+            seller_name='ベンチマークショップ',
+            current_price=10000 + j,
+            effective_price=9900 + j,
+        )
+        for product in products
+        for j in range(listings_per_product)
+    ], batch_size=1000)
+    UserProduct.objects.bulk_create([
+        UserProduct(user=user, product=product, price_threshold=9000)
+        for product in products
+    ])
+    return user
+
+
+def _ordered_listings(prefix: str = '') -> Prefetch:
+    # 高速パスと同じく出品情報をid順にする
+    return Prefetch(
+        f'{prefix}productonecsite_set',
+        queryset=ProductOnECSite.objects.select_related('ec_site').order_by('id'),
+    )
+
+
+def serialize_products_with_drf(user) -> bytes:
+    queryset = Product.objects.filter(userproduct__user=user).prefetch_related(_ordered_listings()).distinct()
+    return JSONRenderer().render(ProductSerializer(queryset, many=True).data)
+
+
+def serialize_user_products_with_drf(user) -> bytes:
+    queryset = (
+        UserProduct.objects.filter(user=user)
+        .select_related('product')
+        .prefetch_related(_ordered_listings('product__'))
+    )
+    return JSONRenderer().render(UserProductSerializer(queryset, many=True).data)
+
+
+def serialize_products_fast(user) -> bytes:
+    return JSONRenderer().render(build_product_payloads(user))
+
+
+def serialize_user_products_fast(user) -> bytes:
+    return JSONRenderer().render(build_user_product_payloads(user))
+
+
+class Command(BaseCommand):
+    help = '商品一覧APIのシリアライズ（DRFシリアライザーと高速パス）の処理時間を比較します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=300, help='ユーザーが登録する商品数')
+        parser.add_argument('--listings', type=int, default=3, help='商品ごとの出品数')
+        parser.add_argument('--repeat', type=int, default=5, help='計測の繰り返し回数')
+        parser.add_argument('--min-speedup', type=float, default=None,
+                            help='高速パスの速度向上率がこれを下回った場合は失敗とする')
+
+    def handle(self, *args, **options):
+        repeat = max(options['repeat'], 1)
+        errors = []
+
+        self.stdout.write('一時DBを作成しています...')
+        with throwaway_database():
+            user = seed_tracked_products(options['products'], options['listings'])
+            self.stdout.write(f'シード完了 - 商品: {options["products"]}件, '
+                              f'出品: {options["products"] * options["listings"]}件')
+
+            targets = [
+                ('products', serialize_products_with_drf, serialize_products_fast),
+                ('user-products', serialize_user_products_with_drf, serialize_user_products_fast),
+            ]
+            for name, drf_path, fast_path in targets:
+                drf_result, drf_body = self._run(drf_path, user, repeat)
+                fast_result, fast_body = self._run(fast_path, user, repeat)
+
+                if drf_body != fast_body:
+                    errors.append(f'{name}: 高速パスのJSONがシリアライザーの出力と一致しません')
+
+                speedup = drf_result.elapsed / fast_result.elapsed if fast_result.elapsed > 0 else 0.0
+                self.stdout.write(self.style.SUCCESS(
+                    f'[{name}] レスポンスサイズ: {len(fast_body) / 1024:.1f} KiB\n'
+                    f'  DRF: {drf_result.elapsed / repeat * 1000:.1f}ミリ秒/回, '
+                    f'クエリ数: {drf_result.queries // repeat}, '
+                    f'ピークメモリ: {drf_result.peak_memory / 1024 / 1024:.2f} MiB\n'
+                    f'  高速パス: {fast_result.elapsed / repeat * 1000:.1f}ミリ秒/回, '
+                    f'クエリ数: {fast_result.queries // repeat}, '
+                    f'ピークメモリ: {fast_result.peak_memory / 1024 / 1024:.2f} MiB\n'
+                    f'  速度向上: {speedup:.1f}倍'
+                ))
+
+                # 回帰ゲート
+                min_speedup = options['min_speedup']
+                if min_speedup is not None and speedup < min_speedup:
+                    errors.append(f'{name}: 速度向上率が下限を下回りました: {speedup:.1f} < {min_speedup}')
+
+        if errors:
+            raise CommandError('\n'.join(errors))
+
+    @staticmethod
+    def _run(serialize: Callable[[User], bytes], user: User, repeat: int):
+        bodies: List[bytes] = []
+        result: BenchmarkResult
+        with measure() as result:
+            for _ in range(repeat):
+                bodies.append(serialize(user))
+        return result, bodies[-1]
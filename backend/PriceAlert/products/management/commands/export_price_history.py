@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from products.exports import FORMATS, FORMAT_PARQUET, write_price_history
+
+
+class Command(BaseCommand):
+    help = '価格履歴を出品・ECサイト・商品と結合して、Parquet / Arrow IPCファイルに書き出します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', type=str, help='出力先のファイルパス')
+        parser.add_argument('--format', dest='file_format', choices=FORMATS, default=FORMAT_PARQUET,
+                            help='出力形式（arrowはArrow IPCストリーム形式）')
+        parser.add_argument('--start', type=str, default=None, help='開始日時（ISO 8601、以上）')
+        parser.add_argument('--end', type=str, default=None, help='終了日時（ISO 8601、未満）')
+        parser.add_argument('--chunk-days', type=float, default=1.0, help='1回のクエリで読み出す期間（日）')
+        parser.add_argument('--batch-size', type=int, default=50000, help='1つのRecordBatchの最大行数')
+        parser.add_argument('--compression', type=str, default='zstd', help='圧縮方式')
+        parser.add_argument('--database', type=str, default='default',
+                            help='読み出すDBのエイリアス（レプリカを指定すると本番DBの負荷を避けられる）')
+
+    def handle(self, *args, **options):
+        count = write_price_history(
+            options['output'],
+            file_format=options['file_format'],
+            compression=options['compression'],
+            start=self._parse(options['start']),
+            end=self._parse(options['end']),
+            chunk=timedelta(days=options['chunk_days']),
+            batch_size=max(options['batch_size'], 1),
+            using=options['database'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'価格履歴を{count}件書き出しました - {options["output"]}'))
+
+    @staticmethod
+    def _parse(value):
+        if value is None:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f'日時の形式が正しくありません: {value}')
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
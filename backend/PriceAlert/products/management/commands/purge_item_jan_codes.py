@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products.services.item_jan_service import ItemJANService
+
+
+class Command(BaseCommand):
+    help = '商品ID → JANコードの対応表（ECItemJANCode）から、期限切れ・対象外の出品情報由来の対応を削除します'
+
+    def handle(self, *args, **options):
+        count = ItemJANService.purge()
+        self.stdout.write(self.style.SUCCESS(f'対応表を{count}件削除しました'))
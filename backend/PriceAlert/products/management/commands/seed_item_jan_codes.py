@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products.services.item_jan_service import ItemJANService
+
+
+class Command(BaseCommand):
+    help = '登録済みの出品情報から、商品ID → JANコードの対応表（ECItemJANCode）を作成します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='1回に保存する商品IDの数')
+
+    def handle(self, *args, **options):
+        count = ItemJANService.seed_from_listings(batch_size=max(options['batch_size'], 1))
+        self.stdout.write(self.style.SUCCESS(f'対応表を{count}件作成しました'))
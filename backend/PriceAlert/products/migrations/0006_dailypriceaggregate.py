@@ -0,0 +1,62 @@
+# Generated by Django 5.0.4 on 2026-10-19 10:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0005_alter_userproduct_product"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyPriceAggregate",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("open_price", models.IntegerField()),
+                ("high_price", models.IntegerField()),
+                ("low_price", models.IntegerField()),
+                ("close_price", models.IntegerField()),
+                ("min_effective_price", models.IntegerField()),
+                ("close_effective_price", models.IntegerField()),
+                ("sample_count", models.IntegerField(default=0)),
+                ("first_captured_at", models.DateTimeField()),
+                ("last_captured_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["-date"],
+            },
+        ),
+        migrations.AddField(
+            model_name="dailypriceaggregate",
+            name="product_on_ec_site",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="daily_aggregates",
+                to="products.productonecsite",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="dailypriceaggregate",
+            index=models.Index(fields=["date"], name="products_da_date_ca099c_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="dailypriceaggregate",
+            constraint=models.UniqueConstraint(
+                fields=("product_on_ec_site", "date"),
+                name="unique_daily_aggregate_per_listing",
+            ),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.0.4 on 2026-10-19 10:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0006_dailypriceaggregate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PriceStatistics",
+            fields=[
+                (
+                    "product_on_ec_site",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="price_statistics",
+                        serialize=False,
+                        to="products.productonecsite",
+                    ),
+                ),
+                ("current_price", models.IntegerField(blank=True, null=True)),
+                ("current_since", models.DateTimeField(blank=True, null=True)),
+                ("min_7d_price", models.IntegerField(blank=True, null=True)),
+                ("min_7d_at", models.DateTimeField(blank=True, null=True)),
+                ("min_7d_expires_at", models.DateTimeField(blank=True, null=True)),
+                ("max_7d_price", models.IntegerField(blank=True, null=True)),
+                ("max_7d_at", models.DateTimeField(blank=True, null=True)),
+                ("max_7d_expires_at", models.DateTimeField(blank=True, null=True)),
+                ("min_30d_price", models.IntegerField(blank=True, null=True)),
+                ("min_30d_at", models.DateTimeField(blank=True, null=True)),
+                ("min_30d_expires_at", models.DateTimeField(blank=True, null=True)),
+                ("max_30d_price", models.IntegerField(blank=True, null=True)),
+                ("max_30d_at", models.DateTimeField(blank=True, null=True)),
+                ("max_30d_expires_at", models.DateTimeField(blank=True, null=True)),
+                ("min_90d_price", models.IntegerField(blank=True, null=True)),
+                ("min_90d_at", models.DateTimeField(blank=True, null=True)),
+                ("min_90d_expires_at", models.DateTimeField(blank=True, null=True)),
+                ("max_90d_price", models.IntegerField(blank=True, null=True)),
+                ("max_90d_at", models.DateTimeField(blank=True, null=True)),
+                ("max_90d_expires_at", models.DateTimeField(blank=True, null=True)),
+                ("all_time_low_price", models.IntegerField(blank=True, null=True)),
+                ("all_time_low_at", models.DateTimeField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="pricestatistics",
+            name="product",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="price_statistics",
+                to="products.product",
+            ),
+        ),
+    ]
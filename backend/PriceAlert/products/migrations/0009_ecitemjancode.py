@@ -0,0 +1,55 @@
+# Generated by Django 5.0.4 on 2026-10-19 10:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0008_registrationjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ECItemJANCode",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("item_id", models.CharField(max_length=100)),
+                ("jan_codes", models.JSONField(default=list)),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[("listing", "出品情報"), ("lookup", "URL検索")],
+                        default="lookup",
+                        max_length=20,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="ecitemjancode",
+            name="ec_site",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="item_jan_codes",
+                to="products.ecsite",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="ecitemjancode",
+            constraint=models.UniqueConstraint(
+                fields=("ec_site", "item_id"), name="unique_item_jan_code_per_site"
+            ),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.4 on 2026-10-19 10:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0009_ecitemjancode"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RefreshSchedule",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="refresh_schedule",
+                        serialize=False,
+                        to="products.product",
+                    ),
+                ),
+                ("next_refresh_at", models.DateTimeField()),
+                ("last_refreshed_at", models.DateTimeField(blank=True, null=True)),
+                ("interval_minutes", models.IntegerField()),
+                ("change_rate", models.FloatField(default=0)),
+                ("watcher_count", models.IntegerField(default=0)),
+                ("threshold_gap", models.FloatField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "ordering": ["next_refresh_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="refreshschedule",
+            index=models.Index(
+                fields=["next_refresh_at"], name="products_re_next_re_960ab9_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,121 @@
+# Generated by Django 5.0.4 on 2026-10-19 11:05
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# 始値・最安・最高・終値のサンプルを保存するフィールド（取得日時・価格・ポイント・実効価格）
+SAMPLE_FIELDS = (
+    ('first_captured_at', 'open_price', 'open_points', 'open_effective_price'),
+    ('low_captured_at', 'low_price', 'low_points', 'min_effective_price'),
+    ('high_captured_at', 'high_price', 'high_points', 'max_effective_price'),
+    ('last_captured_at', 'close_price', 'close_points', 'close_effective_price'),
+)
+
+
+def rebuild_samples(apps, schema_editor):
+    """既存の集計行のサンプルを価格履歴から作り直す（価格履歴が残っていない日の集計行は削除する）"""
+    DailyPriceAggregate = apps.get_model('products', 'DailyPriceAggregate')
+    PriceHistory = apps.get_model('products', 'PriceHistory')
+
+    aggregated = DailyPriceAggregate.objects.order_by().values_list('product_on_ec_site_id',
+                                                                    flat=True)
+    for listing_id in list(aggregated.distinct()):
+        samples_by_day = {}
+        rows = PriceHistory.objects.filter(product_on_ec_site_id=listing_id)
+        rows = rows.order_by('captured_at', 'id').values_list(
+            'captured_at', 'price', 'points', 'effective_price'
+        )
+        for sample in rows.iterator(chunk_size=5000):
+            samples_by_day.setdefault(timezone.localdate(sample[0]), []).append(sample)
+
+        to_update = []
+        to_delete = []
+        for aggregate in DailyPriceAggregate.objects.filter(product_on_ec_site_id=listing_id):
+            samples = samples_by_day.get(aggregate.date)
+            if not samples:
+                to_delete.append(aggregate.pk)
+                continue
+            low = min(samples, key=lambda sample: sample[3])
+            high = max(samples, key=lambda sample: (sample[3], -sample[0].timestamp()))
+            for fields, sample in zip(SAMPLE_FIELDS, (samples[0], low, high, samples[-1])):
+                for field, value in zip(fields, sample):
+                    setattr(aggregate, field, value)
+            aggregate.sample_count = len(samples)
+            to_update.append(aggregate)
+
+        DailyPriceAggregate.objects.bulk_update(
+            to_update, [field for fields in SAMPLE_FIELDS for field in fields] + ['sample_count'],
+            batch_size=1000,
+        )
+        DailyPriceAggregate.objects.filter(pk__in=to_delete).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("products", "0010_refreshschedule"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="dailypriceaggregate",
+            name="open_points",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="dailypriceaggregate",
+            name="open_effective_price",
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="dailypriceaggregate",
+            name="high_points",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="dailypriceaggregate",
+            name="max_effective_price",
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="dailypriceaggregate",
+            name="high_captured_at",
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name="dailypriceaggregate",
+            name="low_points",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="dailypriceaggregate",
+            name="low_captured_at",
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name="dailypriceaggregate",
+            name="close_points",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(rebuild_samples, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="dailypriceaggregate",
+            name="open_effective_price",
+            field=models.IntegerField(),
+        ),
+        migrations.AlterField(
+            model_name="dailypriceaggregate",
+            name="max_effective_price",
+            field=models.IntegerField(),
+        ),
+        migrations.AlterField(
+            model_name="dailypriceaggregate",
+            name="high_captured_at",
+            field=models.DateTimeField(),
+        ),
+        migrations.AlterField(
+            model_name="dailypriceaggregate",
+            name="low_captured_at",
+            field=models.DateTimeField(),
+        ),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.conf import settings
 # Create your models here.
@@ -85,6 +87,86 @@ class PriceHistory(models.Model):
     def __str__(self):
         return f"{self.product_on_ec_site} - {self.price}円 ({self.captured_at})"
 
+class DailyPriceAggregate(models.Model):
+    """
+    出品ごと・日ごとの価格の集計（OHLC）
+    価格履歴の保存時に差分で更新する。日付は現在のタイムゾーン（Asia/Tokyo）で区切る
+
+    始値・最安・最高・終値はそれぞれ1件の価格履歴（取得日時・価格・ポイント・実効価格）で、
+    価格履歴のグラフで1日分の点として使う。最安・最高は実効価格で決める
+    """
+    product_on_ec_site = models.ForeignKey(ProductOnECSite, on_delete=models.CASCADE, related_name='daily_aggregates')
+    date = models.DateField()
+    open_price = models.IntegerField()
+    open_points = models.IntegerField(default=0)
+    open_effective_price = models.IntegerField()
+    high_price = models.IntegerField()
+    high_points = models.IntegerField(default=0)
+    max_effective_price = models.IntegerField()
+    high_captured_at = models.DateTimeField()
+    low_price = models.IntegerField()
+    low_points = models.IntegerField(default=0)
+    min_effective_price = models.IntegerField()
+    low_captured_at = models.DateTimeField()
+    close_price = models.IntegerField()
+    close_points = models.IntegerField(default=0)
+    close_effective_price = models.IntegerField()
+    sample_count = models.IntegerField(default=0)
+    first_captured_at = models.DateTimeField()
+    last_captured_at = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['product_on_ec_site', 'date'], name='unique_daily_aggregate_per_listing')
+        ]
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"{self.product_on_ec_site} - {self.date} ({self.low_price}〜{self.high_price}円)"
+
+class PriceStatistics(models.Model):
+    """
+    出品ごとの価格統計（実効価格）
+    直近7/30/90日間の最安値・最高値と、これまでの最安値を保持する
+
+    *_at はその価格になった日時、*_expires_at はその価格が期間から外れる日時
+    （現在もその価格であればNULL）。期限切れになった期間だけ価格履歴から再計算する
+    """
+    product_on_ec_site = models.OneToOneField(
+        ProductOnECSite, on_delete=models.CASCADE, primary_key=True, related_name='price_statistics'
+    )
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='price_statistics')
+    current_price = models.IntegerField(null=True, blank=True)
+    current_since = models.DateTimeField(null=True, blank=True)
+    min_7d_price = models.IntegerField(null=True, blank=True)
+    min_7d_at = models.DateTimeField(null=True, blank=True)
+    min_7d_expires_at = models.DateTimeField(null=True, blank=True)
+    max_7d_price = models.IntegerField(null=True, blank=True)
+    max_7d_at = models.DateTimeField(null=True, blank=True)
+    max_7d_expires_at = models.DateTimeField(null=True, blank=True)
+    min_30d_price = models.IntegerField(null=True, blank=True)
+    min_30d_at = models.DateTimeField(null=True, blank=True)
+    min_30d_expires_at = models.DateTimeField(null=True, blank=True)
+    max_30d_price = models.IntegerField(null=True, blank=True)
+    max_30d_at = models.DateTimeField(null=True, blank=True)
+    max_30d_expires_at = models.DateTimeField(null=True, blank=True)
+    min_90d_price = models.IntegerField(null=True, blank=True)
+    min_90d_at = models.DateTimeField(null=True, blank=True)
+    min_90d_expires_at = models.DateTimeField(null=True, blank=True)
+    max_90d_price = models.IntegerField(null=True, blank=True)
+    max_90d_at = models.DateTimeField(null=True, blank=True)
+    max_90d_expires_at = models.DateTimeField(null=True, blank=True)
+    all_time_low_price = models.IntegerField(null=True, blank=True)
+    all_time_low_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.product_on_ec_site} - 90日最安値: {self.min_90d_price}円"
+
 class UserProduct(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.RESTRICT, related_name='userproduct')
@@ -105,3 +187,101 @@ class UserProduct(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.product.name}"
 
+class RegistrationJob(models.Model):
+    """
+    商品登録ジョブ
+    一括登録・非同期登録の進捗と結果を保存する
+    """
+    STATUS_CHOICES = [
+        ('pending', '待機中'),
+        ('running', '実行中'),
+        ('completed', '完了'),
+        ('failed', '失敗'),
+    ]
+    KIND_CHOICES = [
+        ('bulk', '一括登録'),
+        ('single', '単一登録'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='registration_jobs')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='bulk')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # [{'type': 'jan' | 'url', 'value': '...'}, ...]
+    items = models.JSONField(default=list)
+    price_threshold = models.IntegerField(null=True, blank=True)
+    total = models.IntegerField(default=0)
+    processed = models.IntegerField(default=0)
+    succeeded = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    # 入力ごとの結果 [{'type', 'value', 'status', 'jan_codes', 'product_ids', 'error'}, ...]
+    results = models.JSONField(default=list, blank=True)
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+        ]
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.user.username} - {self.kind} ({self.status} {self.processed}/{self.total})"
+
+class ECItemJANCode(models.Model):
+    """
+    ECサイトの商品ID → JANコードの対応表
+    URLからの商品登録で、外部APIを呼ばずにJANコードを特定するために使う
+
+    item_id は出品情報の ec_product_id と同じ形式（Amazon: ASIN、楽天: 店舗コード:商品コード、
+    Yahoo: 店舗コード_商品コード）
+    """
+    SOURCE_CHOICES = [
+        ('listing', '出品情報'),
+        ('lookup', 'URL検索'),
+    ]
+
+    ec_site = models.ForeignKey(ECSite, on_delete=models.CASCADE, related_name='item_jan_codes')
+    item_id = models.CharField(max_length=100)
+    jan_codes = models.JSONField(default=list)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default='lookup')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['ec_site', 'item_id'], name='unique_item_jan_code_per_site')
+        ]
+
+    def __str__(self):
+        return f"{self.ec_site.code}:{self.item_id} - {', '.join(self.jan_codes)}"
+
+class RefreshSchedule(models.Model):
+    """
+    商品ごとの価格更新スケジュール
+
+    価格の変動頻度・通知を有効にしている登録ユーザー数・価格と通知閾値の近さから
+    更新間隔を決め、next_refresh_at が過ぎた商品から価格を更新する
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='refresh_schedule')
+    next_refresh_at = models.DateTimeField()
+    last_refreshed_at = models.DateTimeField(null=True, blank=True)
+    interval_minutes = models.IntegerField()
+    # 直近の1日あたりの価格変動回数
+    change_rate = models.FloatField(default=0)
+    # 通知を有効にしている登録ユーザー数
+    watcher_count = models.IntegerField(default=0)
+    # 現在の最安値と最も近い通知閾値との差（閾値に対する割合、閾値がなければNULL）
+    threshold_gap = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_refresh_at']),
+        ]
+        ordering = ['next_refresh_at']
+
+    def __str__(self):
+        return f"{self.product} - 次回更新: {self.next_refresh_at}（{self.interval_minutes}分間隔）"
@@ -0,0 +1,161 @@
+"""
+商品一覧APIの高速シリアライズ
+
+ProductSerializer / UserProductSerializer と同じ構造・同じJSONになるレスポンスデータを、
+DRFのシリアライザーを経由せず values_list() の行から直接組み立てる。
+一覧APIはユーザーが登録した商品数 × 出品数の辞書を作るので、
+フィールドごとのシリアライザー呼び出しを省くだけで大きく速くなる。
+
+出品情報は id 順に並べる（シリアライザー側と比較する場合も同じ順序で取得すること）
+"""
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List
+
+from rest_framework.fields import DateTimeField
+
+from .models import Product, ProductOnECSite, UserProduct
+
+# ModelSerializerと同じ日時表現（現在のタイムゾーンに変換したISO 8601）にする
+_datetime_field = DateTimeField()
+
+_LISTING_COLUMNS = (
+    'product_id', 'id', 'current_price', 'effective_price', 'product_url', 'affiliate_url',
+    'seller_name', 'shipping_fee', 'condition', 'last_updated', 'is_active', 'created_at',
+    'updated_at', 'ec_site__id', 'ec_site__name', 'ec_site__code',
+)
+
+_PRODUCT_COLUMNS = (
+    'id', 'name', 'description', 'image_url', 'manufacturer', 'model_number', 'jan_code',
+    'created_at', 'updated_at',
+)
+
+_USER_PRODUCT_COLUMNS = (
+    'id', 'user_id', 'product_id', 'price_threshold', 'threshold_type', 'threshold_percentage',
+    'notification_enabled', 'display_order', 'memo', 'created_at', 'updated_at',
+)
+
+
+def _format_datetime(value):
+    return _datetime_field.to_representation(value) if value else None
+
+
+def _str_or_none(value):
+    return None if value is None else str(value)
+
+
+def _listing_payload(id_, current_price, effective_price, product_url, affiliate_url, seller_name,
+                     shipping_fee, condition, last_updated, is_active, created_at, updated_at,
+                     ec_site_id, ec_site_name, ec_site_code) -> Dict[str, Any]:
+    return {
+        'id': id_,
+        'current_price': current_price,
+        'effective_price': effective_price,
+        'product_url': product_url,
+        'affiliate_url': affiliate_url,
+        'seller_name': seller_name,
+        'shipping_fee': shipping_fee,
+        'condition': condition,
+        'last_updated': last_updated,
+        'is_active': is_active,
+        'created_at': created_at,
+        'updated_at': updated_at,
+        'ec_site': {
+            'id': ec_site_id,
+            'name': ec_site_name,
+            'code': ec_site_code,
+        }
+    }
+
+
+def listing_payload(product_on_ec_site: ProductOnECSite) -> Dict[str, Any]:
+    """
+    出品情報を商品レスポンスのec_sitesの要素の形式にする
+    ProductSerializer / UserProductSerializer からも使用する
+    """
+    poe = product_on_ec_site
+    return _listing_payload(
+        poe.id, poe.current_price, poe.effective_price, poe.product_url, poe.affiliate_url,
+        poe.seller_name, poe.shipping_fee, poe.condition, poe.last_updated, poe.is_active,
+        poe.created_at, poe.updated_at, poe.ec_site.id, poe.ec_site.name, poe.ec_site.code,
+    )
+
+
+def build_listing_payloads(product_ids: Iterable[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    商品IDごとの出品情報（listing_payloadと同じ形式）を返す
+    """
+    listings: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    rows = (
+        ProductOnECSite.objects.filter(product_id__in=list(product_ids))
+        .order_by('id')
+        .values_list(*_LISTING_COLUMNS)
+    )
+    for product_id, *columns in rows:
+        listings[product_id].append(_listing_payload(*columns))
+    return listings
+
+
+def build_product_payloads(user) -> List[Dict[str, Any]]:
+    """商品一覧（GET: products/）のレスポンスデータを返す"""
+    rows = list(
+        Product.objects.filter(userproduct__user=user)
+        .distinct()
+        .values_list(*_PRODUCT_COLUMNS)
+    )
+    listings = build_listing_payloads(row[0] for row in rows)
+
+    return [
+        {
+            'id': id_,
+            'name': _str_or_none(name),
+            'description': _str_or_none(description),
+            'image_url': _str_or_none(image_url),
+            'manufacturer': _str_or_none(manufacturer),
+            'model_number': _str_or_none(model_number),
+            'jan_code': _str_or_none(jan_code),
+            'ec_sites': listings.get(id_, []),
+            'created_at': _format_datetime(created_at),
+            'updated_at': _format_datetime(updated_at),
+        }
+        for (id_, name, description, image_url, manufacturer, model_number, jan_code,
+             created_at, updated_at) in rows
+    ]
+
+
+def build_user_product_payloads(user) -> List[Dict[str, Any]]:
+    """ユーザー商品一覧（GET: user-products/）のレスポンスデータを返す"""
+    user_products = list(UserProduct.objects.filter(user=user).values_list(*_USER_PRODUCT_COLUMNS))
+    product_ids = {row[2] for row in user_products}
+    products = {
+        row[0]: row
+        for row in Product.objects.filter(id__in=product_ids).values_list(*_PRODUCT_COLUMNS[:7])
+    }
+    listings = build_listing_payloads(product_ids)
+
+    payloads = []
+    for (id_, user_id, product_id, price_threshold, threshold_type, threshold_percentage,
+         notification_enabled, display_order, memo, created_at, updated_at) in user_products:
+        (_, name, description, image_url, manufacturer, model_number, jan_code) = products[product_id]
+        payloads.append({
+            'id': id_,
+            'user': user_id,
+            'product': {
+                'id': product_id,
+                'name': name,
+                'description': description,
+                'image_url': image_url,
+                'manufacturer': manufacturer,
+                'model_number': model_number,
+                'jan_code': jan_code,
+                'ec_sites': listings.get(product_id, []),
+            },
+            'price_threshold': price_threshold,
+            'threshold_type': _str_or_none(threshold_type),
+            'threshold_percentage': threshold_percentage,
+            'notification_enabled': notification_enabled,
+            'display_order': display_order,
+            'memo': _str_or_none(memo),
+            'created_at': _format_datetime(created_at),
+            'updated_at': _format_datetime(updated_at),
+        })
+    return payloads
@@ -1,6 +1,8 @@
 # products/serializers.py
 from rest_framework import serializers
-from .models import Product, ProductOnECSite, UserProduct, ECSite, PriceHistory
+from .models import Product, ProductOnECSite, UserProduct, ECSite, PriceHistory, RegistrationJob
+from .payloads import listing_payload
+from .services.price_history_service import MAX_POINTS, DEFAULT_POINTS
 
 class ECSiteSerializer(serializers.ModelSerializer):
     class Meta:
@@ -31,29 +33,7 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'image_url', 'manufacturer', 'model_number', 'jan_code', 'ec_sites', 'created_at', 'updated_at']
 
     def get_ec_sites(self, obj):
-        ec_sites = []
-        for poe in obj.productonecsite_set.all():
-            ec_site_data = {
-                'id': poe.id,
-                'current_price': poe.current_price,
-                'effective_price': poe.effective_price,
-                'product_url': poe.product_url,
-                'affiliate_url': poe.affiliate_url,
-                'seller_name': poe.seller_name,
-                'shipping_fee': poe.shipping_fee,
-                'condition': poe.condition,
-                'last_updated': poe.last_updated,
-                'is_active': poe.is_active,
-                'created_at': poe.created_at,
-                'updated_at': poe.updated_at,
-                'ec_site': {
-                    'id': poe.ec_site.id,
-                    'name': poe.ec_site.name,
-                    'code': poe.ec_site.code,
-                }
-            }
-            ec_sites.append(ec_site_data)
-        return ec_sites
+        return [listing_payload(poe) for poe in obj.productonecsite_set.all()]
 
 class UserProductSerializer(serializers.ModelSerializer):
     product = serializers.SerializerMethodField()
@@ -64,29 +44,8 @@ class UserProductSerializer(serializers.ModelSerializer):
         read_only_fields = ['user']
 
     def get_product(self, obj):
-        ec_sites = []
-        for poe in obj.product.productonecsite_set.all():
-            ec_site_data = {
-                'id': poe.id,
-                'current_price': poe.current_price,
-                'effective_price': poe.effective_price,
-                'product_url': poe.product_url,
-                'affiliate_url': poe.affiliate_url,
-                'seller_name': poe.seller_name,
-                'shipping_fee': poe.shipping_fee,
-                'condition': poe.condition,
-                'last_updated': poe.last_updated,
-                'is_active': poe.is_active,
-                'created_at': poe.created_at,
-                'updated_at': poe.updated_at,
-                'ec_site': {
-                    'id': poe.ec_site.id,
-                    'name': poe.ec_site.name,
-                    'code': poe.ec_site.code,
-                }
-            }
-            ec_sites.append(ec_site_data)
-            
+        ec_sites = [listing_payload(poe) for poe in obj.product.productonecsite_set.all()]
+
         return {
             'id': obj.product.id,
             'name': obj.product.name,
@@ -125,6 +84,21 @@ class PriceHistorySerializer(serializers.ModelSerializer):
             'updated_at': product_on_ec.updated_at,
         }
 
+class PriceHistoryQuerySerializer(serializers.Serializer):
+    """価格履歴のグラフ用データ取得の条件"""
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    sites = serializers.CharField(required=False, help_text='ECサイトコードのカンマ区切り（例: rakuten,yahoo）')
+    points = serializers.IntegerField(required=False, min_value=3, max_value=MAX_POINTS, default=DEFAULT_POINTS)
+
+    def validate_sites(self, value):
+        return [code.strip() for code in value.split(',') if code.strip()]
+
+    def validate(self, data):
+        if data.get('start') and data.get('end') and data['start'] > data['end']:
+            raise serializers.ValidationError('startはend以前の日時を指定してください。')
+        return data
+
 class BaseProductSerializer(serializers.Serializer):
     """URLまたはJANコードのいずれかを使う共通シリアライザ"""
     url = serializers.URLField(required=False, allow_null=True)
@@ -141,4 +115,38 @@ class ProductSearchSerializer(BaseProductSerializer):
 
 class ProductRegistrationSerializer(BaseProductSerializer):
     """商品登録用（価格しきい値あり）"""
-    price_threshold = serializers.IntegerField(required=False, allow_null=True)
\ No newline at end of file
+    price_threshold = serializers.IntegerField(required=False, allow_null=True)
+
+class BulkRegistrationSerializer(serializers.Serializer):
+    """商品一括登録用（JANコード・URLを混在して指定できる）"""
+    items = serializers.ListField(child=serializers.CharField(allow_blank=True), required=False, default=list)
+    jan_codes = serializers.ListField(child=serializers.CharField(allow_blank=True), required=False, default=list)
+    urls = serializers.ListField(child=serializers.CharField(allow_blank=True), required=False, default=list)
+    price_threshold = serializers.IntegerField(required=False, allow_null=True)
+
+    def validate(self, data):
+        if not (data['items'] or data['jan_codes'] or data['urls']):
+            raise serializers.ValidationError("items、jan_codes、urlsのいずれかを指定してください。")
+        return data
+
+class RegistrationJobSerializer(serializers.ModelSerializer):
+    products = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RegistrationJob
+        fields = ['id', 'kind', 'status', 'total', 'processed', 'succeeded', 'failed', 'results', 'error', 'products', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+    def get_products(self, obj):
+        """
+        完了した単体登録ジョブの商品（同期登録のレスポンスと同じ形式）
+        一括登録は件数が多いので返さない（results の product_ids を使う）
+        """
+        if obj.kind != 'single' or obj.status != 'completed':
+            return None
+        product_ids = {product_id for result in obj.results or [] for product_id in result.get('product_ids', [])}
+        products = Product.objects.filter(id__in=product_ids).prefetch_related(
+            'productonecsite_set',
+            'productonecsite_set__ec_site'
+        ).order_by('id')
+        return ProductSerializer(products, many=True).data
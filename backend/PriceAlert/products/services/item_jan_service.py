@@ -0,0 +1,138 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Set
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import ECItemJANCode, ECSite, ProductOnECSite
+
+logger = logging.getLogger(__name__)
+
+
+class ItemJANService:
+    """
+    ECサイトの商品ID → JANコードの対応表（ECItemJANCode）を扱うビジネスロジック
+
+    対応表は、登録済みの出品情報（ec_product_id と商品のJANコード）と、
+    過去のURL検索の結果から作る。URLからの商品登録では、対応表にある商品の外部API呼び出しを省く
+
+    出品情報は ITEM_JAN_VERIFIED_LISTING_SITES のECサイトのものだけを使う。
+    ITEM_JAN_CODE_MAX_AGE_DAYS より古い対応は使わない（URL検索で更新される）
+    """
+
+    @staticmethod
+    def _expires_before(now: Optional[datetime] = None) -> datetime:
+        return (now or timezone.now()) - timedelta(days=settings.ITEM_JAN_CODE_MAX_AGE_DAYS)
+
+    @staticmethod
+    def lookup_many(ec_site_code: str, item_ids: Iterable[str]) -> Dict[str, Set[str]]:
+        """
+        商品IDのJANコードを返す
+        対応表にない商品IDは登録済みの出品情報から探し、見つかれば対応表に追加する
+
+        Returns:
+            Dict[str, Set[str]]: 商品IDごとのJANコード（見つからない商品IDは含まない）
+        """
+        item_ids = set(item_ids)
+        if not item_ids:
+            return {}
+
+        found: Dict[str, Set[str]] = {
+            item_id: set(jan_codes)
+            for item_id, jan_codes in ECItemJANCode.objects.filter(
+                ec_site__code=ec_site_code, item_id__in=item_ids,
+                updated_at__gte=ItemJANService._expires_before(),
+            ).values_list('item_id', 'jan_codes')
+            if jan_codes
+        }
+
+        missing = item_ids - found.keys()
+        if missing and ec_site_code in settings.ITEM_JAN_VERIFIED_LISTING_SITES:
+            from_listings: Dict[str, Set[str]] = defaultdict(set)
+            for item_id, jan_code in ProductOnECSite.objects.filter(
+                ec_site__code=ec_site_code, ec_product_id__in=missing
+            ).values_list('ec_product_id', 'product__jan_code'):
+                if jan_code:
+                    from_listings[item_id].add(jan_code)
+            if from_listings:
+                ItemJANService.remember_many(ec_site_code, from_listings, source='listing')
+                found.update(from_listings)
+
+        return found
+
+    @staticmethod
+    def remember_many(ec_site_code: str, jan_codes_by_item: Dict[str, Set[str]], source: str = 'lookup') -> int:
+        """
+        商品IDとJANコードの対応を保存する（既存の対応は上書き）
+
+        Returns:
+            int: 保存した件数
+        """
+        ec_site = ECSite.objects.filter(code=ec_site_code).first()
+        if ec_site is None:
+            return 0
+
+        entries = [
+            ECItemJANCode(ec_site=ec_site, item_id=item_id, jan_codes=sorted(jan_codes), source=source)
+            for item_id, jan_codes in jan_codes_by_item.items()
+            if item_id and jan_codes
+        ]
+        if entries:
+            ECItemJANCode.objects.bulk_create(
+                entries,
+                update_conflicts=True,
+                unique_fields=['ec_site', 'item_id'],
+                update_fields=['jan_codes', 'source', 'updated_at'],
+            )
+        return len(entries)
+
+    @staticmethod
+    def seed_from_listings(batch_size: int = 1000) -> int:
+        """
+        登録済みの出品情報から対応表を作る（バックフィル用）
+        JANコードで絞り込んで検索するECサイトの出品情報だけを使う
+
+        Returns:
+            int: 保存した件数
+        """
+        verified_sites = settings.ITEM_JAN_VERIFIED_LISTING_SITES
+        rows = (
+            ProductOnECSite.objects.filter(ec_site__code__in=verified_sites)
+            .exclude(product__jan_code__isnull=True)
+            .exclude(product__jan_code='')
+            .order_by('ec_site__code', 'ec_product_id')
+            .values_list('ec_site__code', 'ec_product_id', 'product__jan_code')
+        )
+
+        count = 0
+        current_site = None
+        pending: Dict[str, Set[str]] = defaultdict(set)
+        for ec_site_code, item_id, jan_code in rows.iterator(chunk_size=batch_size):
+            # 行は (ECサイト, 商品ID) 順なので、商品IDの切れ目でだけ保存する
+            if pending and (ec_site_code != current_site or (len(pending) >= batch_size and item_id not in pending)):
+                count += ItemJANService.remember_many(current_site, pending, source='listing')
+                pending = defaultdict(set)
+            current_site = ec_site_code
+            pending[item_id].add(jan_code)
+        if pending:
+            count += ItemJANService.remember_many(current_site, pending, source='listing')
+        logger.info(f'出品情報から商品ID → JANコードの対応表を作成しました - 件数: {count}')
+        return count
+
+    @staticmethod
+    def purge(now: Optional[datetime] = None) -> int:
+        """
+        有効期間を過ぎた対応と、対象外のECサイトの出品情報から作った対応を削除する
+
+        Returns:
+            int: 削除した件数
+        """
+        expired = ECItemJANCode.objects.filter(updated_at__lt=ItemJANService._expires_before(now))
+        unverified = ECItemJANCode.objects.filter(source='listing').exclude(
+            ec_site__code__in=settings.ITEM_JAN_VERIFIED_LISTING_SITES
+        )
+        count, _ = (expired | unverified).delete()
+        logger.info(f'商品ID → JANコードの対応表を削除しました - 件数: {count}')
+        return count
@@ -0,0 +1,184 @@
+import logging
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from ..models import DailyPriceAggregate, PriceHistory
+
+logger = logging.getLogger(__name__)
+
+# 集計対象の1サンプル: (captured_at, price, points, effective_price)
+_Sample = Tuple[datetime, int, int, int]
+
+# 集計行の始値・最安・最高・終値のサンプルを保存するフィールド（_Sample と同じ順）
+_OPEN_FIELDS = ('first_captured_at', 'open_price', 'open_points', 'open_effective_price')
+_LOW_FIELDS = ('low_captured_at', 'low_price', 'low_points', 'min_effective_price')
+_HIGH_FIELDS = ('high_captured_at', 'high_price', 'high_points', 'max_effective_price')
+_CLOSE_FIELDS = ('last_captured_at', 'close_price', 'close_points', 'close_effective_price')
+_SAMPLE_FIELDS = (_OPEN_FIELDS, _LOW_FIELDS, _HIGH_FIELDS, _CLOSE_FIELDS)
+
+
+def _pick(samples: List[_Sample]) -> Tuple[_Sample, _Sample, _Sample, _Sample]:
+    """
+    captured_at順のサンプルから始値・最安・最高・終値のサンプルを選ぶ
+    最安・最高は実効価格で決める（同じ値なら早いサンプル）
+    """
+    low = min(samples, key=lambda sample: sample[3])
+    high = max(samples, key=lambda sample: (sample[3], -sample[0].timestamp()))
+    return samples[0], low, high, samples[-1]
+
+
+def _in_time_order(picked: Iterable[_Sample]) -> List[_Sample]:
+    # 同じサンプルが複数の役割を持つ場合は1つにまとめる
+    return sorted({sample[0]: sample for sample in picked}.values(), key=lambda sample: sample[0])
+
+
+def ohlc_samples(samples: List[_Sample]) -> List[_Sample]:
+    """captured_at順のサンプルを、始値・最安・最高・終値のサンプル（最大4つ）に間引いて時刻順に返す"""
+    return _in_time_order(_pick(samples))
+
+
+def aggregate_samples(aggregate: DailyPriceAggregate) -> List[_Sample]:
+    """集計行に保存した始値・最安・最高・終値のサンプルを時刻順に返す"""
+    return _in_time_order(
+        tuple(getattr(aggregate, field) for field in fields) for fields in _SAMPLE_FIELDS
+    )
+
+
+def _summarize(samples: List[_Sample]) -> Dict[str, object]:
+    """captured_at順のサンプルから1日分の集計値を作る"""
+    summary: Dict[str, object] = {'sample_count': len(samples)}
+    for fields, sample in zip(_SAMPLE_FIELDS, _pick(samples)):
+        summary.update(zip(fields, sample))
+    return summary
+
+
+def _copy_sample(aggregate: DailyPriceAggregate, summary: Dict[str, object],
+                 fields: Tuple[str, ...]) -> None:
+    for field in fields:
+        setattr(aggregate, field, summary[field])
+
+
+def _group_by_day(
+    rows: Iterable[Tuple[int, datetime, int, int, int]]
+) -> Dict[Tuple[int, date], List[_Sample]]:
+    """(出品ID, captured_at, price, points, effective_price) を出品・日付ごとにまとめる"""
+    groups: Dict[Tuple[int, date], List[_Sample]] = {}
+    for listing_id, captured_at, price, points, effective_price in rows:
+        key = (listing_id, timezone.localdate(captured_at))
+        groups.setdefault(key, []).append((captured_at, price, points, effective_price))
+    for samples in groups.values():
+        samples.sort(key=lambda sample: sample[0])
+    return groups
+
+
+class PriceAggregateService:
+    """日次の価格集計（DailyPriceAggregate）を扱うビジネスロジック"""
+
+    @staticmethod
+    def apply_price_histories(price_histories: List[PriceHistory]) -> int:
+        """
+        新しく保存した価格履歴を日次集計に反映する
+
+        既存の集計行はロックしてから更新するので、同じ出品を並行して更新しても集計がずれない
+
+        Returns:
+            int: 作成・更新した集計行の数
+        """
+        groups = _group_by_day(
+            (history.product_on_ec_site_id, history.captured_at, history.price, history.points,
+             history.effective_price)
+            for history in price_histories
+        )
+        if not groups:
+            return 0
+
+        try:
+            return PriceAggregateService._merge(groups)
+        except IntegrityError:
+            # 他のプロセスが同じ日の集計行を先に作成したので、作成済みの行に対してやり直す
+            logger.info('日次集計の作成が競合したため再試行します')
+            return PriceAggregateService._merge(groups)
+
+    @staticmethod
+    def _merge(groups: Dict[Tuple[int, date], List[_Sample]]) -> int:
+        listing_ids = {listing_id for listing_id, _ in groups}
+        dates = {day for _, day in groups}
+
+        with transaction.atomic():
+            existing = {
+                (aggregate.product_on_ec_site_id, aggregate.date): aggregate
+                for aggregate in DailyPriceAggregate.objects.select_for_update().filter(
+                    product_on_ec_site_id__in=listing_ids, date__in=dates
+                )
+            }
+
+            to_create = []
+            to_update = []
+            for (listing_id, day), samples in groups.items():
+                summary = _summarize(samples)
+                aggregate = existing.get((listing_id, day))
+                if aggregate is None:
+                    to_create.append(
+                        DailyPriceAggregate(product_on_ec_site_id=listing_id, date=day, **summary)
+                    )
+                    continue
+
+                if summary['first_captured_at'] < aggregate.first_captured_at:
+                    _copy_sample(aggregate, summary, _OPEN_FIELDS)
+                if summary['last_captured_at'] >= aggregate.last_captured_at:
+                    _copy_sample(aggregate, summary, _CLOSE_FIELDS)
+                # 最安・最高は実効価格が同じなら早いサンプルを残す（rebuild と同じ結果にする）
+                if ((summary['min_effective_price'], summary['low_captured_at'])
+                        < (aggregate.min_effective_price, aggregate.low_captured_at)):
+                    _copy_sample(aggregate, summary, _LOW_FIELDS)
+                if ((-summary['max_effective_price'], summary['high_captured_at'])
+                        < (-aggregate.max_effective_price, aggregate.high_captured_at)):
+                    _copy_sample(aggregate, summary, _HIGH_FIELDS)
+                aggregate.sample_count += summary['sample_count']
+                aggregate.updated_at = timezone.now()
+                to_update.append(aggregate)
+
+            if to_update:
+                sample_fields = [field for fields in _SAMPLE_FIELDS for field in fields]
+                DailyPriceAggregate.objects.bulk_update(
+                    to_update, sample_fields + ['sample_count', 'updated_at']
+                )
+            if to_create:
+                DailyPriceAggregate.objects.bulk_create(to_create)
+
+        return len(to_create) + len(to_update)
+
+    @staticmethod
+    def rebuild(listing_ids: List[int], since: Optional[date] = None) -> int:
+        """
+        価格履歴から出品の日次集計を作り直す（バックフィル用）
+
+        Args:
+            listing_ids: 対象の出品ID
+            since: この日付以降だけを作り直す（省略時は全期間）
+
+        Returns:
+            int: 作成した集計行の数
+        """
+        history = PriceHistory.objects.filter(product_on_ec_site_id__in=listing_ids)
+        aggregates = DailyPriceAggregate.objects.filter(product_on_ec_site_id__in=listing_ids)
+        if since is not None:
+            since_at = timezone.make_aware(datetime.combine(since, datetime.min.time()))
+            history = history.filter(captured_at__gte=since_at)
+            aggregates = aggregates.filter(date__gte=since)
+
+        rows = history.order_by().values_list(
+            'product_on_ec_site_id', 'captured_at', 'price', 'points', 'effective_price'
+        ).iterator(chunk_size=5000)
+        to_create = [
+            DailyPriceAggregate(product_on_ec_site_id=listing_id, date=day, **_summarize(samples))
+            for (listing_id, day), samples in _group_by_day(rows).items()
+        ]
+
+        with transaction.atomic():
+            aggregates.delete()
+            DailyPriceAggregate.objects.bulk_create(to_create, batch_size=1000)
+        return len(to_create)
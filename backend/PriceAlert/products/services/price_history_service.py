@@ -0,0 +1,293 @@
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from ..models import DailyPriceAggregate, PriceHistory, ProductOnECSite
+from .price_aggregate_service import aggregate_samples, ohlc_samples
+
+logger = logging.getLogger(__name__)
+
+# 1系列あたりの点数（指定がない場合・上限）
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+
+# 期間の端を丸める幅の候補（1点あたりの時間幅以上で最小のものを使う。上限は1日）
+SNAP_STEPS = (
+    timedelta(minutes=1),
+    timedelta(minutes=5),
+    timedelta(minutes=15),
+    timedelta(hours=1),
+    timedelta(hours=6),
+    timedelta(days=1),
+)
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _snap_step(start: Optional[datetime], end: Optional[datetime], points: int) -> timedelta:
+    """1点あたりの時間幅から、期間の端を丸める幅を決める"""
+    if start is None:
+        return SNAP_STEPS[-1]
+    resolution = ((end or timezone.now()) - start) / points
+    for step in SNAP_STEPS:
+        if step >= resolution:
+            return step
+    return SNAP_STEPS[-1]
+
+
+def snap_range(start: Optional[datetime], end: Optional[datetime],
+               points: int) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    取得期間の開始を切り下げ、終了を切り上げる
+
+    丸め幅はグラフの1点あたりの時間幅以下なので見た目は変わらない。
+    クライアントが秒単位で異なる期間を指定しても同じキャッシュキーになる
+    """
+    step = _snap_step(start, end, points)
+    if start is not None:
+        start = _EPOCH + ((start - _EPOCH) // step) * step
+    if end is not None:
+        floored = _EPOCH + ((end - _EPOCH) // step) * step
+        end = floored if floored == end else floored + step
+    return start, end
+
+
+def largest_triangle_three_buckets(xs: Sequence[float], ys: Sequence[float],
+                                   threshold: int) -> List[int]:
+    """
+    LTTB（Largest-Triangle-Three-Buckets）でダウンサンプリングする
+
+    先頭と末尾の点を残し、間の点を threshold - 2 個のバケットに分けて、
+    各バケットから前後の点と作る三角形の面積が最大になる点を選ぶ。
+    価格の急な上下（セールなど）がグラフから消えにくい
+
+    Returns:
+        List[int]: 残す点のインデックス（昇順）
+    """
+    if threshold < 3:
+        raise ValueError('threshold は3以上を指定してください')
+    length = len(xs)
+    if threshold >= length:
+        return list(range(length))
+
+    selected = [0]
+    bucket_size = (length - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # 次のバケットの平均点を三角形の3点目にする
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, length)
+        next_count = next_end - next_start
+        avg_x = sum(xs[next_start:next_end]) / next_count
+        avg_y = sum(ys[next_start:next_end]) / next_count
+
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        ax, ay = xs[a], ys[a]
+        max_area = -1.0
+        max_index = start
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > max_area:
+                max_area = area
+                max_index = j
+
+        selected.append(max_index)
+        a = max_index
+
+    selected.append(length - 1)
+    return selected
+
+
+class PriceHistoryService:
+    """価格履歴のグラフ用データを扱うビジネスロジック"""
+
+    @staticmethod
+    def build_series(product_id: int, start: Optional[datetime] = None,
+                     end: Optional[datetime] = None, site_codes: Optional[List[str]] = None,
+                     points: int = DEFAULT_POINTS) -> Dict[str, Any]:
+        """
+        商品の価格履歴を出品ごとの列形式で返す
+
+        各系列は実効価格でLTTBを行い、points 個以下にダウンサンプリングする。
+        1点あたりの時間幅が1時間以上のときは、先に時間・日ごとの始値・最安・最高・終値の
+        サンプルに間引いてから行う。日ごとの場合、期間に丸ごと含まれる日は日次集計から読み込む
+
+        Args:
+            product_id: 商品ID
+            start: 取得開始日時（以上）
+            end: 取得終了日時（以下）
+            site_codes: 対象のECサイトコード（省略時はすべて）
+            points: 1系列あたりの最大点数
+
+        Returns:
+            Dict[str, Any]: {'product_id', 'start', 'end', 'points', 'series': [...]}
+        """
+        listings = ProductOnECSite.objects.filter(product_id=product_id)
+        listings = listings.select_related('ec_site').order_by('id')
+        history = PriceHistory.objects.filter(product_on_ec_site__product_id=product_id)
+        if site_codes:
+            listings = listings.filter(ec_site__code__in=site_codes)
+            history = history.filter(product_on_ec_site__ec_site__code__in=site_codes)
+        if start is not None:
+            history = history.filter(captured_at__gte=start)
+        if end is not None:
+            history = history.filter(captured_at__lte=end)
+
+        kind = PriceHistoryService._bucket_kind(history, start, end, points)
+        if kind == 'day':
+            rows_by_listing, totals = PriceHistoryService._load_days(listings, history, start, end)
+        elif kind == 'hour':
+            rows_by_listing, totals = PriceHistoryService._load_rows(history)
+            rows_by_listing = PriceHistoryService._reduce(rows_by_listing, _hour_of)
+        else:
+            rows_by_listing, totals = PriceHistoryService._load_rows(history)
+
+        series = []
+        for listing in listings:
+            listing_rows = rows_by_listing.get(listing.pk)
+            if not listing_rows:
+                continue
+            total = totals[listing.pk]
+            if len(listing_rows) > points:
+                xs = [row[0].timestamp() for row in listing_rows]
+                ys = [row[3] for row in listing_rows]
+                selected = largest_triangle_three_buckets(xs, ys, points)
+                listing_rows = [listing_rows[i] for i in selected]
+
+            timestamps, prices, price_points, effective_prices = (
+                list(column) for column in zip(*listing_rows)
+            )
+            series.append({
+                'product_on_ec_site_id': listing.pk,
+                'ec_site': {
+                    'id': listing.ec_site.id,
+                    'name': listing.ec_site.name,
+                    'code': listing.ec_site.code,
+                },
+                'seller_name': listing.seller_name,
+                'total_count': total,
+                'timestamps': timestamps,
+                'prices': prices,
+                'points': price_points,
+                'effective_prices': effective_prices,
+            })
+
+        logger.debug(f'価格履歴の系列を作成しました - 商品ID: {product_id}, 系列数: {len(series)}')
+        return {
+            'product_id': int(product_id),
+            'start': start,
+            'end': end,
+            'points': points,
+            'series': series,
+        }
+
+    @staticmethod
+    def _bucket_kind(history, start: Optional[datetime], end: Optional[datetime],
+                     points: int) -> Optional[str]:
+        """サンプルを間引く単位（'day' / 'hour'）を返す。間引かない場合は None"""
+        if start is None:
+            start = history.aggregate(first=Min('captured_at'))['first']
+            if start is None:
+                return None
+        resolution = ((end or timezone.now()) - start) / points
+        if resolution >= timedelta(days=1):
+            return 'day'
+        if resolution >= timedelta(hours=1):
+            return 'hour'
+        return None
+
+    @staticmethod
+    def _load_rows(history) -> Tuple[Dict[int, List[tuple]], Dict[int, int]]:
+        """価格履歴をそのまま読み込む"""
+        rows_by_listing: Dict[int, List[tuple]] = defaultdict(list)
+        rows = history.order_by('captured_at', 'id').values_list(
+            'product_on_ec_site_id', 'captured_at', 'price', 'points', 'effective_price'
+        )
+        for listing_id, *columns in rows.iterator(chunk_size=5000):
+            rows_by_listing[listing_id].append(tuple(columns))
+        totals = {listing_id: len(rows) for listing_id, rows in rows_by_listing.items()}
+        return rows_by_listing, totals
+
+    @staticmethod
+    def _reduce(rows_by_listing: Dict[int, List[tuple]],
+                bucket_of: Callable[[datetime], Hashable]) -> Dict[int, List[tuple]]:
+        """captured_at順の価格履歴を、バケットごとに始値・最安・最高・終値のサンプルに間引く"""
+        reduced: Dict[int, List[tuple]] = {}
+        for listing_id, rows in rows_by_listing.items():
+            buckets: Dict[Hashable, List[tuple]] = {}
+            for row in rows:
+                buckets.setdefault(bucket_of(row[0]), []).append(row)
+            reduced[listing_id] = [
+                sample for samples in buckets.values() for sample in ohlc_samples(samples)
+            ]
+        return reduced
+
+    @staticmethod
+    def _load_days(listings, history, start: Optional[datetime],
+                   end: Optional[datetime]) -> Tuple[Dict[int, List[tuple]], Dict[int, int]]:
+        """
+        日ごとの始値・最安・最高・終値のサンプルを読み込む
+
+        期間に丸ごと含まれる日は日次集計から読み込み、期間の端で一部だけ含まれる日は
+        期間内の価格履歴から作る（日次集計には期間外のサンプルも含まれるため）
+        """
+        first_day, last_day = _full_days(start, end)
+        if first_day is not None and last_day is not None and first_day > last_day:
+            # 丸ごと含まれる日がない
+            rows_by_listing, totals = PriceHistoryService._load_rows(history)
+            return PriceHistoryService._reduce(rows_by_listing, timezone.localdate), totals
+
+        full_days = Q()
+        aggregates = DailyPriceAggregate.objects.filter(product_on_ec_site__in=listings)
+        if first_day is not None:
+            full_days &= Q(captured_at__gte=_midnight(first_day))
+            aggregates = aggregates.filter(date__gte=first_day)
+        if last_day is not None:
+            full_days &= Q(captured_at__lt=_midnight(last_day + timedelta(days=1)))
+            aggregates = aggregates.filter(date__lte=last_day)
+
+        rows_by_listing: Dict[int, List[tuple]] = {}
+        totals: Dict[int, int] = {}
+        if start is not None or end is not None:
+            rows_by_listing, totals = PriceHistoryService._load_rows(history.exclude(full_days))
+            rows_by_listing = PriceHistoryService._reduce(rows_by_listing, timezone.localdate)
+
+        for aggregate in aggregates.order_by().iterator(chunk_size=5000):
+            listing_id = aggregate.product_on_ec_site_id
+            rows_by_listing.setdefault(listing_id, []).extend(aggregate_samples(aggregate))
+            totals[listing_id] = totals.get(listing_id, 0) + aggregate.sample_count
+        for rows in rows_by_listing.values():
+            rows.sort(key=lambda row: row[0])
+        return rows_by_listing, totals
+
+
+def _hour_of(captured_at: datetime) -> datetime:
+    return captured_at.replace(minute=0, second=0, microsecond=0)
+
+
+def _midnight(day: date) -> datetime:
+    """現在のタイムゾーンでの day の0時"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _full_days(start: Optional[datetime],
+               end: Optional[datetime]) -> Tuple[Optional[date], Optional[date]]:
+    """
+    期間 [start, end] に丸ごと含まれる最初と最後の日付（現在のタイムゾーン）を返す
+    開始・終了がない場合は、その側の制限がないので None
+    """
+    first_day = last_day = None
+    if start is not None:
+        first_day = timezone.localdate(start)
+        if _midnight(first_day) < start:
+            first_day += timedelta(days=1)
+    if end is not None:
+        # end の日は、end より後の同じ日のサンプルが期間外になる
+        last_day = timezone.localdate(end) - timedelta(days=1)
+    return first_day, last_day
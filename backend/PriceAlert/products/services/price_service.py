@@ -1,9 +1,12 @@
 import logging
 
-from typing import List, Optional, Dict, Any
+from typing import Iterable, List, Optional, Dict, Any
 from django.db import transaction
+from django.utils import timezone
+from notifications.services import NotificationService
 from ..connectors.factory import ECConnectorFactory
 from ..models import ProductOnECSite, Product
+from .refresh_schedule_service import RefreshScheduleService
 from .save_to_db_service import SaveToDBService as sds
 
 logger = logging.getLogger(__name__)
@@ -14,12 +17,21 @@ class PriceService:
     def __init__(self):
         self.factory = ECConnectorFactory()
 
-    def fetch_price(self) -> Dict[str, int]:
-        """URLから商品を検索"""
+    def fetch_price(self, product_ids: Optional[Iterable[int]] = None) -> Dict[str, int]:
+        """
+        URLから商品を検索
+
+        Args:
+            product_ids: 指定した場合はこの商品のみ更新する（指定しない場合はすべての商品）
+        """
         logger.info('価格取得を開始します')
+        started_at = timezone.now()
         
         # すべての商品を取得
         products = Product.objects.all()
+        if product_ids is not None:
+            products = products.filter(pk__in=list(product_ids))
+        refreshed_ids: List[int] = []
 
         # JANコードごとにループ
         stats_all = {
@@ -27,6 +39,8 @@ class PriceService:
             'new_price_histories': 0
         }
         for product in products:
+            # 見つからなかった商品・失敗した商品も、次回の更新時刻まではスキップする
+            refreshed_ids.append(product.pk)
 
             jan_code = product.jan_code
             if jan_code is None:
@@ -35,10 +49,16 @@ class PriceService:
 
             # 各ECサイトで価格を取得
             try:
-                found_products = self.factory.search_by_jan_code(jan_code)
+                # 価格更新は常に最新の価格を取得し、結果を商品登録用のキャッシュに保存する
+                # 商品は作成済みなので、商品説明は受け取らない
+                # 検索に失敗したECサイトの出品は無効にしないので、検索に成功したECサイトも受け取る
+                found_products, answered_sites = self.factory.search_sites_by_jan_code(
+                    jan_code, refresh=True, details=False
+                )
                 if not found_products:
                     # TODO: 商品が見つからないときはsearch_by_jan_code内で処理をするべきか
                     logger.warning(f'JANコードから商品が見つかりません - JANコード: {jan_code}')
+                    sds.deactivate_unlisted(product.pk, answered_sites, [])
                     continue
             except Exception as e:
                 logger.error('価格取得に失敗しました - JANコード: %s, エラー: %s', 
@@ -46,10 +66,14 @@ class PriceService:
                 continue
             
             products_with_info = [(product, found_product) for found_product in found_products]
-            ec_site_cache = {}
             with transaction.atomic():
-                results = sds.save_product_on_ec_site_and_price_history_batch(products_with_info, ec_site_cache)
-            
+                results = sds.save_product_on_ec_site_and_price_history_batch(products_with_info)
+                # 今回の検索結果に含まれなかった出品は、価格が古いので無効にする
+                listed_ids = [listing.pk for listing, _, _ in results]
+                deactivated = sds.deactivate_unlisted(product.pk, answered_sites, listed_ids)
+            if deactivated:
+                logger.info(f'検索結果に含まれなかった出品を無効にしました - JANコード: {jan_code}, 件数: {deactivated}')
+
 
             # 統計情報の更新
             stats = {
@@ -68,6 +92,20 @@ class PriceService:
             stats_all['new_ec_sites'] += stats['new_ec_sites']
             stats_all['new_price_histories'] += stats['new_price_histories']
 
+            # 価格変動があった商品はその場でアラートをチェックし、即時通知ユーザーへの配信を予約する
+            if stats['new_price_histories']:
+                try:
+                    NotificationService.check_price_alerts(product_ids=[product.pk])
+                except Exception as e:
+                    logger.error('価格変動時のアラートチェックに失敗しました - JANコード: %s, エラー: %s',
+                                 jan_code, str(e))
+
+        # 価格の変動を反映して、次回の更新時刻を決める
+        try:
+            RefreshScheduleService.reschedule(refreshed_ids, refreshed_at=started_at)
+        except Exception as e:
+            logger.error('価格更新スケジュールの更新に失敗しました - エラー: %s', str(e))
+
         return stats_all
 
 
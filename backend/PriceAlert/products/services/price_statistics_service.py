@@ -0,0 +1,299 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import PriceHistory, PriceStatistics, ProductOnECSite
+
+logger = logging.getLogger(__name__)
+
+# 統計を保持する期間（日）
+WINDOWS = (7, 30, 90)
+
+# (価格, その価格になった日時, 期間から外れる日時)
+_Extreme = Tuple[Optional[int], Optional[datetime], Optional[datetime]]
+
+
+def _get_extreme(stats: PriceStatistics, kind: str, days: int) -> _Extreme:
+    prefix = f'{kind}_{days}d'
+    return (getattr(stats, f'{prefix}_price'), getattr(stats, f'{prefix}_at'),
+            getattr(stats, f'{prefix}_expires_at'))
+
+
+def _set_extreme(stats: PriceStatistics, kind: str, days: int, extreme: _Extreme) -> None:
+    prefix = f'{kind}_{days}d'
+    price, at, expires_at = extreme
+    setattr(stats, f'{prefix}_price', price)
+    setattr(stats, f'{prefix}_at', at)
+    setattr(stats, f'{prefix}_expires_at', expires_at)
+
+
+def _is_better(kind: str, price: int, current: Optional[int]) -> bool:
+    if current is None:
+        return True
+    return price <= current if kind == 'min' else price >= current
+
+
+class PriceStatisticsService:
+    """
+    価格統計（PriceStatistics）を扱うビジネスロジック
+
+    新しい価格は各期間の最安値・最高値と比較するだけで反映する（O(1)）。
+    最安値・最高値が期間から外れたときだけ、その出品の期間内の価格履歴から再計算する
+    """
+
+    @staticmethod
+    def record(price_histories: List[PriceHistory]) -> None:
+        """新しく保存した価格履歴を価格統計に反映する"""
+        histories_by_listing: Dict[int, List[PriceHistory]] = defaultdict(list)
+        for history in price_histories:
+            histories_by_listing[history.product_on_ec_site_id].append(history)
+        if not histories_by_listing:
+            return
+
+        with transaction.atomic():
+            stats_by_listing = PriceStatisticsService._lock_or_create(list(histories_by_listing))
+            for listing_id, histories in histories_by_listing.items():
+                stats = stats_by_listing[listing_id]
+                for history in sorted(histories, key=lambda h: h.captured_at):
+                    PriceStatisticsService._apply(
+                        stats, history.effective_price, history.captured_at
+                    )
+                stats.save()
+
+    @staticmethod
+    def _lock_or_create(listing_ids: List[int]) -> Dict[int, PriceStatistics]:
+        existing = {
+            stats.product_on_ec_site_id: stats
+            for stats in PriceStatistics.objects.select_for_update().filter(
+                product_on_ec_site_id__in=listing_ids
+            )
+        }
+        missing = [listing_id for listing_id in listing_ids if listing_id not in existing]
+        if missing:
+            products = dict(
+                ProductOnECSite.objects.filter(id__in=missing).values_list('id', 'product_id')
+            )
+            PriceStatistics.objects.bulk_create(
+                [PriceStatistics(product_on_ec_site_id=listing_id, product_id=products[listing_id])
+                 for listing_id in missing],
+                ignore_conflicts=True,
+            )
+            existing.update({
+                stats.product_on_ec_site_id: stats
+                for stats in PriceStatistics.objects.select_for_update().filter(
+                    product_on_ec_site_id__in=missing
+                )
+            })
+        return existing
+
+    @staticmethod
+    def _apply(stats: PriceStatistics, price: int, captured_at: datetime) -> None:
+        """1件の価格を統計に反映する"""
+        for days in WINDOWS:
+            window = timedelta(days=days)
+            for kind in ('min', 'max'):
+                value, at, expires_at = _get_extreme(stats, kind, days)
+                if value is not None and expires_at is None:
+                    # 現在の価格が終わるので、その価格は days 日後に期間から外れる
+                    expires_at = captured_at + window
+                if expires_at is not None and expires_at <= captured_at:
+                    # 期間から外れた。新しい価格も含めて価格履歴から再計算する
+                    extreme = PriceStatisticsService._scan(
+                        stats.product_on_ec_site_id, kind, days, captured_at
+                    )
+                    _set_extreme(stats, kind, days, extreme)
+                    continue
+                if _is_better(kind, price, value):
+                    value, at, expires_at = price, captured_at, None
+                _set_extreme(stats, kind, days, (value, at, expires_at))
+
+        if stats.all_time_low_price is None or price < stats.all_time_low_price:
+            stats.all_time_low_price = price
+            stats.all_time_low_at = captured_at
+        stats.current_price = price
+        stats.current_since = captured_at
+
+    @staticmethod
+    def _scan(listing_id: int, kind: str, days: int, now: datetime) -> _Extreme:
+        """
+        期間内に有効だった価格から最安値（最高値）を求める
+        期間の開始時点で有効だった価格（開始前の最後の価格履歴）も含める
+        """
+        window_start = now - timedelta(days=days)
+        history = PriceHistory.objects.filter(product_on_ec_site_id=listing_id,
+                                              captured_at__lte=now)
+        rows = list(
+            history.filter(captured_at__gte=window_start)
+            .order_by('captured_at', 'id')
+            .values_list('effective_price', 'captured_at')
+        )
+        carried = (
+            history.filter(captured_at__lt=window_start)
+            .order_by('-captured_at', '-id')
+            .values_list('effective_price', 'captured_at')
+            .first()
+        )
+        if carried:
+            rows.insert(0, carried)
+
+        best: _Extreme = (None, None, None)
+        for i, (price, captured_at) in enumerate(rows):
+            if _is_better(kind, price, best[0]):
+                # 次の価格履歴でその価格が終わる（最後の価格は現在も有効）
+                ended_at = rows[i + 1][1] if i + 1 < len(rows) else None
+                best = (price, captured_at, ended_at + timedelta(days=days) if ended_at else None)
+        return best
+
+    @staticmethod
+    def refresh_expired(stats: PriceStatistics, now: Optional[datetime] = None) -> PriceStatistics:
+        """
+        期限切れの期間だけ再計算して保存する（読み取り時に使用）
+
+        読み取った後に record() が同じ行を更新していることがあるので、
+        行をロックして読み直してから再計算する。保存した最新の行を返す
+        """
+        now = now or timezone.now()
+        if not PriceStatisticsService._expired_windows(stats, now):
+            return stats
+
+        with transaction.atomic():
+            locked = PriceStatistics.objects.select_for_update().filter(pk=stats.pk).first()
+            if locked is None:
+                return stats
+            expired = PriceStatisticsService._expired_windows(locked, now)
+            listing_id = locked.product_on_ec_site_id
+            for kind, days in expired:
+                extreme = PriceStatisticsService._scan(listing_id, kind, days, now)
+                _set_extreme(locked, kind, days, extreme)
+            if expired:
+                locked.save()
+        return locked
+
+    @staticmethod
+    def _expired_windows(stats: PriceStatistics, now: datetime) -> List[Tuple[str, int]]:
+        expired = []
+        for days in WINDOWS:
+            for kind in ('min', 'max'):
+                _, _, expires_at = _get_extreme(stats, kind, days)
+                if expires_at is not None and expires_at <= now:
+                    expired.append((kind, days))
+        return expired
+
+    @staticmethod
+    def rebuild(listing_ids: List[int]) -> int:
+        """価格履歴から価格統計を作り直す（バックフィル用）"""
+        now = timezone.now()
+        count = 0
+        for listing in ProductOnECSite.objects.filter(id__in=listing_ids).only('id', 'product_id'):
+            history = PriceHistory.objects.filter(product_on_ec_site_id=listing.id)
+            latest = history.order_by('-captured_at', '-id').values_list(
+                'effective_price', 'captured_at'
+            ).first()
+            if latest is None:
+                continue
+            lowest = history.order_by('effective_price', 'captured_at').values_list(
+                'effective_price', 'captured_at'
+            ).first()
+
+            stats = PriceStatistics(
+                product_on_ec_site_id=listing.id,
+                product_id=listing.product_id,
+                current_price=latest[0],
+                current_since=latest[1],
+                all_time_low_price=lowest[0],
+                all_time_low_at=lowest[1],
+            )
+            for days in WINDOWS:
+                for kind in ('min', 'max'):
+                    extreme = PriceStatisticsService._scan(listing.id, kind, days, now)
+                    _set_extreme(stats, kind, days, extreme)
+            stats.save()
+            count += 1
+        return count
+
+    @staticmethod
+    def to_dict(stats: PriceStatistics) -> Dict[str, Any]:
+        """APIレスポンス用の形式にする"""
+        data: Dict[str, Any] = {
+            'current_price': stats.current_price,
+            'current_since': stats.current_since,
+        }
+        for days in WINDOWS:
+            min_price, min_at, _ = _get_extreme(stats, 'min', days)
+            max_price, max_at, _ = _get_extreme(stats, 'max', days)
+            data[f'{days}d'] = {
+                'min_price': min_price, 'min_at': min_at, 'max_price': max_price, 'max_at': max_at,
+            }
+        data['all_time_low'] = {'price': stats.all_time_low_price, 'at': stats.all_time_low_at}
+        return data
+
+    @staticmethod
+    def get_for_product(product_id: int) -> Dict[str, Any]:
+        """
+        商品の価格統計を返す
+        商品全体の値は、出品ごとの統計の最安値・最高値をまとめたもの
+
+        Returns:
+            Dict[str, Any]: {'product': {...}, 'listings': [{'product_on_ec_site_id', ...}, ...]}
+        """
+        now = timezone.now()
+        listings = []
+        product: Dict[str, Any] = {}
+        statistics = PriceStatistics.objects.filter(product_id=product_id)
+        for stats in statistics.order_by('product_on_ec_site_id'):
+            stats = PriceStatisticsService.refresh_expired(stats, now)
+            data = PriceStatisticsService.to_dict(stats)
+            listings.append({'product_on_ec_site_id': stats.product_on_ec_site_id, **data})
+
+            for days in WINDOWS:
+                key = f'{days}d'
+                merged = product.setdefault(
+                    key, {'min_price': None, 'min_at': None, 'max_price': None, 'max_at': None}
+                )
+                window = data[key]
+                min_price, max_price = window['min_price'], window['max_price']
+                if min_price is not None and (merged['min_price'] is None
+                                              or min_price < merged['min_price']):
+                    merged['min_price'], merged['min_at'] = min_price, window['min_at']
+                if max_price is not None and (merged['max_price'] is None
+                                              or max_price > merged['max_price']):
+                    merged['max_price'], merged['max_at'] = max_price, window['max_at']
+            low = product.setdefault('all_time_low', {'price': None, 'at': None})
+            price = data['all_time_low']['price']
+            if price is not None and (low['price'] is None or price < low['price']):
+                product['all_time_low'] = dict(data['all_time_low'])
+
+        return {'product_id': int(product_id), 'product': product, 'listings': listings}
+
+    @staticmethod
+    def lowest_window(product_on_ec_site_id: int, price: int) -> Optional[int]:
+        """
+        price が直近何日間の最安値にあたるかを返す（アラート用）
+
+        価格の記録がその期間より短い場合は、その期間の最安値とはみなさない
+
+        Returns:
+            Optional[int]: 最安値にあたる最長の期間（日）。どの期間でも最安値でなければNone
+        """
+        stats = (
+            PriceStatistics.objects.select_related('product_on_ec_site')
+            .filter(product_on_ec_site_id=product_on_ec_site_id)
+            .first()
+        )
+        if stats is None:
+            return None
+        now = timezone.now()
+        tracked_since = stats.product_on_ec_site.created_at
+        stats = PriceStatisticsService.refresh_expired(stats, now)
+        longest = None
+        for days in WINDOWS:
+            min_price, _, _ = _get_extreme(stats, 'min', days)
+            if tracked_since > now - timedelta(days=days):
+                break
+            if min_price is not None and price <= min_price:
+                longest = days
+        return longest
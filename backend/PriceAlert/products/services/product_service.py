@@ -1,11 +1,11 @@
 import logging
-import time
 from collections import defaultdict
 
-from typing import Dict, List, Optional, Set, Any
+from typing import List, Optional, Set
 from django.db import transaction, connection
 
 from ..models import Product
+from ..connectors.base import ProductData
 from ..connectors.factory import ECConnectorFactory
 from .save_to_db_service import SaveToDBService as sds
 
@@ -26,7 +26,7 @@ class ProductService:
 
         try:
             # 処理結果格納用
-            all_product_infos: List[Dict[str, Any]] = []
+            all_product_infos: List[ProductData] = []
             jan_codes: Set[str] = set()
 
             # URLが指定されている場合はURLから検索
@@ -58,7 +58,6 @@ class ProductService:
                 return []
 
             # キャッシュを用意（コード→オブジェクト）
-            ec_site_cache = {}
             product_cache = {}
 
             # 検索結果をDBに保存
@@ -72,22 +71,22 @@ class ProductService:
                 # 商品情報を一括保存
                 products_with_info = []
                 for product_info in all_product_infos:
-                    if 'jan_code' in product_info and product_info['jan_code']:
-                        if product_info['jan_code'] not in product_cache:
+                    if product_info.jan_code:
+                        if product_info.jan_code not in product_cache:
                             saved_product, created = sds.save_product(product_info)
                             stats['new_products'] += 1 if created else 0
                             saved_products.append(saved_product)
-                            product_cache[product_info['jan_code']] = saved_product
+                            product_cache[product_info.jan_code] = saved_product
 
                             saved_user_product, created = sds.save_user_product(saved_product, user_id, price_threshold)
                         else:
-                            saved_product = product_cache[product_info['jan_code']]
+                            saved_product = product_cache[product_info.jan_code]
                         
                         products_with_info.append((saved_product, product_info))
                 
                 # 一括で処理を実行
                 if products_with_info:
-                    results = sds.save_product_on_ec_site_and_price_history_batch(products_with_info, ec_site_cache)
+                    results = sds.save_product_on_ec_site_and_price_history_batch(products_with_info)
                     
                     # 統計情報の更新
                     for _, created, is_price_changed in results:
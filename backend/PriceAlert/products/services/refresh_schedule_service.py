@@ -0,0 +1,240 @@
+import logging
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from ..models import PriceHistory, Product, ProductOnECSite, RefreshSchedule, UserProduct
+
+logger = logging.getLogger(__name__)
+
+# 価格の変動頻度を数える期間（日）
+CHANGE_RATE_WINDOW_DAYS = 30
+# 1日あたりの価格変動1回ごとに、更新の優先度を何倍分上げるか
+CHANGE_RATE_WEIGHT = 4.0
+# (現在価格と通知閾値の差の割合の上限, 優先度の倍率)。閾値に近い商品ほど頻繁に更新する
+THRESHOLD_PROXIMITY_FACTORS = ((0.05, 3.0), (0.15, 2.0))
+# 一度に集計する商品数
+BATCH_SIZE = 500
+
+
+class RefreshScheduleService:
+    """
+    商品ごとの価格更新スケジュール（RefreshSchedule）を扱うビジネスロジック
+
+    すべての商品を同じ間隔で更新するのではなく、価格がよく変わる商品・登録ユーザーの多い商品・
+    価格が通知閾値に近い商品を頻繁に更新し、外部APIの呼び出し回数をそれらの商品に割り当てる
+    """
+
+    @staticmethod
+    def compute_interval_minutes(change_rate: float, watcher_count: int,
+                                 threshold_gap: Optional[float]) -> int:
+        """
+        更新間隔（分）を計算する
+
+        Args:
+            change_rate: 1日あたりの価格変動回数
+            watcher_count: 通知を有効にしている登録ユーザー数
+            threshold_gap: 現在の最安値と最も近い通知閾値との差（閾値に対する割合、閾値がなければNone）
+        """
+        if watcher_count <= 0:
+            return settings.PRICE_REFRESH_MAX_INTERVAL_MINUTES
+
+        urgency = (1 + CHANGE_RATE_WEIGHT * change_rate) * (1 + math.log(watcher_count))
+        if threshold_gap is not None:
+            for max_gap, factor in THRESHOLD_PROXIMITY_FACTORS:
+                if threshold_gap <= max_gap:
+                    urgency *= factor
+                    break
+
+        interval = settings.PRICE_REFRESH_BASE_INTERVAL_MINUTES / urgency
+        return int(min(max(interval, settings.PRICE_REFRESH_MIN_INTERVAL_MINUTES),
+                       settings.PRICE_REFRESH_MAX_INTERVAL_MINUTES))
+
+    @staticmethod
+    def claim_due_product_ids(now: Optional[datetime] = None,
+                              limit: Optional[int] = None) -> List[int]:
+        """
+        更新時刻を過ぎた商品を取り出し、次回の更新時刻を PRICE_REFRESH_LEASE_MINUTES だけ先に進めて返す
+
+        定期タスクの実行が重なったり、リトライされたりしても、同じ商品の価格を二重に取得しない。
+        他のトランザクションがロックしているスケジュールは飛ばす。
+        価格更新が終わると reschedule で次回の更新時刻を計算し直す。
+        途中で失敗した商品は、期間が過ぎると再び取り出される
+
+        Returns:
+            List[int]: 商品ID（更新時刻の古い順。スケジュールのない商品の更新時刻は now）
+        """
+        now = now or timezone.now()
+        lease_until = now + timedelta(minutes=settings.PRICE_REFRESH_LEASE_MINUTES)
+        with transaction.atomic():
+            # スケジュールのない商品は、更新時刻を過ぎたスケジュールを作ってから一緒に取り出す
+            unscheduled = Product.objects.filter(refresh_schedule__isnull=True).order_by('pk')
+            unscheduled = unscheduled.values_list('pk', flat=True)
+            if limit is not None:
+                unscheduled = unscheduled[:limit]
+            RefreshSchedule.objects.bulk_create(
+                [RefreshSchedule(product_id=product_id, next_refresh_at=now,
+                                 interval_minutes=settings.PRICE_REFRESH_BASE_INTERVAL_MINUTES)
+                 for product_id in unscheduled],
+                ignore_conflicts=True,
+            )
+
+            due = (
+                RefreshSchedule.objects.select_for_update(skip_locked=True)
+                .filter(next_refresh_at__lte=now)
+                .order_by('next_refresh_at', 'product_id')
+                .values_list('product_id', flat=True)
+            )
+            product_ids = list(due[:limit] if limit is not None else due)
+            RefreshSchedule.objects.filter(product_id__in=product_ids).update(
+                next_refresh_at=lease_until, updated_at=now
+            )
+        return product_ids
+
+    @staticmethod
+    def reschedule(product_ids: Optional[Iterable[int]] = None,
+                   refreshed_at: Optional[datetime] = None, now: Optional[datetime] = None) -> int:
+        """
+        商品の更新間隔を計算し直して、次回の更新時刻を保存する
+
+        Args:
+            product_ids: 対象の商品ID（指定しない場合はすべての商品）
+            refreshed_at: 価格を更新した日時（価格更新の直後に呼ぶ場合に指定する）
+            now: 現在日時
+
+        Returns:
+            int: 保存したスケジュールの件数
+        """
+        now = now or timezone.now()
+        if product_ids is None:
+            product_ids = Product.objects.order_by('pk').values_list('pk', flat=True).iterator(
+                chunk_size=BATCH_SIZE
+            )
+
+        count = 0
+        batch: List[int] = []
+        for product_id in product_ids:
+            batch.append(product_id)
+            if len(batch) >= BATCH_SIZE:
+                count += RefreshScheduleService._reschedule_batch(batch, refreshed_at, now)
+                batch = []
+        if batch:
+            count += RefreshScheduleService._reschedule_batch(batch, refreshed_at, now)
+        logger.debug(f'価格更新スケジュールを更新しました - 件数: {count}')
+        return count
+
+    @staticmethod
+    def _reschedule_batch(product_ids: List[int], refreshed_at: Optional[datetime],
+                          now: datetime) -> int:
+        change_rates = RefreshScheduleService._change_rates(product_ids, now)
+        watcher_counts = dict(
+            UserProduct.objects.filter(product_id__in=product_ids, notification_enabled=True)
+            .values('product_id').annotate(count=Count('pk')).values_list('product_id', 'count')
+        )
+        threshold_gaps = RefreshScheduleService._threshold_gaps(product_ids)
+        last_refreshed = dict(
+            RefreshSchedule.objects.filter(product_id__in=product_ids)
+            .values_list('product_id', 'last_refreshed_at')
+        )
+
+        schedules = []
+        for product_id in product_ids:
+            change_rate = change_rates.get(product_id, 0.0)
+            watcher_count = watcher_counts.get(product_id, 0)
+            threshold_gap = threshold_gaps.get(product_id)
+            interval = RefreshScheduleService.compute_interval_minutes(
+                change_rate, watcher_count, threshold_gap
+            )
+
+            last_refreshed_at = refreshed_at or last_refreshed.get(product_id)
+            # 一度も更新していない商品はすぐに更新する
+            next_refresh_at = (
+                last_refreshed_at + timedelta(minutes=interval) if last_refreshed_at else now
+            )
+            schedules.append(RefreshSchedule(
+                product_id=product_id,
+                next_refresh_at=next_refresh_at,
+                last_refreshed_at=last_refreshed_at,
+                interval_minutes=interval,
+                change_rate=change_rate,
+                watcher_count=watcher_count,
+                threshold_gap=threshold_gap,
+            ))
+
+        RefreshSchedule.objects.bulk_create(
+            schedules,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['next_refresh_at', 'last_refreshed_at', 'interval_minutes',
+                           'change_rate', 'watcher_count', 'threshold_gap', 'updated_at'],
+        )
+        return len(schedules)
+
+    @staticmethod
+    def _change_rates(product_ids: List[int], now: datetime) -> Dict[int, float]:
+        """1日あたりの価格変動回数（価格履歴は価格が変わったときだけ記録される）"""
+        rows = (
+            PriceHistory.objects.filter(
+                product_on_ec_site__product_id__in=product_ids,
+                captured_at__gte=now - timedelta(days=CHANGE_RATE_WINDOW_DAYS),
+            )
+            .values('product_on_ec_site__product_id')
+            .annotate(count=Count('pk'))
+            .values_list('product_on_ec_site__product_id', 'count')
+        )
+        return {product_id: count / CHANGE_RATE_WINDOW_DAYS for product_id, count in rows}
+
+    @staticmethod
+    def _threshold_gaps(product_ids: List[int]) -> Dict[int, float]:
+        """現在の最安値と最も近い通知閾値との差（閾値に対する割合、閾値を下回っている場合は0）"""
+        thresholds: Dict[int, List[Tuple[str, int]]] = defaultdict(list)
+        for product_id, threshold_type, price_threshold in UserProduct.objects.filter(
+            product_id__in=product_ids, notification_enabled=True, price_threshold__gt=0
+        ).values_list('product_id', 'threshold_type', 'price_threshold'):
+            thresholds[product_id].append((threshold_type, price_threshold))
+        if not thresholds:
+            return {}
+
+        rows = (
+            ProductOnECSite.objects.filter(product_id__in=list(thresholds), is_active=True)
+            .values('product_id')
+            .annotate(current_price=Min('current_price'), effective_price=Min('effective_price'))
+        )
+        prices = {row['product_id']: row for row in rows}
+
+        gaps: Dict[int, float] = {}
+        for product_id, product_thresholds in thresholds.items():
+            row = prices.get(product_id)
+            if row is None:
+                continue
+            for threshold_type, price_threshold in product_thresholds:
+                # 閾値タイプ（実売価格か表示価格か）に基づいて現在価格を取得
+                if threshold_type == 'list_price':
+                    price = row['current_price']
+                else:
+                    price = row['effective_price']
+                if price is None:
+                    continue
+                gap = max(price - price_threshold, 0) / price_threshold
+                gaps[product_id] = min(gap, gaps.get(product_id, gap))
+        return gaps
+
+
+def reschedule_watched_product(sender, instance, **kwargs) -> None:
+    """UserProductの保存・削除時に呼ばれるシグナルハンドラー（登録ユーザー数・閾値の変更を反映する）"""
+    product_id = instance.product_id
+
+    def reschedule() -> None:
+        try:
+            RefreshScheduleService.reschedule([product_id])
+        except Exception as e:
+            logger.error(f'価格更新スケジュールの更新に失敗しました - 商品ID: {product_id}, エラー: {str(e)}')
+
+    # 商品登録のトランザクションを妨げないよう、コミット後に更新する
+    transaction.on_commit(reschedule)
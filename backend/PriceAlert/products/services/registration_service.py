@@ -0,0 +1,256 @@
+import csv
+import io
+import logging
+import re
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from ..cache import invalidate_user_lists
+from ..connectors.base import ProductData
+from ..connectors.factory import ECConnectorFactory
+from ..models import Product, RegistrationJob, UserProduct
+from .save_to_db_service import SaveToDBService as sds
+
+logger = logging.getLogger(__name__)
+
+JAN_CODE_PATTERN = re.compile(r'^\d{13}$')
+
+# 進捗をDBに書き込む間隔（秒）
+PROGRESS_FLUSH_INTERVAL = 1.0
+
+
+class RegistrationService:
+    """
+    商品登録ジョブ（一括登録・非同期登録）のビジネスロジック
+
+    URL → JANコードの変換と、JANコードでの全ECサイト検索をECサイトごとに並行して行い、
+    見つかった商品をまとめて保存する
+    """
+
+    def __init__(self):
+        self.factory = ECConnectorFactory()
+
+    @staticmethod
+    def parse_items(values: Iterable[Any]) -> Tuple[List[Dict[str, str]], List[str]]:
+        """
+        入力値をJANコード・URLに分類し、重複を除く
+
+        Returns:
+            Tuple[List[Dict[str, str]], List[str]]: 登録対象（{'type', 'value'}）と、JANコードでもURLでもない入力
+        """
+        items: List[Dict[str, str]] = []
+        rejected: List[str] = []
+        seen: Set[Tuple[str, str]] = set()
+        for value in values:
+            value = str(value or '').strip()
+            if not value:
+                continue
+            if JAN_CODE_PATTERN.match(value):
+                item = ('jan', value)
+            elif value.startswith(('http://', 'https://')):
+                # フラグメントは商品の特定に関係ないので除く
+                item = ('url', value.split('#', 1)[0])
+            else:
+                rejected.append(value)
+                continue
+            if item not in seen:
+                seen.add(item)
+                items.append({'type': item[0], 'value': item[1]})
+        return items, rejected
+
+    @staticmethod
+    def parse_csv(text: str) -> List[str]:
+        """CSVのすべてのセルを入力値として返す（列の位置・ヘッダーの有無は問わない）"""
+        return [cell for row in csv.reader(io.StringIO(text)) for cell in row]
+
+    @staticmethod
+    def create_job(user_id: int, items: List[Dict[str, str]], price_threshold: Optional[int] = None,
+                   kind: str = 'bulk') -> RegistrationJob:
+        """ジョブを作成し、コミット後にCeleryタスクを登録する"""
+        # 循環インポートを避けるため、ここでインポート
+        from ..tasks import run_registration_job
+
+        job = RegistrationJob.objects.create(
+            user_id=user_id,
+            kind=kind,
+            items=items,
+            price_threshold=price_threshold,
+            total=len(items),
+        )
+        transaction.on_commit(lambda: run_registration_job.delay(str(job.pk)))  # type: ignore
+        logger.info(f'商品登録ジョブを作成しました - ID: {job.pk}, 種類: {kind}, 件数: {len(items)}')
+        return job
+
+    def run(self, job_id) -> RegistrationJob:
+        """ジョブを実行する"""
+        job = RegistrationJob.objects.get(pk=job_id)
+        if job.status == 'completed':
+            return job
+
+        job.status = 'running'
+        job.started_at = timezone.now()
+        job.processed = job.succeeded = job.failed = 0
+        job.error = None
+        job.save(update_fields=['status', 'started_at', 'processed', 'succeeded', 'failed', 'error'])
+
+        try:
+            results = self._process(job)
+        except Exception as e:
+            logger.error(f'商品登録ジョブでエラーが発生しました - ID: {job.pk}, エラー: {str(e)}', exc_info=True)
+            RegistrationJob.objects.filter(pk=job.pk).update(
+                status='failed', error=str(e), finished_at=timezone.now()
+            )
+            raise
+
+        job.results = results
+        job.processed = len(results)
+        job.succeeded = sum(1 for result in results if result['status'] == 'registered')
+        job.failed = job.processed - job.succeeded
+        job.status = 'completed'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['results', 'processed', 'succeeded', 'failed', 'status', 'finished_at'])
+        logger.info(f'商品登録ジョブが完了しました - ID: {job.pk}, 登録: {job.succeeded}件, 失敗: {job.failed}件')
+        return job
+
+    def _process(self, job: RegistrationJob) -> List[Dict[str, Any]]:
+        results = [
+            {'type': item['type'], 'value': item['value'], 'status': 'pending',
+             'jan_codes': [], 'product_ids': [], 'error': None}
+            for item in job.items
+        ]
+        progress = _Progress(job)
+
+        # 1. URLからJANコードを検索
+        url_results = self.factory.search_by_urls(
+            [result['value'] for result in results if result['type'] == 'url']
+        )
+        for result in results:
+            if result['type'] == 'jan':
+                result['jan_codes'] = [result['value']]
+                continue
+            found = url_results.get(result['value'])
+            if isinstance(found, Exception):
+                result['status'], result['error'] = 'error', str(found)
+                progress.done()
+            elif not found:
+                result['status'] = 'not_found'
+                progress.done()
+            else:
+                result['jan_codes'] = sorted(found)
+
+        # 2. JANコードで全ECサイトを並行して検索
+        waiting: Dict[str, List[Dict[str, Any]]] = {}
+        for result in results:
+            for jan_code in result['jan_codes']:
+                waiting.setdefault(jan_code, []).append(result)
+        pending_jans = {id(result): set(result['jan_codes']) for result in results if result['jan_codes']}
+
+        def on_complete(jan_code: str, _infos) -> None:
+            for result in waiting.get(jan_code, []):
+                pending_jans[id(result)].discard(jan_code)
+                if not pending_jans[id(result)]:
+                    progress.done()
+
+        jan_results = self.factory.search_by_jan_codes(waiting.keys(), on_complete=on_complete)
+
+        # 3. まとめて保存
+        product_ids = self._save(job.user_id, jan_results, job.price_threshold)
+        for result in results:
+            if result['status'] != 'pending':
+                continue
+            result['product_ids'] = sorted({
+                product_id for jan_code in result['jan_codes'] for product_id in product_ids.get(jan_code, ())
+            })
+            result['status'] = 'registered' if result['product_ids'] else 'not_found'
+        return results
+
+    @staticmethod
+    def _save(user_id: int, jan_results: Dict[str, List[ProductData]],
+              price_threshold: Optional[int]) -> Dict[str, Set[int]]:
+        """
+        検索結果の商品・ユーザー商品・出品情報・価格履歴をまとめて保存する
+
+        Returns:
+            Dict[str, Set[int]]: 検索したJANコードごとの商品ID
+        """
+        infos_by_jan: Dict[str, List[ProductData]] = {}
+        seen_listings: Set[Tuple[str, str]] = set()
+        for infos in jan_results.values():
+            for info in infos:
+                listing_key = (info.ec_site, info.ec_product_id)
+                if not info.jan_code or listing_key in seen_listings:
+                    continue
+                seen_listings.add(listing_key)
+                infos_by_jan.setdefault(info.jan_code, []).append(info)
+        if not infos_by_jan:
+            return {}
+
+        with transaction.atomic():
+            # 同じJANコードを同時に登録しても商品が重複しないよう、検索から作成までをロックする
+            sds.lock_jan_codes(infos_by_jan)
+            products: Dict[str, Product] = {}
+            for product in Product.objects.filter(jan_code__in=list(infos_by_jan)).order_by('id'):
+                products.setdefault(product.jan_code, product)
+
+            new_products = []
+            for jan_code, infos in infos_by_jan.items():
+                if jan_code in products:
+                    continue
+                info = infos[0]
+                new_products.append(Product(
+                    jan_code=jan_code,
+                    model_number=info.model_number,
+                    name=info.name,
+                    description=info.description,
+                    image_url=info.image_url,
+                    manufacturer=info.manufacturer,
+                ))
+            for product in Product.objects.bulk_create(new_products):
+                products[product.jan_code] = product
+
+            registered = set(UserProduct.objects.filter(
+                user_id=user_id, product_id__in=[product.pk for product in products.values()]
+            ).values_list('product_id', flat=True))
+            UserProduct.objects.bulk_create([
+                UserProduct(
+                    user_id=user_id,
+                    product=product,
+                    notification_enabled=True,
+                    display_order=0,
+                    price_threshold=price_threshold,
+                )
+                for product in products.values() if product.pk not in registered
+            ])
+
+            products_with_info = [
+                (products[jan_code], info) for jan_code, infos in infos_by_jan.items() for info in infos
+            ]
+            sds.save_product_on_ec_site_and_price_history_batch(products_with_info)
+
+        invalidate_user_lists(user_id)
+
+        product_ids: Dict[str, Set[int]] = {}
+        for searched_jan_code, infos in jan_results.items():
+            for info in infos:
+                if info.jan_code in products:
+                    product_ids.setdefault(searched_jan_code, set()).add(products[info.jan_code].pk)
+        return product_ids
+
+
+class _Progress:
+    """ジョブの処理済み件数を一定間隔でDBに書き込む"""
+
+    def __init__(self, job: RegistrationJob) -> None:
+        self.job_id = job.pk
+        self.processed = 0
+        self._flushed_at = 0.0
+
+    def done(self) -> None:
+        self.processed += 1
+        now = time.monotonic()
+        if now - self._flushed_at >= PROGRESS_FLUSH_INTERVAL:
+            RegistrationJob.objects.filter(pk=self.job_id).update(processed=self.processed)
+            self._flushed_at = now
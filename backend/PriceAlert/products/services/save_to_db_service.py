@@ -1,32 +1,57 @@
 import logging
 from django.utils import timezone
-from typing import List, Dict, Any, Optional, Tuple
-from django.db import transaction
+from typing import Iterable, List, Dict, Optional, Tuple
+from django.db import connection, transaction
+from ..connectors.base import ProductData
 from ..models import ECSite, ProductOnECSite, PriceHistory, Product, UserProduct
+from ..cache import invalidate_products
+from ..ec_sites import ec_site_registry
+from .price_aggregate_service import PriceAggregateService
+from .price_statistics_service import PriceStatisticsService
 
 logger = logging.getLogger(__name__)
 
 class SaveToDBService:
     """DBに保存するためのサービス"""
     @staticmethod
-    def save_product(fetched_product_info: Dict[str, Any]) -> Tuple[Product, bool]:
+    def lock_jan_codes(jan_codes) -> None:
+        """
+        JANコードごとのアドバイザリロックを取得する（トランザクションの終了まで保持）
+
+        Productのjan_codeには一意制約がない（型番違いを別商品として保存する）ので、
+        JANコードで検索してなければ作成する処理は、このロックを取ってから行う。
+        デッドロックを避けるため、JANコードの順にロックする。PostgreSQL以外では何もしない
+        """
+        if connection.vendor != 'postgresql':
+            return
+        with connection.cursor() as cursor:
+            for jan_code in sorted(set(jan_codes)):
+                cursor.execute(
+                    'SELECT pg_advisory_xact_lock(hashtext(%s))', [f'product_jan:{jan_code}']
+                )
+
+    @staticmethod
+    def save_product(fetched_product_info: ProductData) -> Tuple[Product, bool]:
         """検索結果をDBに保存して、製品オブジェクトを返す"""
 
         # 商品の保存
-        jan_code = fetched_product_info.get('jan_code') # jan_code: str | None
-        model_number = fetched_product_info.get('model_number')
+        jan_code = fetched_product_info.jan_code # jan_code: str | None
+        model_number = fetched_product_info.model_number
         
         try:
-            product, created = Product.objects.get_or_create(
-                jan_code=jan_code,
-                model_number=model_number,
-                defaults={
-                    'name': fetched_product_info.get('name'),
-                    'description': fetched_product_info.get('description'),
-                    'image_url': fetched_product_info.get('image_url'),
-                    'manufacturer': fetched_product_info.get('manufacturer'),
-                }
-            )
+            with transaction.atomic():
+                if jan_code:
+                    SaveToDBService.lock_jan_codes([jan_code])
+                product, created = Product.objects.get_or_create(
+                    jan_code=jan_code,
+                    model_number=model_number,
+                    defaults={
+                        'name': fetched_product_info.name,
+                        'description': fetched_product_info.description,
+                        'image_url': fetched_product_info.image_url,
+                        'manufacturer': fetched_product_info.manufacturer,
+                    }
+                )
 
         except Exception as e:
             logger.error(f"Productの保存に失敗しました: {e}")
@@ -37,10 +62,10 @@ class SaveToDBService:
                 'productonecsite_set', 
                 'productonecsite_set__ec_site'
             ).get(pk=product.pk)
-            if not product.image_url and fetched_product_info.get('image_url'):
-                product.image_url = fetched_product_info.get('image_url')
-            if not product.manufacturer and fetched_product_info.get('manufacturer'):
-                product.manufacturer = fetched_product_info.get('manufacturer')
+            if not product.image_url and fetched_product_info.image_url:
+                product.image_url = fetched_product_info.image_url
+            if not product.manufacturer and fetched_product_info.manufacturer:
+                product.manufacturer = fetched_product_info.manufacturer
         return product, created
 
 
@@ -151,12 +176,46 @@ class SaveToDBService:
     #         logger.error(f"ProductOnECSiteの処理でエラー: {e}")
     #         raise
 
+    @staticmethod
+    def deactivate_unlisted(product_id: int, ec_site_codes: Iterable[str],
+                            listed_ids: List[int]) -> int:
+        """
+        価格更新で検索結果に含まれなかった商品の出品情報を無効にする
+
+        在庫切れ・中古など取得方針で除いた出品や、enough_offers 件より後の出品は
+        価格が更新されないので、古い価格のまま価格アラートの判定に使われないようにする。
+        次回以降の検索結果に含まれれば、保存時に有効に戻る。
+        検索に失敗したECサイトの出品は障害中に無効にしないよう、ec_site_codes のECサイトだけを対象にする
+
+        Args:
+            product_id: 商品ID
+            ec_site_codes: 検索に成功したECサイトのコード
+            listed_ids: 検索結果に含まれた出品のID
+
+        Returns:
+            int: 無効にした件数
+        """
+        ec_site_codes = list(ec_site_codes)
+        if not ec_site_codes:
+            return 0
+        count = ProductOnECSite.objects.filter(
+            product_id=product_id, ec_site__code__in=ec_site_codes, is_active=True
+        ).exclude(pk__in=listed_ids).update(is_active=False, updated_at=timezone.now())
+        if count:
+            invalidate_products([product_id])
+        return count
+
     @staticmethod
     def save_product_on_ec_site_and_price_history_batch(
-        products_info: List[Tuple[Product, Dict[str, Any]]], 
-        ec_site_cache: Dict[str, ECSite]
+        products_info: List[Tuple[Product, ProductData]], 
+        ec_site_cache: Optional[Dict[str, ECSite]] = None
     ) -> List[Tuple[ProductOnECSite, bool, bool]]:
-        """EC商品情報と価格履歴を一括で処理する最適化版"""
+        """
+        EC商品情報と価格履歴を一括で処理する最適化版
+        ec_site_cache にないECサイトは、プロセス共通のECサイトのレジストリから取得する
+        """
+        if ec_site_cache is None:
+            ec_site_cache = {}
         
         # 1. 関連する既存レコードを一括取得
         product_ids = [p.pk for p, _ in products_info]
@@ -164,15 +223,14 @@ class SaveToDBService:
         # ECサイトコードを収集（Noneを除外）
         needed_ec_site_codes = set()
         for _, info in products_info:
-            ec_site_code = info.get('ec_site')
+            ec_site_code = info.ec_site
             if ec_site_code:  # Noneチェック
                 needed_ec_site_codes.add(ec_site_code)
         
         # キャッシュにないECサイトを取得してキャッシュに追加
         missing_ec_codes = [code for code in needed_ec_site_codes if code not in ec_site_cache]
         if missing_ec_codes:
-            for ec_site in ECSite.objects.filter(code__in=missing_ec_codes):
-                ec_site_cache[ec_site.code] = ec_site
+            ec_site_cache.update(ec_site_registry.get_many(missing_ec_codes))
         # ECサイトIDを取得（すべてキャッシュから）
         ec_site_ids = []
         for code in needed_ec_site_codes:
@@ -201,24 +259,24 @@ class SaveToDBService:
         now = timezone.now()
         
         for product, fetched_info in products_info:
-            ec_site_code = fetched_info.get('ec_site')
+            ec_site_code = fetched_info.ec_site
             if not ec_site_code or ec_site_code not in ec_site_cache:
                 continue
             
             ec_site = ec_site_cache[ec_site_code]
-            ec_product_id = fetched_info.get('ec_product_id')
+            ec_product_id = fetched_info.ec_product_id
             key = (product.pk, ec_site.pk, ec_product_id)
             
             # 共通のデータ設定
             data = {
-                'seller_name': fetched_info.get('seller_name'),
-                'product_url': fetched_info.get('product_url'),
-                'affiliate_url': fetched_info.get('affiliate_url'),
-                'current_price': fetched_info.get('price'),
-                'current_points': fetched_info.get('points', 0),
-                'shipping_fee': fetched_info.get('shipping_fee', 0),
-                'effective_price': fetched_info.get('effective_price', fetched_info.get('price')),
-                'condition': fetched_info.get('condition'),
+                'seller_name': fetched_info.seller_name,
+                'product_url': fetched_info.product_url,
+                'affiliate_url': fetched_info.affiliate_url,
+                'current_price': fetched_info.price,
+                'current_points': fetched_info.points,
+                'shipping_fee': fetched_info.shipping_fee,
+                'effective_price': fetched_info.effective_price,
+                'condition': fetched_info.condition,
                 'is_active': True
             }
             
@@ -277,9 +335,14 @@ class SaveToDBService:
                     captured_at=now
                 ))
         
-        # 4. 価格履歴を一括作成
+        # 4. 価格履歴を一括作成し、日次集計と価格統計に反映
         if price_histories:
             PriceHistory.objects.bulk_create(price_histories)
+            PriceAggregateService.apply_price_histories(price_histories)
+            PriceStatisticsService.record(price_histories)
+
+        # 5. 更新した商品のキャッシュを無効化
+        invalidate_products(product_ids)
         
         return results
 
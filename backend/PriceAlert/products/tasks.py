@@ -1,6 +1,9 @@
 from celery import shared_task
 import logging
+from django.conf import settings
 from .services.price_service import PriceService
+from .services.refresh_schedule_service import RefreshScheduleService
+from .services.registration_service import RegistrationService
 import time
 
 logger = logging.getLogger(__name__)
@@ -38,6 +41,67 @@ def fetch_and_store_prices(self):
         # Celeryのリトライ機能を使用
         raise self.retry(exc=e)
 
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_kwargs={'max_retries': 3, 'countdown': 60},
+    retry_backoff=True,
+    retry_backoff_max=300,
+    retry_jitter=True
+)
+def refresh_due_prices(self):
+    """
+    更新時刻を過ぎた商品の価格を取得して保存する定期タスク
+    商品ごとの更新間隔は RefreshScheduleService が価格の変動頻度・登録ユーザー数・閾値との差から決める
+    """
+    try:
+        # 取り出した商品は次回の更新時刻が先に進むので、実行が重なっても二重に取得しない
+        product_ids = RefreshScheduleService.claim_due_product_ids(
+            limit=settings.PRICE_REFRESH_BATCH_SIZE
+        )
+        if not product_ids:
+            logger.info("更新時刻を過ぎた商品はありません")
+            return {'products': 0}
+
+        logger.info(f"商品価格取得タスクを開始します - 対象商品: {len(product_ids)}件")
+        start_time = time.time()
+
+        result = PriceService().fetch_price(product_ids=product_ids)
+
+        elapsed_time = time.time() - start_time
+        logger.info(f"商品価格取得タスクが完了しました - "
+                    f"対象商品: {len(product_ids)}件 - "
+                    f"新規商品: {result.get('new_ec_sites')}件 - "
+                    f"価格更新: {result.get('new_price_histories')}件 - "
+                    f"所要時間: {elapsed_time:.2f}秒")
+
+        return {'products': len(product_ids), **result}
+
+    except Exception as e:
+        logger.error(f"商品価格取得タスクでエラーが発生しました: {str(e)}", exc_info=True)
+        raise self.retry(exc=e)
+
+@shared_task(
+    bind=True,
+    autoretry_for=(Exception,),
+    retry_kwargs={'max_retries': 3, 'countdown': 60},
+    retry_backoff=True,
+    retry_backoff_max=300,
+    retry_jitter=True
+)
+def run_registration_job(self, job_id):
+    """
+    商品登録ジョブ（一括登録・非同期登録）を実行するタスク
+    """
+    try:
+        logger.info(f"商品登録ジョブを開始します - ID: {job_id}")
+        job = RegistrationService().run(job_id)
+        return {'job_id': str(job.pk), 'status': job.status, 'succeeded': job.succeeded, 'failed': job.failed}
+
+    except Exception as e:
+        logger.error(f"商品登録ジョブでエラーが発生しました - ID: {job_id}, エラー: {str(e)}", exc_info=True)
+        raise self.retry(exc=e)
+
 def main():
     fetch_and_store_prices.delay() # type: ignore
 
@@ -1,15 +1,24 @@
 import logging
+from django.conf import settings
 from django.utils import timezone
 
 from rest_framework import status, permissions, serializers, viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.reverse import reverse
 from rest_framework.views import APIView
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 
-from .models import Product, UserProduct, ProductOnECSite, PriceHistory
-from .serializers import ProductSerializer, UserProductSerializer, ProductOnECSiteSerializer, ProductRegistrationSerializer, PriceHistorySerializer
+from .models import Product, UserProduct, ProductOnECSite, PriceHistory, RegistrationJob
+from .serializers import ProductSerializer, UserProductSerializer, ProductOnECSiteSerializer, ProductRegistrationSerializer, PriceHistorySerializer, PriceHistoryQuerySerializer, BulkRegistrationSerializer, RegistrationJobSerializer
 from .services.product_service import ProductService
+from .services.registration_service import RegistrationService
+from .services.price_history_service import PriceHistoryService, snap_range
+from .services.price_statistics_service import PriceStatisticsService
+from .payloads import build_product_payloads, build_user_product_payloads
+from .exports import CONTENT_TYPES, EXTENSIONS, FORMATS, FORMAT_PARQUET, astream_price_history
+from .cache import product_cache, invalidate_products, invalidate_user_lists, cached_user_list_response
 from .tasks import fetch_and_store_prices
 from notifications.tasks import check_price_alerts, send_price_alert_notifications
 
@@ -27,15 +36,14 @@ class ProductViewSet(viewsets.ViewSet):
         """商品一覧を返す GET: products/"""
         logger.info('商品一覧の取得を開始 - ユーザー: %s', request.user.username)
         try:
-            # 最適化: prefetch_relatedを追加
-            queryset = (
-                Product.objects.filter(userproduct__user=request.user)
-                .prefetch_related('productonecsite_set', 'productonecsite_set__ec_site')
-                .distinct()
-            )
-            serializer = ProductSerializer(queryset, many=True)
-            logger.debug('商品一覧を取得しました - 件数: %d', len(serializer.data))
-            return Response(serializer.data)
+            def load_products():
+                # 件数が多いので、シリアライザーを経由せずvalues_list()から直接組み立てる
+                return build_product_payloads(request.user)
+
+            # 価格更新・ユーザー商品の変更時に無効化されるので、それまではキャッシュ（または304）で応答する
+            response = cached_user_list_response(request, 'products', load_products)
+            logger.debug('商品一覧を取得しました - ステータス: %d', response.status_code)
+            return response
         except Exception as e:
             logger.error('商品一覧の取得中にエラーが発生しました - ユーザー: %s, エラー: %s', 
                         request.user.username, str(e), exc_info=True)
@@ -47,15 +55,19 @@ class ProductViewSet(viewsets.ViewSet):
         """特定の商品の詳細を返す GET: products/{pk}/"""
         logger.info('商品詳細の取得を開始 - 商品ID: %s, ユーザー: %s', pk, request.user.username)
         try:
-            # 最適化: prefetch_relatedを追加
-            product = get_object_or_404(
-                Product.objects.prefetch_related('productonecsite_set', 'productonecsite_set__ec_site'), 
-                pk=pk, 
-                userproduct__user=request.user
-            )
-            serializer = ProductSerializer(product)
-            logger.debug('商品詳細を取得しました - 商品: %s', product.name)
-            return Response(serializer.data)
+            if not UserProduct.objects.filter(user=request.user, product_id=pk).exists():
+                raise Product.DoesNotExist
+
+            # 商品詳細はユーザーに依存しないので、商品単位でキャッシュする
+            def load_product():
+                product = Product.objects.prefetch_related(
+                    'productonecsite_set', 'productonecsite_set__ec_site'
+                ).get(pk=pk)
+                return ProductSerializer(product).data
+
+            data = product_cache.get_or_set('detail', load_product, scope=pk)
+            logger.debug('商品詳細を取得しました - 商品: %s', data['name'])
+            return Response(data)
         except Product.DoesNotExist:
             logger.warning('商品が見つかりません - 商品ID: %s, ユーザー: %s', pk, request.user.username)
             return Response({"detail": "商品が見つかりません"}, status=status.HTTP_404_NOT_FOUND)
@@ -71,25 +83,79 @@ class ProductViewSet(viewsets.ViewSet):
         """ユーザー商品の価格履歴を取得"""
         pk = kwargs['pk']
         logger.info('ユーザー商品の価格履歴の取得を開始 - ID: %s, ユーザー: %s', pk, request.user.username)
+        # 期間・ECサイト・点数のいずれかを指定した場合は、ダウンサンプリングした列形式で返す
+        if any(param in request.query_params for param in ('start', 'end', 'sites', 'points')):
+            return self._price_history_series(request, pk)
         try:
-            # 関連オブジェクトを事前に取得して無駄なクエリを減らす
-            price_history = PriceHistory.objects.filter(
-                product_on_ec_site__product__id=pk
-            ).select_related(
-                'product_on_ec_site',
-                'product_on_ec_site__product',
-                'product_on_ec_site__ec_site'
-            )
-            serializer = PriceHistorySerializer(price_history, many=True)
-            if price_history:
-                logger.debug('ユーザー商品の価格履歴を取得しました - 商品: %s', price_history[0].product_on_ec_site.product.name)
-            return Response(serializer.data)
+            def load_price_history():
+                # 関連オブジェクトを事前に取得して無駄なクエリを減らす
+                price_history = PriceHistory.objects.filter(
+                    product_on_ec_site__product__id=pk
+                ).select_related(
+                    'product_on_ec_site',
+                    'product_on_ec_site__product',
+                    'product_on_ec_site__ec_site'
+                )
+                return PriceHistorySerializer(price_history, many=True).data
+
+            data = product_cache.get_or_set('price_history', load_price_history, scope=pk)
+            logger.debug('ユーザー商品の価格履歴を取得しました - 件数: %d', len(data))
+            return Response(data)
         except Exception as e:
             logger.error('ユーザー商品の価格履歴の取得中にエラーが発生しました - ID: %s, ユーザー: %s, エラー: %s', 
                         pk, request.user.username, str(e), exc_info=True)
             return Response({"detail": "予期せぬエラーが発生しました"}, 
                           status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    # GET: products/{pk}/price-statistics/
+    @action(detail=True, methods=['get'], url_path='price-statistics')
+    def price_statistics(self, request, *args, **kwargs):
+        """商品の価格統計（直近7/30/90日の最安値・最高値、これまでの最安値）を取得"""
+        pk = kwargs['pk']
+        logger.info('価格統計の取得を開始 - 商品ID: %s, ユーザー: %s', pk, request.user.username)
+        try:
+            if not UserProduct.objects.filter(user=request.user, product_id=pk).exists():
+                logger.warning('商品が見つかりません - 商品ID: %s, ユーザー: %s', pk, request.user.username)
+                return Response({"detail": "商品が見つかりません"}, status=status.HTTP_404_NOT_FOUND)
+            data = PriceStatisticsService.get_for_product(pk)
+            return Response(data)
+        except Exception as e:
+            logger.error('価格統計の取得中にエラーが発生しました - 商品ID: %s, ユーザー: %s, エラー: %s', 
+                        pk, request.user.username, str(e), exc_info=True)
+            return Response({"detail": "予期せぬエラーが発生しました"}, 
+                          status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def _price_history_series(self, request, pk):
+        """価格履歴をグラフ用の列形式で返す"""
+        query = PriceHistoryQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            logger.warning('価格履歴の取得条件のバリデーションエラー - ID: %s, ユーザー: %s, エラー: %s',
+                           pk, request.user.username, query.errors)
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+        try:
+            sites = sorted(params.get('sites') or [])
+            start, end = snap_range(params.get('start'), params.get('end'), params['points'])
+            cache_key = (
+                'price_history_series',
+                start.isoformat() if start else '',
+                end.isoformat() if end else '',
+                ','.join(sites),
+                params['points'],
+            )
+            data = product_cache.get_or_set(
+                cache_key,
+                lambda: PriceHistoryService.build_series(pk, start, end, sites, params['points']),
+                scope=pk,
+            )
+            logger.debug('ユーザー商品の価格履歴を取得しました - 系列数: %d', len(data['series']))
+            return Response(data)
+        except Exception as e:
+            logger.error('ユーザー商品の価格履歴の取得中にエラーが発生しました - ID: %s, ユーザー: %s, エラー: %s', 
+                        pk, request.user.username, str(e), exc_info=True)
+            return Response({"detail": "予期せぬエラーが発生しました"}, 
+                          status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
     # POST: products/
     def create(self, request):
         pass
@@ -110,14 +176,12 @@ class UserProductViewSet(viewsets.ViewSet):
         """ログインユーザーの商品のみ表示"""
         logger.info('ユーザー商品一覧の取得を開始 - ユーザー: %s', request.user.username)
         try:
-            queryset =(
-                UserProduct.objects.filter(user=request.user)
-                .select_related('product')
-                .prefetch_related('product__productonecsite_set', 'product__productonecsite_set__ec_site')
-            )
-            serializer = UserProductSerializer(queryset, many=True)
-            logger.debug('ユーザー商品一覧を取得しました - 件数: %d', len(serializer.data))
-            return Response(serializer.data)
+            def load_user_products():
+                return build_user_product_payloads(request.user)
+
+            response = cached_user_list_response(request, 'user_products', load_user_products)
+            logger.debug('ユーザー商品一覧を取得しました - ステータス: %d', response.status_code)
+            return response
         except Exception as e:
             logger.error('ユーザー商品一覧の取得中にエラーが発生しました - ユーザー: %s, エラー: %s', 
                         request.user.username, str(e), exc_info=True)
@@ -164,6 +228,9 @@ class UserProductViewSet(viewsets.ViewSet):
                          request.user.username, serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
+        if self._wants_async(request):
+            return self._create_async(request, serializer.validated_data)
+
         try:
             # サービス層に処理を委譲
             service = ProductService()
@@ -173,6 +240,7 @@ class UserProductViewSet(viewsets.ViewSet):
                 jan_code=jan_code,
                 price_threshold=price_threshold
             )
+            invalidate_user_lists(request.user.pk)
             
             # 重要: 結果のIDを取得して、prefetch_relatedを適用したquerysetを取得
             if products:
@@ -205,6 +273,94 @@ class UserProductViewSet(viewsets.ViewSet):
             return Response({"detail": "予期せぬエラーが発生しました"}, 
                           status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    @staticmethod
+    def _wants_async(request) -> bool:
+        """非同期で登録するかどうか（リクエストの指定が設定より優先）"""
+        value = request.query_params.get('async', request.data.get('async'))
+        if value is None:
+            return settings.ASYNC_PRODUCT_REGISTRATION
+        return str(value).lower() in ('true', '1', 'yes')
+
+    def _create_async(self, request, data):
+        """登録ジョブを作成して202を返す（検索・保存はCeleryで実行）"""
+        value = data.get('url') or data.get('jan_code')
+        items, _ = RegistrationService.parse_items([value])
+        try:
+            job = RegistrationService.create_job(request.user.id, items, data.get('price_threshold'), kind='single')
+            logger.info('商品登録ジョブを受け付けました - ジョブID: %s, ユーザー: %s', job.pk, request.user.username)
+            status_url = reverse('registration-job-detail', kwargs={'pk': job.pk}, request=request)
+            return Response({
+                "job_id": str(job.pk),
+                "status": job.status,
+                "status_url": status_url,
+            }, status=status.HTTP_202_ACCEPTED, headers={'Location': status_url})
+        except Exception as e:
+            logger.error('商品登録ジョブの作成中にエラーが発生しました - ユーザー: %s, エラー: %s', 
+                        request.user.username, str(e), exc_info=True)
+            return Response({"detail": "予期せぬエラーが発生しました"}, 
+                          status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    # POST: user-products/bulk/
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        """
+        JANコード・URLをまとめて登録する（JSONまたはCSV）
+        登録はCeleryで実行し、進捗はジョブID（registration-jobs/{id}/）で確認する
+        """
+        logger.info('商品一括登録を開始 - ユーザー: %s', request.user.username)
+        try:
+            values, price_threshold = self._parse_bulk_request(request)
+        except serializers.ValidationError as e:
+            logger.warning('一括登録のバリデーションエラー - ユーザー: %s, エラー: %s', 
+                         request.user.username, e.detail)
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+
+        items, rejected = RegistrationService.parse_items(values)
+        if not items:
+            return Response({"detail": "登録できるJANコード・URLがありません", "rejected": rejected},
+                            status=status.HTTP_400_BAD_REQUEST)
+        max_items = settings.BULK_REGISTRATION_MAX_ITEMS
+        if len(items) > max_items:
+            return Response({"detail": f"一度に登録できるのは{max_items}件までです"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            job = RegistrationService.create_job(request.user.id, items, price_threshold, kind='bulk')
+            logger.info('商品一括登録ジョブを受け付けました - ジョブID: %s, 件数: %d, ユーザー: %s', 
+                       job.pk, len(items), request.user.username)
+            return Response({
+                "job_id": str(job.pk),
+                "status": job.status,
+                "total": job.total,
+                "rejected": rejected,
+            }, status=status.HTTP_202_ACCEPTED)
+        except Exception as e:
+            logger.error('商品一括登録中にエラーが発生しました - ユーザー: %s, エラー: %s', 
+                        request.user.username, str(e), exc_info=True)
+            return Response({"detail": "予期せぬエラーが発生しました"}, 
+                          status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def _parse_bulk_request(self, request):
+        """一括登録のリクエストから入力値と価格しきい値を取り出す"""
+        if request.content_type.startswith('text/csv'):
+            text = request.body.decode('utf-8-sig')
+            price_threshold = serializers.IntegerField(allow_null=True).run_validation(
+                request.query_params.get('price_threshold') or None
+            )
+            return RegistrationService.parse_csv(text), price_threshold
+
+        if 'file' in request.FILES:
+            text = request.FILES['file'].read().decode('utf-8-sig')
+            price_threshold = serializers.IntegerField(allow_null=True).run_validation(
+                request.data.get('price_threshold') or None
+            )
+            return RegistrationService.parse_csv(text), price_threshold
+
+        serializer = BulkRegistrationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        return data['items'] + data['jan_codes'] + data['urls'], data.get('price_threshold')
+
     # PUT: user-products/{pk}/
     def update(self, request, *args, **kwargs):
         """ユーザーと商品の関連付けを更新"""
@@ -274,6 +430,7 @@ class UserProductViewSet(viewsets.ViewSet):
             logger.info('ユーザーと商品の関連付けを削除します - 商品: %s..., ユーザー: %s', 
                         product_name[:20], request.user.username)
             user_product.delete()
+            invalidate_user_lists(request.user.pk)
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         except UserProduct.DoesNotExist:
@@ -291,6 +448,7 @@ class UserProductViewSet(viewsets.ViewSet):
             serializer = UserProductSerializer(user_product, data=data, partial=partial)
             serializer.is_valid(raise_exception=True)
             serializer.save()
+            invalidate_user_lists(user_product.user_id)
             return serializer
         except serializers.ValidationError as e:
             logger.warning('ユーザー商品の更新でバリデーションエラー - 商品: %s, ユーザー: %s, エラー: %s', 
@@ -301,6 +459,20 @@ class UserProductViewSet(viewsets.ViewSet):
                         user_product.product.name, user_product.user.username, str(e), exc_info=True)
             raise
     
+# registration-jobs/
+class RegistrationJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    商品登録ジョブの進捗・結果を確認するAPI
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = RegistrationJobSerializer
+
+    def get_queryset(self):
+        """ログインユーザーのジョブのみ返す"""
+        if getattr(self, 'swagger_fake_view', False):
+            return RegistrationJob.objects.none()
+        return RegistrationJob.objects.filter(user=self.request.user)
+
 # Celery WorkerをRailwayから呼び出すためのAPI
 # /fetch-and-store-prices/
 class CeleryWorkerViewSet(APIView):
@@ -318,6 +490,43 @@ class CeleryWorkerViewSet(APIView):
         send_price_alert_notifications.delay() # type: ignore
         return Response({"detail": "Celery Workerを呼び出しました。"}, status=status.HTTP_200_OK)
     
+# GET: /price-history/export/
+class PriceHistoryExportView(APIView):
+    """
+    価格履歴を列指向形式（Parquet / Arrow IPC）でストリーミングするAPI（管理者のみ）
+    ASGIでバッファリングされないよう、非同期イテレータで返す
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        """
+        クエリパラメータ
+        - file_format: parquet（デフォルト）または arrow
+        - start / end: captured_at の範囲（ISO 8601）
+        """
+        file_format = request.query_params.get('file_format', FORMAT_PARQUET)
+        if file_format not in FORMATS:
+            return Response({"detail": f"file_formatは{' / '.join(FORMATS)}のいずれかを指定してください"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        query = PriceHistoryQuerySerializer(data={
+            key: request.query_params[key] for key in ('start', 'end') if key in request.query_params
+        })
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        logger.info('価格履歴のエクスポートを開始 - 形式: %s, ユーザー: %s', file_format, request.user.username)
+        response = StreamingHttpResponse(
+            astream_price_history(
+                file_format,
+                start=query.validated_data.get('start'),
+                end=query.validated_data.get('end'),
+            ),
+            content_type=CONTENT_TYPES[file_format],
+        )
+        filename = f'price_history_{timezone.now():%Y%m%d%H%M%S}.{EXTENSIONS[file_format]}'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
 # ここから下はAPI仕様書外の実装。使うにはフロント側でも対応が必要。
 class ProductOnECSiteViewSet(viewsets.ModelViewSet):
     """
@@ -358,10 +567,21 @@ class ProductOnECSiteViewSet(viewsets.ModelViewSet):
                 captured_at=timezone.now()
             )
             
+            invalidate_products([product_id])
             logger.info('ECサイト商品情報を作成しました - 商品ID: %s, ユーザー: %s', 
                        product_id, self.request.user.username) # type: ignore
         except UserProduct.DoesNotExist:
             logger.warning('未登録の商品に対するECサイト情報作成の試み - 商品ID: %s, ユーザー: %s', 
                          product_id, self.request.user.username) # type: ignore
             raise serializers.ValidationError("この商品は登録されていません。")
-    
\ No newline at end of file
+
+    def perform_update(self, serializer):
+        """更新後に商品のキャッシュを無効化する"""
+        product_on_ec_site = serializer.save()
+        invalidate_products([product_on_ec_site.product_id])
+
+    def perform_destroy(self, instance):
+        """削除後に商品のキャッシュを無効化する"""
+        product_id = instance.product_id
+        instance.delete()
+        invalidate_products([product_id])